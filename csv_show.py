@@ -3,13 +3,18 @@ import re
 import csv_show_version
 from csv_show_format import CsvPrintFormatter
 from csv_show_db import CSVShowDB
+from csv_show_columnar_db import CSVShowColumnarDB
+from csv_show_parallel import ParallelCsvReader, RowFilter
+from csv_show_mmap import MmapCsvReader
+from csv_show_plan import PlanStage, QueryPlan, describe_criteria, describe_regex_list
 from csv_show_shared import *
 import argparse
+import collections
 import csv
+import itertools
 import sys
 import os
-import subprocess
-import gzip
+# gzip, shutil, subprocess and csv_show_cache are imported where they are used, to keep startup fast
 
 
 if not csv_show_version.version_check():
@@ -19,14 +24,23 @@ if not csv_show_version.version_check():
 class CsvShow:
     def __init__(self):
         self.program_description = "A CSV Viewer with format control and query features."
+        self.pager_command = "less -S"
         self.db = CSVShowDB()
         self.formatter = CsvPrintFormatter()
+        self.formatter.collect_width_histograms = False
         self.has_header = True
         self.parser = None
         self.parsed_args = argparse.Namespace()
         self.dialect = csv.excel
         self.regex_flags = re.IGNORECASE
         self.removed_columns = set()
+        self.column_args_matched = False
+        self.lookup_queries = []  # (FIELD_LIST, lookup spec) for each line of -lookup_batch
+        self.plan = None  # QueryPlan of the run
+        self.stream_lookahead = 1000  # Input rows read before streamed -csv or -width_sample output is printed
+        self.lookahead_done = False  # Set once stream_lookahead input rows are read
+        self.columns_fixed = False  # Set once streaming can no longer switch to the in-memory path
+        self.stdin_lines = None  # RecordedLines of stdin while streaming
 
         self.tty_columns = CsvShow.get_tty_columns()
         self.tty_lines = CsvShow.get_tty_lines()
@@ -35,40 +49,317 @@ class CsvShow:
         self.make_arg_parser()
         self.user_add_args()
         self.parse_args(args)
-        self.read_db(self.parsed_args.csv_file)
-        self.match_column_args_to_column_names()
-
-        # Do sort before lookup since sorting can affect first-lookup found
-        if self.parsed_args.sort is not None:
-            self.db.sort(self.parsed_args.sort, self.parsed_args.reverse)
-
-        self.db.regex_flags = self.regex_flags
-        if len(self.parsed_args.lookup) > 0:
-            values = self.get_lookup()
-            print(", ".join(values))
+        streaming = self.can_stream()
+        self.plan = self.make_plan(streaming).optimize()
+        if streaming:
+            db = self.db
+            try:
+                self.show_streaming()
+            except HeaderTooNarrow:
+                # Nothing has been printed.  The in-memory path names the columns the header does not.
+                self.db = db
+                self.make_arg_parser()  # A new parser: the defaults of -select and -lookup are lists that keep values
+                self.user_add_args()
+                self.parse_args(args)  # The column arguments were matched to the header's names
+                self.plan = self.make_plan(False).optimize()
+                self.plan.notes.append("streaming stopped: the header does not name every column")
+                self.show_in_memory()
+        else:
+            self.show_in_memory()
+        if self.parsed_args.explain:
+            print("\n".join(self.plan.format_lines()), file=sys.stderr)
+
+    # The logical plan: the stages in the order the options are documented to apply.  -lookup is a select and
+    # a limit of one row after the sort, so it finds the first match in sorted order.
+    def make_plan(self, streaming):
+        args = self.parsed_args
+        stages = [PlanStage("scan", args.csv_file)]
+        pregrep = (getattr(args, "pregrep!", None) or []) + (args.pregrep or [])
+        if pregrep:
+            stages.append(PlanStage("pregrep", describe_regex_list(pregrep)))
+        if args.sort is not None:
+            stages.append(PlanStage("sort", ",".join(args.sort) + (" reverse" if args.reverse else "")))
+        if args.lookup_batch is not None:
+            stages.append(PlanStage("lookup_batch", args.lookup_batch))
+        elif len(args.lookup) > 0:
+            stages.append(PlanStage("select", describe_criteria(args.lookup_spec), criteria=args.lookup_spec))
+            stages.append(PlanStage("limit", "first match", k=1, from_end=False))
+            stages.append(PlanStage("lookup", ",".join(args.lookup)))
         else:
+            if self.overrides_user_hook("user_modify_db"):
+                stages.append(PlanStage("user_modify_db"))
+            if len(args.select) > 0:
+                stages.append(PlanStage("select", describe_criteria(args.select), criteria=args.select))
+            if args.columns is not None or args.nocolumns is not None:
+                stages.append(PlanStage("project", " ".join(
+                    ([",".join(args.columns)] if args.columns else []) +
+                    ([f"(not) {','.join(args.nocolumns)}"] if args.nocolumns else []))))
+            if args.grep:
+                stages.append(PlanStage("grep", describe_regex_list(args.grep)))
+            if args.head is not None:
+                stages.append(PlanStage("limit", f"head {args.head}", k=args.head, from_end=False))
+            if args.tail is not None:
+                stages.append(PlanStage("limit", f"tail {args.tail}", k=args.tail, from_end=True))
+            if self.overrides_user_hook("user_modify_db_post_select"):
+                stages.append(PlanStage("user_modify_db_post_select"))
+            stages.append(PlanStage("format", "csv" if args.csv else "table"))
+        return QueryPlan(stages, "streaming" if streaming else "in memory", args.explain)
+
+    # Runs the stages of self.plan on self.db
+    def show_in_memory(self):
+        if self.parsed_args.sort_memory is not None and self.parsed_args.sort is not None:
+            print(f"Warning: -sort_memory is not used {self.get_in_memory_reason()}: every row is kept in memory",
+                  file=sys.stderr)
+        if self.parsed_args.lookup_batch is not None:
+            self.lookup_queries = self.read_lookup_batch(self.parsed_args.lookup_batch)
+        for stage in self.plan.stages:
+            with self.plan.timing(stage):
+                self.run_stage(stage)
+            self.db.regex_flags = self.regex_flags
+            stage.rows = len(self.db)
+
+    def run_stage(self, stage):
+        if stage.name == "scan":
+            select = stage.get_folded("select")
+            self.read_db(self.parsed_args.csv_file, select.settings["criteria"] if select else (),
+                         first_match_only=stage.get_folded("limit") is not None)
+            self.match_column_args_to_column_names()
+        elif stage.name == "sort":
+            limit = stage.get_folded("limit")
+            if limit is None:
+                self.db.sort(self.parsed_args.sort, self.parsed_args.reverse)
+            else:
+                self.db = self.db.top_k(self.parsed_args.sort, limit.settings["k"], self.parsed_args.reverse,
+                                        from_end=limit.settings["from_end"])
+        elif stage.name == "user_modify_db":
             self.user_modify_db()
-            if len(self.parsed_args.select) > 0:
-                self.db = self.db.select(self.parsed_args.select)
+            self.db.invalidate_indexes()  # The hook may have changed cells through db.rows
+        elif stage.name == "select":
+            self.db = self.db.select(stage.settings["criteria"])
+        elif stage.name == "project":
             self.apply_column_changes()
-            if self.parsed_args.grep:
+        elif stage.name == "grep":
+            if stage.settings.get("on_shown_columns"):
+                shown_db = self.db.select_columns(self.get_selected_columns())
+                self.db = self.db.view(shown_db.grep_row_numbers(self.parsed_args.grep, self.regex_flags))
+            else:
                 self.db = self.db.grep(self.parsed_args.grep, self.regex_flags)
+        elif stage.name == "limit":
+            if stage.settings["from_end"]:
+                self.db = self.db.tail(stage.settings["k"])
+            else:
+                self.db = self.db.head(stage.settings["k"])
+        elif stage.name == "lookup":
+            print(", ".join(self.get_lookup()))
+        elif stage.name == "lookup_batch":
+            self.print_all_lines(self.get_batch_lookups())
+        elif stage.name == "user_modify_db_post_select":
             self.user_modify_db_post_select()
+        elif stage.name == "format":
+            self.format_and_print_db()
+
+    # Streaming passes rows one at a time from the reader to the output, so only the rows that survive
+    # the filters are kept.  It needs the rows in file order (or -sort with -head/-tail or -sort_memory)
+    # and no user changes to the whole database.  Without a header the column names come from the widest row,
+    # which is only known once all of them are read.
+    def can_stream(self):
+        return ((self.parsed_args.sort is None or self.get_row_limit() is not None
+                 or self.parsed_args.sort_memory is not None)
+                and self.has_header
+                and len(self.parsed_args.lookup) == 0
+                and self.parsed_args.lookup_batch is None
+                and not self.parsed_args.cache
+                and not self.overrides_user_hook("user_modify_db"))
+
+    # Why the rows cannot be streamed, in the terms of can_stream
+    def get_in_memory_reason(self):
+        if not self.has_header:
+            return "with -noheader"
+        if len(self.parsed_args.lookup) > 0:
+            return "with -lookup"
+        if self.parsed_args.lookup_batch is not None:
+            return "with -lookup_batch"
+        if self.parsed_args.cache:
+            return "with -cache"
+        if self.overrides_user_hook("user_modify_db"):
+            return "with user_modify_db"
+        return "when a row is longer than the header"
+
+    def get_row_limit(self):
+        if self.parsed_args.head is not None:
+            return self.parsed_args.head
+        return self.parsed_args.tail
+
+    # Runs the stages of self.plan as a chain of row iterators.  Rows are only stored in self.db when the
+    # output needs all of them.
+    def show_streaming(self):
+        self.lookahead_done = False
+        self.columns_fixed = False
+        self.stdin_lines = None
+        close_functions = []
+        try:
+            self.db.regex_flags = self.regex_flags
+            rows = None
+            for stage in self.plan.stages:
+                if stage.name == "format":
+                    rows = self.plan.count_rows(stage, rows)
+                with self.plan.timing(stage):
+                    if stage.name == "scan":
+                        rows = self.stream_scan(stage, close_functions)
+                    elif stage.name == "format":
+                        self.stream_format(rows)
+                    else:
+                        rows = self.stream_stage(stage, rows)
+                if stage.name != "format":
+                    rows = self.plan.count_rows(stage, rows)
+                if rows is None and stage.rows is None:
+                    stage.rows = len(self.db)
+        finally:
+            for close in close_functions:
+                close()  # Stops the worker processes if not every row was read (e.g. -head)
+
+    def stream_scan(self, stage, close_functions):
+        file = self.parsed_args.csv_file
+        select = stage.get_folded("select")
+        criteria = select.settings["criteria"] if select else ()
+        if self.can_read_in_parallel(file):
+            # -select is checked in the worker processes.  A chunk holds more rows than the lookahead.
+            widest = WidestRow()  # Counts the rows that the workers drop too
+            rows = self.read_rows_in_parallel(file, criteria, chunk_read=lambda: self.end_lookahead(widest),
+                                              widest=widest)
+            close_functions.append(rows.close)
+            rows = self.check_row_widths(rows, widest)  # Unless the workers dropped columns, which drops the extra ones
+        else:
+            file_handle = self.open_input(file, criteria)
+            if file == "-":
+                file_handle = self.stdin_lines = RecordedLines(file_handle)
+            close_functions.append(file_handle.close)
+            rows = map(self.db.pad_row, self.read_rows(file_handle))
+            skipped = file_handle.skipped if isinstance(file_handle, MmapCsvReader) else None
+            rows = self.project_rows(self.check_row_widths(rows, skipped))
+            if len(criteria) > 0 and self.can_push_down(criteria):
+                rows = self.db.filter_rows(rows, criteria)
+        plan_criteria = [relation for plan_stage in self.plan.stages + stage.folded if plan_stage.name == "select"
+                         for relation in plan_stage.settings["criteria"]]
+        if not self.can_push_down(plan_criteria):
+            raise HeaderTooNarrow()  # The in-memory path checks them once every row is read
+        if stage.get_folded("limit") is not None:
+            rows = itertools.islice(rows, 1)
+        self.match_column_args_to_column_names()
+        return rows
+
+    # The header names the columns when streaming.  A longer row found before any output is printed switches
+    # to the in-memory path, which names the extra columns like the rest of the tool does.  Rows are counted
+    # here, before any filter, so a -grep that drops most of them does not hold back the output.
+    # "dropped" (a WidestRow) counts the rows that the reader dropped before they got here.
+    def check_row_widths(self, rows, dropped=None):
+        num_columns = len(self.db.column_names)
+        for row_num, row in enumerate(rows, 1):
+            if (len(row) > num_columns or dropped is not None and dropped.width > num_columns) \
+                    and not self.columns_fixed:
+                raise HeaderTooNarrow()
+            if row_num == self.stream_lookahead:
+                self.end_lookahead()
+            yield row
+        if dropped is not None and dropped.width > num_columns and not self.columns_fixed:
+            raise HeaderTooNarrow()
+
+    # STDIN is only recorded for the lookahead.  Past it STDIN cannot be read again, so from then on a longer
+    # row keeps its extra cells, as it does once the output has started.
+    # "widest" (a WidestRow) counts rows that were dropped before check_row_widths saw them.
+    def end_lookahead(self, widest=None):
+        if widest is not None and widest.width > len(self.db.column_names) and not self.columns_fixed:
+            raise HeaderTooNarrow()
+        self.lookahead_done = True
+        if self.stdin_lines is not None:
+            self.stdin_lines.stop_recording()
+            self.columns_fixed = True
+
+    # Reads rows until the lookahead is done, so a row longer than the header among them can still change the
+    # columns, then fixes the columns
+    def start_output(self, rows):
+        rows = iter(rows)
+        first_rows = []
+        if not self.lookahead_done:
+            for row in rows:
+                first_rows.append(row)
+                if self.lookahead_done:
+                    break
+        self.columns_fixed = True
+        if self.stdin_lines is not None:
+            self.stdin_lines.stop_recording()
+        return itertools.chain(first_rows, rows)
+
+    # Sorting needs every column, so the column changes come after it and a -grep moved ahead of the sort
+    # checks the row as it will be shown
+    def stream_stage(self, stage, rows):
+        if stage.name == "select":
+            return self.db.filter_rows(rows, stage.settings["criteria"])
+        elif stage.name == "sort":
+            limit = stage.get_folded("limit")
+            if limit is not None:
+                return self.db.top_k(self.parsed_args.sort, limit.settings["k"], self.parsed_args.reverse,
+                                     rows=rows, from_end=limit.settings["from_end"]).rows
+            return self.db.iter_sorted(self.parsed_args.sort, self.parsed_args.reverse, rows=rows,
+                                       memory_budget=int(self.parsed_args.sort_memory * 1024 * 1024))
+        elif stage.name == "project":
+            return map(self.get_column_changes(), rows)
+        elif stage.name == "grep":
+            if stage.settings.get("on_shown_columns"):
+                column_changes = self.get_column_changes(switch_db=False)
+                line_matches = make_line_matcher(self.parsed_args.grep, self.regex_flags)
+                return (row for row in rows if line_matches(" ".join(column_changes(row))))
+            return iter_grep_rows(rows, self.parsed_args.grep, self.regex_flags)
+        elif stage.name == "limit":
+            if stage.settings["from_end"]:
+                return iter(collections.deque(rows, maxlen=stage.settings["k"]))
+            return itertools.islice(rows, stage.settings["k"])  # Stops reading once enough rows are found
+        elif stage.name == "user_modify_db_post_select":
+            for row in rows:
+                self.db.add_row(row)
+            self.user_modify_db_post_select()
+            return None  # The rows are in self.db now
+        raise CSVShowError(f"The {stage.name} stage cannot stream")
+
+    def stream_format(self, rows):
+        if rows is None:
+            self.format_and_print_db()
+        elif self.parsed_args.csv:
+            rows = self.start_output(rows)
+            self.set_formatter_options()
+            self.print_formatted_db(self.formatter.iter_output_as_csv(rows))
+        elif self.parsed_args.width_sample is not None:
+            # Column widths come from the first rows, so lines are printed while the file is still read
+            rows = self.start_output(rows)
+            self.set_formatter_options()
+            self.print_formatted_db(self.formatter.iter_output_as_lines(rows))
+        else:  # Table output needs every row to measure the column widths
+            for row in rows:
+                self.db.add_row(row)
+            self.format_and_print_db()
+
+    def overrides_user_hook(self, hook_name):
+        return getattr(type(self), hook_name) is not getattr(CsvShow, hook_name)
+
+    def format_and_print_db(self):
+        self.set_formatter_options()
+        if self.parsed_args.csv:
+            output = self.formatter.format_output_as_csv()
+        else:
+            output = self.formatter.format_output_as_lines()
 
-            self.formatter.set_db(self.db)
-            if self.parsed_args.max_width[None] is not None:
-                for column_name in self.db.column_names:
-                    self.formatter.max_width_by_name[column_name] = self.parsed_args.max_width[None]
-            for max_width_column in self.parsed_args.max_width:
-                if max_width_column in self.db.column_names:
-                    self.formatter.max_width_by_name[max_width_column] = self.parsed_args.max_width[max_width_column]
-
-            if self.parsed_args.csv:
-                output = self.formatter.format_output_as_csv()
-            else:
-                output = self.formatter.format_output_as_lines()
+        self.print_formatted_db(output)
 
-            self.print_formatted_db(output)
+    def set_formatter_options(self):
+        self.formatter.set_db(self.db)
+        self.formatter.width_sample_size = self.parsed_args.width_sample
+        self.formatter.width_percentile = self.parsed_args.width_percentile
+        if self.parsed_args.max_width[None] is not None:
+            for column_name in self.db.column_names:
+                self.formatter.max_width_by_name[column_name] = self.parsed_args.max_width[None]
+        for max_width_column in self.parsed_args.max_width:
+            if max_width_column in self.db.column_names:
+                self.formatter.max_width_by_name[max_width_column] = self.parsed_args.max_width[max_width_column]
 
     @staticmethod
     def get_tty_columns():
@@ -101,29 +392,72 @@ class CsvShow:
                                  help="Sort on these fields. " + explain_FIELD_LIST)
         self.parser.add_argument("-reverse", default=False, action="store_true",
                                  help="Reverse the direction of -sort")
+        self.parser.add_argument("-sort_memory", type=float, metavar="MB",
+                                 help="Sort using about MB megabytes of memory, spilling sorted runs to temporary "
+                                      "files.  For files larger than memory.  Best with -csv.  Not used with "
+                                      "-noheader, -lookup, -lookup_batch or -cache, which keep every row in memory")
+        limit_group = self.parser.add_mutually_exclusive_group()
+        limit_group.add_argument("-head", type=non_negative_int, metavar="N",
+                                 help="Show only the first N rows. With -sort, only N rows are kept in memory")
+        limit_group.add_argument("-tail", type=non_negative_int, metavar="N",
+                                 help="Show only the last N rows. With -sort, only N rows are kept in memory")
         self.parser.add_argument("-select", action=ParseMatchSpec, metavar="KEY<op>VALUE",
                                  help="Select matching rows. Supported <op>: " +
                                       ParseMatchSpec.supported_relational_ops +
                                       " Note: = and == both mean equality.  "
                                       "=~ and !~ mean VALUE is a regular expression"
                                  )
-        self.parser.add_argument("-lookup", action=ParseLookupSpec, metavar=("FIELD_LIST", "KEY<op>VALUE"),
-                                 help="Lookup fields of first matching record. " + explain_FIELD_LIST +
-                                      ". See -select for <op> explanation")
+        lookup_group = self.parser.add_mutually_exclusive_group()
+        lookup_group.add_argument("-lookup", action=ParseLookupSpec, metavar=("FIELD_LIST", "KEY<op>VALUE"),
+                                  help="Lookup fields of first matching record. " + explain_FIELD_LIST +
+                                       ". See -select for <op> explanation")
+        lookup_group.add_argument("-lookup_batch", metavar="FILE",
+                                  help="Do many lookups with one read of the CSV file.  Each line of FILE (\"-\" for "
+                                       "STDIN) holds the values of one -lookup, like: Model,Year Make=Ford.  "
+                                       "Prints one line per lookup, in order (empty if nothing matched)")
         self.parser.add_argument("-pregrep", "-pregrepv", "-pregrep!", "-pregrepv!", metavar="REGEX", action=AppendGrepArgs,
                                  help="Grep rows using space-separated data before any database modifications. "
                                       "To invert the match use -pregrepv.  Use -pregrep! to include header in matching.")
         self.parser.add_argument("-grep", "-grepv", metavar="REGEX", action=AppendGrepArgs,
                                  help="Grep rows after database modifications such as column reordering. "
-                                 "To invert the match use -grepv")
+                                 "To invert the match use -grepv.  To grep one column use -select COLUMN=~REGEX")
         self.parser.add_argument("-match_case", default=False, action="store_true",
                                  help="Regular expressions match on case (Default is IGNORECASE)")
         self.parser.add_argument("-max_width", action=ParseMaxWidthSpec, metavar=("[MAX_WIDTH]", "COLUMN_NAME=WIDTH"),
                                  help="Set the maximum column width globally, or on a per column basis. ")
+        self.parser.add_argument("-width_sample", type=positive_int, metavar="N",
+                                 help="Size the columns from the header and the first N rows so output starts "
+                                      "right away.  Longer cells are truncated with *")
+        self.parser.add_argument("-width_percentile", type=percentage, metavar="P",
+                                 help="Size each column to fit P percent of its cells (e.g. 99) instead of the "
+                                      "longest one.  Longer cells are truncated with *")
         self.parser.add_argument("-columns", action=ParseCommaSeparatedArgs,
                                  help="Show only these columns in this order. " + explain_FIELD_LIST, metavar="FIELD_LIST")
         self.parser.add_argument("-nocolumns", action=ParseCommaSeparatedArgs,
                                  help="Omit these columns. " + explain_FIELD_LIST, metavar="FIELD_LIST")
+        self.parser.add_argument("-jobs", type=positive_int, default=1, metavar="N",
+                                 help="Read the file with N processes. -pregrep and -select are done in the "
+                                      "readers.  Not used for STDIN or .gz files")
+        self.parser.add_argument("-columnar", default=False, action="store_true",
+                                 help="Store the data column by column. Uses much less memory for large files "
+                                      "with repetitive columns")
+        self.parser.add_argument("-cache", default=False, action="store_true",
+                                 help="Keep the parsed file in a cache so later runs on the same file only load the "
+                                      "columns they use.  The cache is in $CSV_SHOW_CACHE_DIR (Default: "
+                                      "~/.cache/csv_show)")
+        self.parser.add_argument("-cache_size", type=float, metavar="MB",
+                                 help="Remove the least recently used cache files past this total size "
+                                      "(Default: 1024)")
+        self.parser.add_argument("-clear_cache", default=False, action=ParseClearCacheArg,
+                                 help="Remove all cache files and exit")
+        self.parser.add_argument("-serve", action=ParseServeArg, metavar="KEY=VALUE",
+                                 help="Run a server that keeps the CSV files it reads in memory, then use "
+                                      "csv_show_client.py with the usual arguments instead of csv_show.py.  "
+                                      "Settings: socket=PATH (Default: $CSV_SHOW_SOCKET or "
+                                      "$XDG_RUNTIME_DIR/csv_show-UID.sock) memory=MB (Default: 1024)")
+        self.parser.add_argument("-explain", default=False, action="store_true",
+                                 help="After the output, print the query plan to STDERR: the order the steps ran "
+                                      "in, with the rows out of each step and the time spent in it")
         self.parser.add_argument("-csv", default=False, action="store_true", help="Format output as CSV")
         self.parser.add_argument("-less", "-noless", default=None, action=StoreTrueUnlessNegated,
                                  help="Pipe to less or disable pipe to less if negated. "
@@ -135,57 +469,262 @@ class CsvShow:
 
     def parse_args(self, args):
         self.parsed_args = self.parser.parse_args(args)
+        self.column_args_matched = False
+        self.lookup_queries = []
         self.apply_sep_to_dialect()
         self.apply_regex_flags()
+        if self.parsed_args.columnar and not isinstance(self.db, CSVShowColumnarDB):
+            self.db = CSVShowColumnarDB()
 
     def apply_sep_to_dialect(self):
         if self.parsed_args.sep in ["\\t", "\t"]:
             self.dialect = csv.excel_tab
         elif self.parsed_args.sep == " ":
-            self.dialect.delimiter = self.parsed_args.sep
-            self.dialect.skipinitialspace = True
+            self.dialect = self.make_dialect(self.parsed_args.sep, skipinitialspace=True)
         elif self.parsed_args.sep == "guess":
             with open(self.parsed_args.csv_file, newline='') as csvfile:
                 self.dialect = csv.Sniffer().sniff(csvfile.read(1024))
                 csvfile.close()
         else:
-            self.dialect.delimiter = self.parsed_args.sep
+            self.dialect = self.make_dialect(self.parsed_args.sep)
 
         if self.parsed_args.noheader:
             self.has_header = False
 
+    # A new class each time: setting the delimiter on csv.excel would change it for every later reader
+    @staticmethod
+    def make_dialect(delimiter, skipinitialspace=False):
+        return type("CsvShowDialect", (csv.excel,), {"delimiter": delimiter, "skipinitialspace": skipinitialspace})
+
     def apply_regex_flags(self):
         if self.parsed_args.match_case:
             self.regex_flags = 0
 
-    def read_db(self, file):
+    # Only rows matching "criteria" are stored.  With first_match_only, reading stops at the first of them.
+    # Criteria on columns the header does not name (e.g. with -noheader) are checked once every row is read.
+    def read_db(self, file, criteria=(), first_match_only=False):
+        self.db.regex_flags = self.regex_flags
+        if self.can_use_cache(file):
+            self.read_db_with_cache(file)
+            self.db.regex_flags = self.regex_flags
+            if len(criteria) > 0:
+                self.db = self.db.select(criteria)
+            if first_match_only:
+                self.db = self.db.head(1)
+            return
         self.db.clear()
-        if file == "-":
-            file_handle = sys.stdin
-        elif re.match(".*\.gz$",file):
-            file_handle = gzip.open(file, mode="rt")
-        else:
-            file_handle = open(file)
-
-        reader = csv.reader(file_handle, dialect=self.dialect)
+        file_db = self.db
+        widest = WidestRow()
+        file_handle = None
+        source_rows = None
+        try:
+            if self.can_read_in_parallel(file):
+                rows = source_rows = self.read_rows_in_parallel(file, criteria, widest=widest)
+            else:
+                # Without a header every row counts toward the column names, so none are left out by the criteria
+                file_handle = self.open_input(file, criteria if self.has_header else ())
+                rows = map(widest, map(self.db.pad_row, self.read_rows(file_handle)))
+                if file == self.parsed_args.csv_file:
+                    rows = self.project_rows(rows)
+                if len(criteria) > 0 and self.can_push_down(criteria):
+                    rows = self.db.filter_rows(rows, criteria)
+            pushed_down = self.can_push_down(criteria)
+            if first_match_only and pushed_down:
+                rows = itertools.islice(rows, 1)
+            for row in rows:
+                self.db.add_row(row)
+        finally:
+            if source_rows is not None:
+                source_rows.close()
+            if file_handle is not None:
+                file_handle.close()
+        if isinstance(file_handle, MmapCsvReader):
+            widest.add_width(file_handle.skipped.width)
+        # The rows the filters dropped as they were read count toward the columns, and the rows that are kept are
+        # padded to them, as when every row was read first.  Columns that were projected away are not shown.
+        if self.db is file_db:
+            self.db.add_unnamed_column_names(widest.width)
+            if pushed_down and len(criteria) > 0:
+                self.db = self.db.select(())
+        if not pushed_down:
+            self.db = self.db.select(criteria)
+            if first_match_only:
+                self.db = self.db.head(1)
+
+    # Criteria can be checked as the rows are read when the header names their columns
+    def can_push_down(self, criteria):
+        return all(name in self.db.column_names for name, op, value in criteria)
+
+    # -pregrep! can turn any row into the header, so the cached table would not help
+    def can_use_cache(self, file):
+        return getattr(self.parsed_args, "cache", False) and file == self.parsed_args.csv_file \
+            and not hasattr(self.parsed_args, "pregrep!") and type(self.db) in [CSVShowDB, CSVShowColumnarDB]
+
+    # Loads the columns this run uses from the cache, or parses the whole file and saves it in the cache.
+    # The data is kept in a CSVShowColumnarDB either way.  -pregrep is done on the loaded rows.
+    def read_db_with_cache(self, file):
+        from csv_show_cache import CsvCache
+        cache_size = self.parsed_args.cache_size
+        cache = CsvCache(max_size=None if cache_size is None else int(cache_size * 1024 * 1024))
+        key = cache.make_key(file, self.dialect, self.has_header)
+        column_names = cache.read_column_names(key)
+        db = None
+        if column_names is not None:
+            self.db = CSVShowColumnarDB(column_names=column_names)
+            db = cache.load(key, self.get_needed_columns())
+        if db is None:
+            self.db = CSVShowColumnarDB()
+            file_handle = self.open_input_file(file)
+            for row in self.read_rows(file_handle, apply_pregrep=False):
+                self.db.add_row(row)
+            file_handle.close()
+            cache.save(key, self.db)
+            db = self.db
+        if self.parsed_args.pregrep:
+            db = db.grep(self.parsed_args.pregrep, self.regex_flags)
+        self.db = db
+
+    # Query planning: the columns this run uses, in file order, or None if it needs all of them.
+    # self.db holds the column names of the file.  -pregrep sees whole rows, so with the cache it needs them all.
+    def get_needed_columns(self, for_pregrep=True):
+        if self.overrides_user_hook("user_modify_db") or self.overrides_user_hook("user_modify_db_post_select") \
+                or (for_pregrep and self.parsed_args.pregrep) or self.parsed_args.sort == [] \
+                or not self.has_header \
+                or not self.can_push_down(self.parsed_args.select + getattr(self.parsed_args, "lookup_spec", [])):
+            return None  # All of them
+        self.match_column_args_to_column_names()
+        needed = set(self.get_selected_columns() or self.db.column_names)
+        needed.update(self.parsed_args.sort or [])
+        needed.update(self.parsed_args.lookup)
+        for fields, lookup_spec in self.lookup_queries:
+            needed.update(fields)
+            needed.update(name for name, op, value in lookup_spec)
+        needed.update(name for name, op, value in self.parsed_args.select)
+        needed.update(name for name, op, value in getattr(self.parsed_args, "lookup_spec", []))
+        return [name for name in self.db.column_names if name in needed]
+
+    # Projection pushdown: keep only the columns this run uses as the rows are read.  Takes padded data rows
+    # and switches self.db to the kept columns.
+    def project_rows(self, rows):
+        needed_columns = self.get_needed_columns(for_pregrep=False)
+        if needed_columns is None or needed_columns == self.db.column_names:
+            return rows
+        projection = CSVShowDB.get_column_projection(
+            [self.db.column_number_by_name[name] for name in needed_columns])
+        self.db = self.db.select_columns(needed_columns)  # No rows have been stored yet
+        self.db.regex_flags = self.regex_flags
+        return map(projection, rows)
+
+    # Like open_input_file, but regular files that have plain text -pregrep/-grep terms (or -select values that
+    # are plain text) are read through mmap so that most rows that cannot match are never decoded or parsed
+    def open_input(self, file, criteria=()):
+        if file == "-" and self.stdin_lines is not None:  # Streaming stopped; read stdin again from the start
+            stdin_lines, self.stdin_lines = self.stdin_lines, None
+            return stdin_lines.replay()
+        if not MmapCsvReader.can_read(file, self.dialect):
+            return self.open_input_file(file)
+        required_terms, excluded_terms = self.get_prefilter_terms(file, criteria)
+        reader = MmapCsvReader(file, self.dialect)
+        reader.exempt_records = 1 if self.has_header else 0
+        # Without -pregrep every row counts toward the columns, so the widths of the records that are skipped
+        # are kept.  With it the terms below are only the -pregrep ones, whose rows never count.
+        reader.count_skipped = not (self.parsed_args.pregrep or getattr(self.parsed_args, "pregrep!", None))
+        if not reader.set_filters(required_terms, excluded_terms, self.regex_flags):
+            reader.close()
+            return self.open_input_file(file)
+        return reader
+
+    # Grep terms that every row read from "file" must pass.  Only positive -grep terms count, since the
+    # columns they are checked against are a subset of the row, and only when nothing changes the rows first.
+    # A cell that matches a "criteria" regex, or equals a value that is not a number, is part of the row too.
+    # The rows those drop still count toward the columns, which the reader can only work out for the records it
+    # skips when all of them count, so with -pregrep or -pregrep! only their own terms are used.
+    def get_prefilter_terms(self, file, criteria=()):
+        pregrep_all = getattr(self.parsed_args, "pregrep!", None)
+        terms = (pregrep_all or []) + (self.parsed_args.pregrep or [])
+        required_terms = [regex for regex, positive_match in terms if positive_match]
+        excluded_terms = [regex for regex, positive_match in terms if not positive_match]
+        if len(terms) > 0:
+            return required_terms, excluded_terms
+        if self.parsed_args.grep and file == self.parsed_args.csv_file and len(self.parsed_args.lookup) == 0 \
+                and self.parsed_args.lookup_batch is None \
+                and not self.overrides_user_hook("user_modify_db"):
+            required_terms += [regex for regex, positive_match in self.parsed_args.grep if positive_match]
+        for name, op, value in criteria:
+            if op == "=~":
+                required_terms.append(value)
+            elif op in ["=", "=="] and value != "" and parse_number(value) is None:
+                required_terms.append(re.escape(value))
+        return required_terms, excluded_terms
 
-        if hasattr(self.parsed_args, "pregrep!"):
-            parsed_rows = grep_rows(reader, getattr(self.parsed_args, "pregrep!"), self.regex_flags)
+    @staticmethod
+    def open_input_file(file):
+        if file == "-":
+            return sys.stdin
+        elif re.match(r".*\.gz$", file):
+            import gzip
+            return gzip.open(file, mode="rt")
         else:
-            parsed_rows = [row for row in reader]
+            return open(file)
+
+    # Returns an iterator over the data rows.  The header (if any) is read right away so column names are known.
+    # -pregrep is checked on the lines of the file, so the rows that do not match are never split into fields.
+    def read_rows(self, file_handle, apply_pregrep=True):
+        lines = iter(file_handle)  # Shared by the readers below: iter() on an MmapCsvReader starts over
+        pregrep_all = getattr(self.parsed_args, "pregrep!", None) if apply_pregrep else None
+        pregrep = self.parsed_args.pregrep if apply_pregrep else None
         if self.has_header:
-            if len(parsed_rows) > 0:
-                self.db.set_column_names(parsed_rows[0])
-                parsed_rows.pop(0)
+            header_rows = csv.reader(lines, dialect=self.dialect)  # Reads no further than the row it returns
+            if pregrep_all:
+                header_rows = iter_grep_rows(header_rows, pregrep_all, self.regex_flags)
+            header = next(header_rows, None)
+            if header is not None:
+                self.db.set_column_names(header)
             else:
                 self.has_header = False
-
-        if self.parsed_args.pregrep:
-            parsed_rows = grep_rows(parsed_rows, self.parsed_args.pregrep, self.regex_flags)
-        self.db.add_rows(parsed_rows)
-        file_handle.close()
+        return self.read_grepped_rows(lines, (pregrep_all or []) + (pregrep or []))
+
+    def read_grepped_rows(self, lines, regex_list):
+        if not regex_list:
+            return csv.reader(lines, dialect=self.dialect)
+        return iter_raw_grep_rows(lines, self.dialect, regex_list, self.regex_flags)
+
+    def can_read_in_parallel(self, file):
+        return ParallelCsvReader.can_read(file, self.dialect, getattr(self.parsed_args, "jobs", 1))
+
+    # Parallel version of read_rows that also drops the rows not matching "criteria" (-select) and the columns
+    # this run does not use.  The header is read right away; the returned generator pads the rows and gives them
+    # back in file order.  "widest", a WidestRow, is told the length of the longest row before the criteria.
+    def read_rows_in_parallel(self, file, criteria=(), chunk_read=None, widest=None):
+        reader = ParallelCsvReader(file, self.dialect, self.parsed_args.jobs)
+        pregrep_all = getattr(self.parsed_args, "pregrep!", None)
+        if self.has_header:
+            if pregrep_all:
+                line_matches = make_line_matcher(pregrep_all, self.regex_flags)
+                header = reader.read_first_record(lambda row: line_matches(" ".join(row)))
+            else:
+                header = reader.read_first_record()
+            if header is not None:
+                self.db.set_column_names(header)
+            else:
+                self.has_header = False
+        if not self.can_push_down(criteria):
+            criteria = ()  # Left to the caller
+        self.db.compile_criteria(criteria)
+        row_filter = RowFilter(self.db.column_names, pregrep_all, self.parsed_args.pregrep, criteria,
+                               self.regex_flags)
+        needed_columns = self.get_needed_columns(for_pregrep=False) if file == self.parsed_args.csv_file else None
+        if needed_columns is not None and needed_columns != self.db.column_names:
+            row_filter.keep_columns = [self.db.column_number_by_name[name] for name in needed_columns]
+            self.db = self.db.select_columns(needed_columns)
+            self.db.regex_flags = self.regex_flags
+            widest = None  # The extra columns are dropped too
+        return reader.read_rows(row_filter, chunk_read, widest)
 
     def match_column_args_to_column_names(self):
+        if self.column_args_matched:  # Already done by get_needed_columns
+            return
+        self.column_args_matched = True
         if self.parsed_args.columns:
             self.parsed_args.columns = self.get_matching_columns(self.parsed_args.columns)
         if self.parsed_args.nocolumns:
@@ -194,6 +733,8 @@ class CsvShow:
             self.parsed_args.sort = self.get_matching_columns(self.parsed_args.sort)
         if self.parsed_args.lookup:
             self.parsed_args.lookup = self.get_matching_columns(self.parsed_args.lookup)
+        self.lookup_queries = [(self.get_matching_columns(fields), lookup_spec)
+                               for fields, lookup_spec in self.lookup_queries]
 
     def get_matching_columns(self, column_expressions):
         matched_set = set()
@@ -227,55 +768,156 @@ class CsvShow:
         return values
 
 
+    # -lookup_batch: each line is split like a shell command line, so values with spaces can be quoted
+    def read_lookup_batch(self, file):
+        import shlex
+        if file == "-" and self.parsed_args.csv_file == "-":
+            raise CSVShowError("-lookup_batch and the CSV file cannot both be read from STDIN")
+        file_handle = self.open_input_file(file)
+        queries = []
+        try:
+            for line_num, line in enumerate(file_handle, 1):
+                values = shlex.split(line)
+                if len(values) == 0:
+                    continue
+                lookup_spec = [re.split(ParseActionBase.supported_relational_ops_re, relation_str, 1)
+                               for relation_str in values[1:]]
+                if len(lookup_spec) == 0 or any(len(relation) != 3 for relation in lookup_spec):
+                    raise CSVShowError(f"Line {line_num} of {file} must be of the form "
+                                       f"FIELD_LIST KEY<op>VALUE [KEY<op>VALUE ...]: \"{line.strip()}\"")
+                queries.append((values[0].split(","), lookup_spec))
+        finally:
+            if file_handle is not sys.stdin:
+                file_handle.close()
+        return queries
+
+    # One line per -lookup_batch query.  The rows found are only read, so repeated lookups on a column can build
+    # an index on it (see CSVShowDB.auto_index_lookups).
+    def get_batch_lookups(self):
+        self.db.auto_index_lookups = 10
+        for fields, lookup_spec in self.lookup_queries:
+            lookup_row = self.db.lookup_row(lookup_spec)
+            if lookup_row is None:
+                print("Lookup failed. Lookup spec: " + str(lookup_spec), file=sys.stderr)
+                yield ""
+            else:
+                yield ", ".join(lookup_row[self.db.get_col_number(field)] for field in fields)
+
     def user_modify_db(self):
         pass
     def user_modify_db_post_select(self):
         pass
 
     def apply_column_changes(self):
-        if self.parsed_args.columns is not None or self.parsed_args.nocolumns is not None:
-            nocolumns = self.parsed_args.nocolumns or []
-            selected_columns = self.parsed_args.columns or self.db.column_names
-            selected_columns = [column for column in selected_columns if column not in nocolumns]
-            orig = set(self.db.column_names)
-            sel = set(selected_columns)
-            self.removed_columns = orig - sel
-
+        selected_columns = self.get_selected_columns()
+        if selected_columns is not None:
             try:
                 self.db = self.db.select_columns(selected_columns)
             except KeyError:
                 raise CSVShowError(f"Invalid column name")
 
+    # Returns a function that makes the column changes to one row, and (with switch_db) switches self.db to the
+    # new columns.  Used while streaming, when only the column names are known.
+    def get_column_changes(self, switch_db=True):
+        selected_columns = self.get_selected_columns()
+        if selected_columns is None:
+            return lambda row: row
+        try:
+            selected_column_numbers = [self.db.column_number_by_name[column] for column in selected_columns]
+        except KeyError:
+            raise CSVShowError(f"Invalid column name")
+        if switch_db:
+            self.db = self.db.select_columns(selected_columns)  # No rows have been stored yet
+        return CSVShowDB.get_column_projection(selected_column_numbers)
+
+    def get_selected_columns(self):
+        if self.parsed_args.columns is None and self.parsed_args.nocolumns is None:
+            return None
+        nocolumns = self.parsed_args.nocolumns or []
+        selected_columns = self.parsed_args.columns or self.db.column_names
+        selected_columns = [column for column in selected_columns if column not in nocolumns]
+        orig = set(self.db.column_names)
+        sel = set(selected_columns)
+        self.removed_columns = orig - sel
+        return selected_columns
+
     def print_formatted_db(self, output):
-        is_tty = sys.stdout.isatty()
-        has_less = CsvShow.get_has_less()
-        fits_in_tty_window = ((len(self.db) + 2 <= self.tty_lines)
-                              and (len(output) == 0 or (len(output[0]) <= self.tty_columns))
-                              )
-        if (self.parsed_args.less is True) or \
-                ((self.parsed_args.less is None) and is_tty and has_less and not fits_in_tty_window):
-            proc = subprocess.run("less -S", input="\n".join(output), text=True, shell=True)
+        output = iter(output)
+        use_less = self.parsed_args.less
+        if use_less is None and sys.stdout.isatty() and CsvShow.get_has_less():
+            # Read just enough lines to tell whether the output fits in the terminal
+            first_lines = list(itertools.islice(output, self.tty_lines + 1))
+            fits_in_tty_window = ((len(first_lines) <= self.tty_lines)
+                                  and (len(first_lines) == 0 or (len(first_lines[0]) <= self.tty_columns))
+                                  )
+            use_less = not fits_in_tty_window
+            output = itertools.chain(first_lines, output)
+        if use_less:
+            self.print_to_pager(output)
         else:
             self.print_all_lines(output)
 
+    # Lines go to less while they are still being made.  The first screen is flushed right away, after that
+    # the pipe buffer bounds the memory used.  Quitting less early closes the pipe, which ends the output.
+    def print_to_pager(self, output):
+        import subprocess
+        proc = subprocess.Popen(self.pager_command, stdin=subprocess.PIPE, text=True, shell=True)
+        try:
+            self.write_lines(proc.stdin, itertools.islice(output, self.tty_lines))
+            proc.stdin.flush()
+            self.write_lines(proc.stdin, output)
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass  # Okay: The user quit less before reading all the output
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            proc.wait()
+
     @staticmethod
     def print_all_lines(output):
         try:
-            last_index = len(output) - 1
-            for line_num in range(len(output)):
-                line = output[line_num]
-                if line_num != last_index:
-                    print(line, )
-                else:
-                    print(line)
+            CsvShow.write_lines(sys.stdout, output)
+            sys.stdout.flush()
         except BrokenPipeError as e:
-            pass  # Okay: The user piped to another program which didn't consume all the output
+            # Okay: The user piped to another program which didn't consume all the output.
+            # Send what is still buffered to /dev/null so it does not fail again at exit.
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+
+    # One buffered writelines instead of a print call per line
+    @staticmethod
+    def write_lines(file, lines):
+        file.writelines(map("{}\n".format, lines))
 
+    # Only asked when stdout is a terminal.  Looks on the PATH instead of starting a shell to run less.
     @staticmethod
     def get_has_less():
-        result = subprocess.run("less --version", shell=True, capture_output=True)
-        has_less = result.returncode == 0
-        return has_less
+        import shutil
+        return shutil.which("less") is not None
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"Expected a number 1 or larger: {value}")
+    return number
+
+
+def percentage(value):
+    number = float(value)
+    if not 0 < number <= 100:
+        raise argparse.ArgumentTypeError(f"Expected a number above 0 and up to 100: {value}")
+    return number
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"Expected a number 0 or larger: {value}")
+    return number
 
 
 class ParseCommaSeparatedArgs(argparse.Action):
@@ -424,6 +1066,34 @@ class StoreTrueUnlessNegated(argparse.Action):
         setattr(namespace, self.dest, value_to_set)
 
 
+class ParseClearCacheArg(argparse.Action):
+    def __init__(self, option_strings, dest, nargs=0, **kwargs):
+        super().__init__(option_strings, dest, nargs, **kwargs)
+
+    def __call__(self, parser, namespace, new_values, option_string=None):
+        from csv_show_cache import CsvCache
+        cache = CsvCache()
+        cache.clear()
+        print(f"Cleared cache: {cache.cache_dir}")
+        exit(0)
+
+
+class ParseServeArg(ParseActionBase):
+    def __init__(self, option_strings, dest, nargs="*", **kwargs):
+        super().__init__(option_strings, dest, nargs, **kwargs)
+
+    def __call__(self, parser, namespace, new_values, option_string=None):
+        from csv_show_server import serve
+        settings = {}
+        self.add_new_pairs(settings, new_values)
+        unknown = set(settings) - {"socket", "memory"}
+        if unknown:
+            raise argparse.ArgumentError(self, f"Unknown settings: {', '.join(sorted(unknown))}")
+        memory_budget = int(float(settings["memory"]) * 1024 * 1024) if "memory" in settings else None
+        serve(settings.get("socket"), memory_budget)
+        exit(0)
+
+
 class ParseVersionArg(argparse.Action):
     def __init__(self, option_strings, dest, nargs=0, **kwargs):
         super().__init__(option_strings, dest, nargs, **kwargs)
@@ -433,6 +1103,38 @@ class ParseVersionArg(argparse.Action):
         exit(0)
 
 
+# Raised while streaming, before anything was printed, when a row has more fields than the header names or a
+# -select names a column the header does not
+class HeaderTooNarrow(Exception):
+    pass
+
+
+# Lines of stdin, kept while streaming in case it switches to reading everything into memory (see
+# CsvShow.show).  After replay(), reading starts over with the kept lines.
+class RecordedLines:
+    def __init__(self, file_handle):
+        self.file_handle = file_handle
+        self.lines = []
+        self.replayed_lines = []
+
+    def __iter__(self):
+        for line in itertools.chain(self.replayed_lines, self.file_handle):
+            if self.lines is not None:
+                self.lines.append(line)
+            yield line
+
+    def stop_recording(self):
+        self.lines = None
+
+    def replay(self):
+        self.replayed_lines, self.lines = self.lines, None
+        return self
+
+    def close(self):
+        if self.lines is None:  # Kept open while the lines may be replayed
+            self.file_handle.close()
+
+
 if __name__ == "__main__":
     show = CsvShow()
     show.show(sys.argv[1:])
@@ -0,0 +1,611 @@
+#!/bin/env python
+# Benchmarks for csv_show.  Run "csv_show_benchmark.py --help" for the list of benchmarks.
+import argparse
+import collections
+import contextlib
+import csv
+import io
+import itertools
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from csv_show_db import CSVShowDB
+from csv_show_columnar_db import CSVShowColumnarDB
+from csv_show_format import CsvPrintFormatter, ColumnWidths
+from csv_show_mmap import MmapCsvReader
+from csv_show import CsvShow
+from csv_show_shared import *
+
+
+car_column_names = ["Make", "Model", "Year", "Serial", "Price"]
+car_makes = ["Ford", "Honda", "GMC", "Tesla", "Roman", "Toyota", "Subaru", "Volvo"]
+car_models = ["Expedition", "Accord", "Explorer", "Windstar", "Safari", "Model S", "Chariot", "Camry"]
+
+
+# Rows shaped like data/cars.csv plus a unique serial number and a price
+def make_car_rows(num_rows, seed=1):
+    rng = random.Random(seed)
+    return [[rng.choice(car_makes), rng.choice(car_models), str(rng.randint(1990, 2020)),
+             f"SN{row_num:09d}", str(rng.randint(1000, 99999))]
+            for row_num in range(num_rows)]
+
+
+def make_car_csv_lines(num_rows):
+    return [",".join(car_column_names)] + [",".join(row) for row in make_car_rows(num_rows)]
+
+
+def load_db(db, lines):
+    reader = csv.reader(lines)
+    db.set_column_names(next(reader))
+    for row in reader:
+        db.add_row(row)
+    return db
+
+
+def measure_memory(function):
+    tracemalloc.start()
+    result = function()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def time_it(function, repeat=1):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def report(name, baseline, new, unit="s"):
+    print(f"{name}: {baseline:.3f}{unit} -> {new:.3f}{unit}  ({baseline / new:.1f}x)")
+
+
+def benchmark_columnar_memory(num_rows):
+    lines = make_car_csv_lines(num_rows)
+    row_db, row_bytes = measure_memory(lambda: load_db(CSVShowDB(), lines))
+    columnar_db, columnar_bytes = measure_memory(lambda: load_db(CSVShowColumnarDB(), lines))
+    mb = 1024 * 1024
+    report(f"Table memory, {num_rows} rows", row_bytes / mb, columnar_bytes / mb, "MB")
+    _, row_time = time_it(lambda: row_db.select([["Make", "=", "Ford"]]))
+    _, columnar_time = time_it(lambda: columnar_db.select([["Make", "=", "Ford"]]))
+    report(f"-select Make=Ford, {num_rows} rows", row_time, columnar_time)
+
+
+def benchmark_indexed_lookup(num_rows, num_lookups=1000):
+    db = load_db(CSVShowDB(), make_car_csv_lines(num_rows))
+    serials = [f"SN{row_num:09d}" for row_num in random.Random(2).sample(range(num_rows), num_lookups)]
+
+    def lookups():
+        return [db.lookup_item("Price", [["Serial", "=", serial]]) for serial in serials]
+    db.auto_index_lookups = None
+    scan_prices, scan_time = time_it(lookups)
+    db.create_index("Serial")
+    index_prices, index_time = time_it(lookups)
+    assert scan_prices == index_prices
+    report(f"{num_lookups} x lookup_item, {num_rows} rows", scan_time, index_time)
+
+
+def benchmark_sort(num_rows):
+    db = load_db(CSVShowDB(), make_car_csv_lines(num_rows))
+    rows = db.rows
+    for sort_columns in [["Year"], ["Make", "Price"]]:
+        col_nums = [db.get_col_number(name) for name in sort_columns]
+        # Baseline: parse the cells on every comparison
+        expected, comparable_time = time_it(lambda: sorted(rows, key=lambda row: RowComparable(row, col_nums)))
+
+        def sort_db():
+            db.rows = rows
+            db.sort(sort_columns)
+            return db.rows
+        result, key_time = time_it(sort_db)
+        assert result == expected
+        report(f"-sort {','.join(sort_columns)}, {num_rows} rows", comparable_time, key_time)
+
+
+def benchmark_top_k(num_rows, k=30):
+    db = load_db(CSVShowDB(), make_car_csv_lines(num_rows))
+    rows = db.rows
+
+    def sort_then_head():
+        db.rows = list(rows)
+        db.sort(["Price"])
+        return db.head(k).rows
+    expected, sort_time = time_it(sort_then_head)
+    result, top_k_time = time_it(lambda: db.top_k(["Price"], k, rows=rows).rows)
+    assert result == expected
+    report(f"-sort Price -head {k}, {num_rows} rows", sort_time, top_k_time)
+
+
+def benchmark_typed_columns(num_rows, num_selects=10):
+    db = load_db(CSVShowDB(), make_car_csv_lines(num_rows))
+    criteria_list = [[["Price", ">", str(90000 + 1000 * i)]] for i in range(num_selects)]
+
+    def parse_every_time():  # Baseline: each select parses every cell again
+        return [list(db.filter_rows(db.rows, criteria)) for criteria in criteria_list]
+
+    def typed_selects():
+        return [db.select(criteria).rows for criteria in criteria_list]
+    expected, parse_time = time_it(parse_every_time)
+    result, typed_time = time_it(typed_selects)
+    assert result == expected
+    report(f"{num_selects} x -select Price>N, {num_rows} rows", parse_time, typed_time)
+
+
+def benchmark_number_parsing(num_rows):
+    rows = make_car_rows(num_rows)
+    cell_groups = {"Make, Model, Year (few distinct values)": [cell for row in rows for cell in row[:3]],
+                   "Serial, Price (mostly distinct values)": [cell for row in rows for cell in row[3:]],
+                   "1,234.50 style prices": [f"{int(row[4]) / 7:,.2f}" for row in rows]}
+
+    def parse_all(parse, cells):
+        parse_number.cache_clear()  # Timed from a cold cache
+        return [parse(cell) for cell in cells]
+    for name, cells in cell_groups.items():
+        expected, regex_time = time_it(lambda: parse_all(parse_number_with_regexes, cells))
+        result, fast_path_time = time_it(lambda: parse_all(parse_number.__wrapped__, cells))
+        assert result == expected
+        result, memo_time = time_it(lambda: parse_all(parse_number, cells))
+        assert result == expected
+        report(f"parse {len(cells)} cells of {name}, fast path only", regex_time, fast_path_time)
+        report(f"parse {len(cells)} cells of {name}, fast path and memo", regex_time, memo_time)
+
+
+# grep_rows with the regexes compiled once and plain text searched with "in", against re.search per term and row
+def benchmark_grep(num_rows):
+    rows = make_car_rows(num_rows)
+
+    def grep_with_re_search(regex_list, regex_flags):
+        regex_list = ensure_regex_list(regex_list)
+        return [row for row, line in zip(rows, map(" ".join, rows))
+                if all((re.search(regex, line, regex_flags) is not None) == positive_match
+                       for regex, positive_match in regex_list)]
+    for regex_list, regex_flags in [("Tesla", 0), ("Tesla", re.IGNORECASE), ("SN0000123", re.IGNORECASE),
+                                    ([("Ford", True), ("Explorer", True), ("2003", False)], re.IGNORECASE),
+                                    ("Ford|GMC", re.IGNORECASE)]:
+        expected, search_time = time_it(lambda: grep_with_re_search(regex_list, regex_flags))
+        result, compiled_time = time_it(lambda: grep_rows(rows, regex_list, regex_flags))
+        assert result == expected
+        report(f"grep {regex_list} (flags={regex_flags}), {num_rows} rows", search_time, compiled_time)
+
+
+# -pregrep on the raw lines against splitting every line first, and -select values searched for in the raw file
+def benchmark_raw_grep(num_rows):
+    text = "\n".join(make_car_csv_lines(num_rows)) + "\n"
+    for regex in ["SN0000123", "F.rd Expl", "Tesla|GMC", "2003$"]:
+        expected, parsed_time = time_it(
+            lambda: list(iter_grep_rows(csv.reader(io.StringIO(text)), regex, re.IGNORECASE)))
+        result, raw_time = time_it(lambda: list(iter_raw_grep_rows(io.StringIO(text), csv.excel, regex, re.IGNORECASE)))
+        assert result == expected
+        report(f"grep {regex} on the lines, {num_rows} rows", parsed_time, raw_time)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+        csv_file.write(text)
+    try:
+        save_read_grepped_rows = CsvShow.read_grepped_rows
+        CsvShow.read_grepped_rows = lambda self, lines, regex_list: iter_grep_rows(
+            csv.reader(lines, dialect=self.dialect), regex_list or [], self.regex_flags)
+        expected, parsed_time = time_it(lambda: run_csv_show([csv_file.name, "-pregrep", "^T.s", "-csv"]))
+        CsvShow.read_grepped_rows = save_read_grepped_rows
+        result, raw_time = time_it(lambda: run_csv_show([csv_file.name, "-pregrep", "^T.s", "-csv"]))
+        assert result == expected
+        report(f"-pregrep ^T.s, {num_rows} rows", parsed_time, raw_time)
+
+        for select in ["Make=Tesla", "Serial=~SN0000123"]:
+            args = [csv_file.name, "-select", select, "-csv"]
+            save_get_prefilter_terms = CsvShow.get_prefilter_terms
+            CsvShow.get_prefilter_terms = lambda self, file, criteria=(): save_get_prefilter_terms(self, file)
+            expected, unfiltered_time = time_it(lambda: run_csv_show(args))
+            CsvShow.get_prefilter_terms = save_get_prefilter_terms
+            result, prefiltered_time = time_it(lambda: run_csv_show(args))
+            assert result == expected
+            report(f"-select {select}, {num_rows} rows", unfiltered_time, prefiltered_time)
+    finally:
+        os.remove(csv_file.name)
+
+
+# -select, -columns and -grep chained as views of the loaded rows, against a new copied database per step
+def benchmark_views(num_rows):
+    db = load_db(CSVShowDB(), make_car_csv_lines(num_rows))
+    criteria = [["Year", ">=", "2000"]]
+    columns = ["Serial", "Make", "Price"]
+
+    def chain_with_copies():  # What select, select_columns and grep did before views
+        selected = CSVShowDB([db.rows[row_num] for row_num in db.select_row_numbers(criteria)], db.column_names)
+        column_numbers = [selected.column_number_by_name[column] for column in columns]
+        selected = CSVShowDB([[row[col_num] for col_num in column_numbers] for row in selected.rows], columns)
+        return CSVShowDB(grep_rows(selected.rows, "Ford|Tesla", re.IGNORECASE), columns)
+
+    def chain_of_views():
+        return db.select(criteria).select_columns(columns).grep("Ford|Tesla", re.IGNORECASE)
+    expected, copies_time = time_it(chain_with_copies)
+    result, views_time = time_it(chain_of_views)
+    assert list(result.read_only_rows()) == expected.rows
+    _, copies_bytes = measure_memory(chain_with_copies)
+    _, views_bytes = measure_memory(chain_of_views)
+    report(f"-select -columns -grep, {num_rows} rows", copies_time, views_time)
+    mb = 1024 * 1024
+    report(f"-select -columns -grep memory, {num_rows} rows", copies_bytes / mb, views_bytes / mb, unit="MB")
+    formatter = CsvPrintFormatter()
+    formatter.collect_width_histograms = False
+    formatter.set_db(expected)
+    expected_lines, copies_time = time_it(formatter.format_output_as_lines)
+    formatter.set_db(result)
+    lines, views_time = time_it(formatter.format_output_as_lines)
+    assert lines == expected_lines
+    report(f"formatting the result, {len(lines)} lines", copies_time, views_time)
+
+
+def benchmark_column_widths(num_rows):
+    for db in [load_db(CSVShowDB(), make_car_csv_lines(num_rows)),
+               load_db(CSVShowColumnarDB(), make_car_csv_lines(num_rows))]:
+        def measure_every_cell():  # Baseline: the per-cell loop with histograms
+            longest_by_col = []
+            width_histograms = {}
+            for row in itertools.chain([db.column_names], db.rows):
+                for col_num in range(len(row)):
+                    col_width = len(row[col_num])
+                    histogram = width_histograms.setdefault(db.column_names[col_num], {})
+                    histogram[col_width] = histogram.get(col_width, 0) + 1
+                    if len(longest_by_col) <= col_num:
+                        longest_by_col.append(0)
+                    if col_width > longest_by_col[col_num]:
+                        longest_by_col[col_num] = col_width
+            return longest_by_col
+
+        def measure_in_bulk(collect_width_histograms):
+            formatter = CsvPrintFormatter()
+            formatter.collect_width_histograms = collect_width_histograms
+            formatter.set_db(db)
+            formatter.find_longest_column_widths()
+            return formatter.longest_by_col
+        expected, baseline_time = time_it(measure_every_cell)
+        result, histograms_time = time_it(lambda: measure_in_bulk(True))
+        assert result == expected
+        result, bulk_time = time_it(lambda: measure_in_bulk(False))
+        assert result == expected
+        name = type(db).__name__
+        report(f"column widths with histograms, {name} {num_rows} rows", baseline_time, histograms_time)
+        report(f"column widths, {name} {num_rows} rows", baseline_time, bulk_time)
+
+
+def run_csv_show(args, show_class=CsvShow):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        show_class().show(args + ["-noless"])
+    return output.getvalue()
+
+
+def benchmark_row_rendering(num_rows, num_wide_columns=200):
+    def format_row_per_cell(row, col_widths):  # Baseline: a format spec and str.format per cell
+        row_str = ""
+        for col_num in range(len(row)):
+            if col_num == 0:
+                row_str += "|"
+            width = col_widths[col_num]
+            data = row[col_num]
+            if len(data) > width:
+                width -= 1
+            fmt = "{item:" + f"{width}" + "." + f"{width}" "}"
+            if width > 0:
+                row_str += fmt.format(item=data)
+            if len(data) > width:
+                row_str += "*"
+            row_str += "|"
+        return row_str
+
+    rng = random.Random(1)
+    wide_rows = [[str(rng.randint(0, 10 ** rng.randint(1, 8))) for _ in range(num_wide_columns)]
+                 for _ in range(max(num_rows // num_wide_columns, 1))]
+    tables = {f"{len(wide_rows)} rows x {num_wide_columns} columns": wide_rows,
+              f"{num_rows} rows x {len(car_column_names)} columns": make_car_rows(num_rows)}
+    for name, rows in tables.items():
+        col_widths = ColumnWidths()
+        col_widths.add_rows(rows)
+        for truncated_name, widths in [("", col_widths.longest_by_col),
+                                       (" with truncation", [max(width - 2, 0) for width in col_widths.longest_by_col])]:
+            expected, per_cell_time = time_it(lambda: [format_row_per_cell(row, widths) for row in rows])
+            render = CsvPrintFormatter.make_row_renderer(widths)
+            result, render_time = time_it(lambda: list(map(render, rows)))
+            assert result == expected
+            report(f"render {name}{truncated_name}", per_cell_time, render_time)
+
+
+def benchmark_width_sample(num_rows):
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+        csv_file.write("\n".join(make_car_csv_lines(num_rows)) + "\n")
+    try:
+        class FirstLineTimer(CsvShow):
+            def print_formatted_db(self, output):
+                output = iter(output)
+                next(output)
+                self.first_line_time = time.perf_counter() - start_time
+                collections.deque(output, maxlen=0)
+
+        def time_first_line(args):
+            nonlocal start_time
+            start_time = time.perf_counter()
+            ui = FirstLineTimer()
+            ui.show([csv_file.name] + args)
+            return ui.first_line_time
+        start_time = None
+        measured_time = time_first_line([])
+        sampled_time = time_first_line(["-width_sample", "1000"])
+        report(f"time to first line, {num_rows} rows", measured_time, sampled_time)
+    finally:
+        os.remove(csv_file.name)
+
+
+def benchmark_pager(num_rows):
+    class JoinedPagerShow(CsvShow):  # Baseline: the whole output is joined before the pager starts
+        def print_to_pager(self, output):
+            subprocess.run(self.pager_command, input="\n".join(output), text=True, shell=True)
+
+    def page_lines(show_class):
+        ui = show_class()
+        ui.make_arg_parser()
+        ui.parse_args(["-", "-less"])
+        ui.pager_command = "head -n 50 > /dev/null"  # Quits after the first screen, like a user would
+        lines = (f"|{row_num:9d}|{'x' * 60}|" for row_num in range(num_rows))
+        tracemalloc.start()
+        ui.print_formatted_db(lines)
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak / (1024 * 1024)
+    baseline_memory, baseline_time = time_it(lambda: page_lines(JoinedPagerShow))
+    memory, streaming_time = time_it(lambda: page_lines(CsvShow))
+    report(f"page {num_rows} lines, quit after one screen", baseline_time, streaming_time)
+    report(f"page {num_rows} lines, peak memory", baseline_memory, memory, "MB")
+
+    def print_every_line(lines):  # Baseline: one print call per line
+        for line in lines:
+            print(line)
+    lines = [f"|{row_num:9d}|{'x' * 60}|" for row_num in range(num_rows)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        _, print_time = time_it(lambda: print_every_line(lines))
+        _, write_time = time_it(lambda: CsvShow.print_all_lines(lines))
+    report(f"print {num_rows} lines to stdout", print_time, write_time)
+
+
+def benchmark_lookup_batch(num_rows, num_lookups=100):
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+        csv_file.write("\n".join(make_car_csv_lines(num_rows)) + "\n")
+    rng = random.Random(1)
+    queries = [f"Price,Year Serial=SN{rng.randrange(num_rows):09d}" for _ in range(num_lookups)]
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as batch_file:
+        batch_file.write("\n".join(queries) + "\n")
+    try:
+        def one_run_per_lookup():  # Baseline: the file is read again for every lookup (in process, no startup)
+            return "".join(run_csv_show([csv_file.name, "-lookup"] + query.split()) for query in queries)
+        expected, separate_time = time_it(one_run_per_lookup)
+        result, batch_time = time_it(lambda: run_csv_show([csv_file.name, "-lookup_batch", batch_file.name]))
+        assert result == expected
+        report(f"{num_lookups} lookups, {num_rows} rows", separate_time, batch_time)
+    finally:
+        os.remove(csv_file.name)
+        os.remove(batch_file.name)
+
+
+# -lookup from scripts: a csv_show.py process per lookup against csv_show_client.py and a running server
+def benchmark_serve(num_rows, num_lookups=10):
+    from csv_show_server import CsvShowServer
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    temp_dir = tempfile.mkdtemp()
+    csv_file_name = os.path.join(temp_dir, "cars.csv")
+    with open(csv_file_name, "w") as csv_file:
+        csv_file.write("\n".join(make_car_csv_lines(num_rows)) + "\n")
+    server = CsvShowServer(os.path.join(temp_dir, "csv_show.sock"))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        rng = random.Random(1)
+        lookups = [["-lookup", "Price", f"Serial=SN{rng.randrange(num_rows):09d}"] for _ in range(num_lookups)]
+
+        def run_all(script):
+            return [subprocess.run([sys.executable, os.path.join(package_dir, script), csv_file_name] + lookup,
+                                   capture_output=True, text=True, check=True,
+                                   env=dict(os.environ, CSV_SHOW_SOCKET=server.socket_path)).stdout
+                    for lookup in lookups]
+        expected, process_time = time_it(lambda: run_all("csv_show.py"))
+        _, first_time = time_it(lambda: run_all("csv_show_client.py")[:1])  # Includes loading the file
+        result, served_time = time_it(lambda: run_all("csv_show_client.py"))
+        assert result == expected
+        report(f"{num_lookups} lookups, {num_rows} rows", process_time, served_time)
+        print(f"first request (loads the file): {first_time:.3f}s")
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+        shutil.rmtree(temp_dir)
+
+
+startup_import_budget_ms = 25
+
+
+# Startup of a one cell -lookup, as run from scripts in a loop.  "import csv_show" is timed with
+# "python -X importtime" and compared to startup_import_budget_ms.  num_rows is not used.
+def benchmark_startup(num_rows, num_runs=20):
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run([sys.executable, "-m", "compileall", "-q", package_dir], check=True)  # Time imports, not compiles
+
+    def import_time_ms():
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import csv_show"], cwd=package_dir,
+                                capture_output=True, text=True, check=True)
+        for line in result.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == "csv_show":
+                return int(fields[1]) / 1000
+
+    def run_time_ms(command):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=package_dir, stdout=subprocess.DEVNULL, check=True)
+        return (time.perf_counter() - start) * 1000
+    import_ms = min(import_time_ms() for _ in range(num_runs))
+    python_ms = min(run_time_ms([sys.executable, "-c", "pass"]) for _ in range(num_runs))
+    lookup_ms = min(run_time_ms([sys.executable, "csv_show.py", "data/cars.csv", "-lookup", "Year", "Model=Accord"])
+                    for _ in range(num_runs))
+    status = "ok" if import_ms <= startup_import_budget_ms else "OVER BUDGET"
+    print(f"import csv_show: {import_ms:.1f}ms (budget {startup_import_budget_ms}ms, {status})")
+    print(f"csv_show.py -lookup: {lookup_ms:.1f}ms (python alone: {python_ms:.1f}ms)")
+
+
+def benchmark_mmap_pregrep(num_rows):
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+        csv_file.write("\n".join(make_car_csv_lines(num_rows)) + "\n")
+    try:
+        args = [csv_file.name, "-pregrep", "SN0000123", "-csv"]  # Keeps about 0.01% of the rows
+        save_can_read = MmapCsvReader.can_read
+        MmapCsvReader.can_read = staticmethod(lambda *args: False)
+        expected, text_time = time_it(lambda: run_csv_show(args))
+        MmapCsvReader.can_read = save_can_read
+        result, mmap_time = time_it(lambda: run_csv_show(args))
+        assert result == expected
+        report(f"-pregrep SN0000123, {num_rows} rows", text_time, mmap_time)
+    finally:
+        os.remove(csv_file.name)
+
+
+def benchmark_cache(num_rows):
+    cache_dir = tempfile.mkdtemp()
+    save_environ = dict(os.environ)
+    os.environ["CSV_SHOW_CACHE_DIR"] = cache_dir
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+        csv_file.write("\n".join(make_car_csv_lines(num_rows)) + "\n")
+    try:
+        args = [csv_file.name, "-select", "Year=2001", "Make=Ford", "-columns", "Model,Price", "-csv"]
+        expected, parse_time = time_it(lambda: run_csv_show(args))
+        _, save_time = time_it(lambda: run_csv_show(args + ["-cache"]))
+        result, load_time = time_it(lambda: run_csv_show(args + ["-cache"]))
+        assert result == expected
+        report(f"-select Year=2001 Make=Ford, first -cache run, {num_rows} rows", parse_time, save_time)
+        report(f"-select Year=2001 Make=Ford, later -cache runs, {num_rows} rows", parse_time, load_time)
+    finally:
+        os.environ.clear()
+        os.environ.update(save_environ)
+        shutil.rmtree(cache_dir)
+        os.remove(csv_file.name)
+
+
+def benchmark_projection(num_rows, num_columns=200):
+    rng = random.Random(3)
+    num_rows = max(num_rows // 20, 1)  # The rows are much wider than the car rows
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+        csv_file.write(",".join(f"Field{col_num}" for col_num in range(num_columns)) + "\n")
+        for _ in range(num_rows):
+            csv_file.write(",".join(str(rng.randint(0, 9999)) for _ in range(num_columns)) + "\n")
+    try:
+        args = [csv_file.name, "-sort", "Field3", "-columns", "Field1,Field3,Field5,Field7,Field9", "-csv"]
+        save_project_rows = CsvShow.project_rows
+        CsvShow.project_rows = lambda self, rows: rows
+        expected, all_columns_time = time_it(lambda: run_csv_show(args))
+        CsvShow.project_rows = save_project_rows
+        result, projected_time = time_it(lambda: run_csv_show(args))
+        assert result == expected
+        report(f"-sort with 5 of {num_columns} columns, {num_rows} rows", all_columns_time, projected_time)
+    finally:
+        os.remove(csv_file.name)
+
+
+def benchmark_pushdown(num_rows):
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+        csv_file.write("\n".join(make_car_csv_lines(num_rows)) + "\n")
+    try:
+        class NoPushdownShow(CsvShow):
+            def user_modify_db(self):  # Keeps -select after reading
+                pass
+
+            def read_db(self, file, criteria=(), first_match_only=False):
+                super().read_db(file)
+        select_args = [csv_file.name, "-sort", "Price", "-select", "Make=Ford", "Year=2001", "-csv", "-noless"]
+
+        def run_select(show_class):
+            tracemalloc.start()
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                show_class().show(select_args)
+            size, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return output.getvalue(), peak / (1024 * 1024)
+        (expected, baseline_peak), baseline_time = time_it(lambda: run_select(NoPushdownShow))
+        (result, peak), pushdown_time = time_it(lambda: run_select(CsvShow))
+        assert result == expected
+        report(f"-sort Price -select Make=Ford Year=2001, {num_rows} rows", baseline_time, pushdown_time)
+        report(f"-sort Price -select Make=Ford Year=2001 peak memory, {num_rows} rows", baseline_peak, peak, "MB")
+
+        lookup_args = [csv_file.name, "-lookup", "Price", f"Serial=SN{num_rows // 10:09d}"]
+        expected, baseline_time = time_it(lambda: run_csv_show(lookup_args, NoPushdownShow))
+        result, pushdown_time = time_it(lambda: run_csv_show(lookup_args))
+        assert result == expected
+        report(f"-lookup of row {num_rows // 10}, {num_rows} rows", baseline_time, pushdown_time)
+    finally:
+        os.remove(csv_file.name)
+
+
+def benchmark_query_plan(num_rows):
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+        csv_file.write("\n".join(make_car_csv_lines(num_rows)) + "\n")
+    try:
+        class UnoptimizedShow(CsvShow):  # Runs the stages in the order the options are documented to apply
+            def make_plan(self, streaming):
+                plan = super().make_plan(streaming)
+                plan.optimize = lambda: plan
+                return plan
+
+            def can_stream(self):
+                return False
+        for args in ["-sort Price -grep ^T.s -columns Make,Price -csv", "-sort Price -grep ^T.s -columnar -csv",
+                     "-sort Price -lookup Serial Make=Tesla"]:
+            expected, unoptimized_time = time_it(lambda: run_csv_show([csv_file.name] + args.split(), UnoptimizedShow))
+            result, optimized_time = time_it(lambda: run_csv_show([csv_file.name] + args.split()))
+            assert result == expected
+            report(f"{args}, {num_rows} rows", unoptimized_time, optimized_time)
+    finally:
+        os.remove(csv_file.name)
+
+
+benchmarks = {
+    "columnar_memory": benchmark_columnar_memory,
+    "indexed_lookup": benchmark_indexed_lookup,
+    "sort": benchmark_sort,
+    "top_k": benchmark_top_k,
+    "typed_columns": benchmark_typed_columns,
+    "number_parsing": benchmark_number_parsing,
+    "grep": benchmark_grep,
+    "raw_grep": benchmark_raw_grep,
+    "views": benchmark_views,
+    "mmap_pregrep": benchmark_mmap_pregrep,
+    "cache": benchmark_cache,
+    "projection": benchmark_projection,
+    "pushdown": benchmark_pushdown,
+    "query_plan": benchmark_query_plan,
+    "column_widths": benchmark_column_widths,
+    "width_sample": benchmark_width_sample,
+    "row_rendering": benchmark_row_rendering,
+    "pager": benchmark_pager,
+    "startup": benchmark_startup,
+    "lookup_batch": benchmark_lookup_batch,
+    "serve": benchmark_serve,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="csv_show benchmarks")
+    parser.add_argument("benchmark", nargs="*", help="Benchmarks to run: " + ", ".join(benchmarks) +
+                                                      " (Default: all)")
+    parser.add_argument("-rows", type=int, default=1000000, help="Number of rows in generated tables")
+    args = parser.parse_args()
+    for name in args.benchmark or benchmarks:
+        if name not in benchmarks:
+            parser.error(f"Unknown benchmark: {name}")
+        benchmarks[name](args.rows)
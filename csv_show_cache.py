@@ -0,0 +1,154 @@
+import hashlib
+import locale
+import os
+import pickle
+import struct
+import tempfile
+
+from csv_show_columnar_db import CSVShowColumnarDB
+from csv_show_parallel import get_dialect_params
+from csv_show_shared import *
+
+
+# Parsed CSV files saved in a cache directory so later runs can skip parsing.  Each file is cached as its
+# columns (ColumnStore, dictionary encoded where possible) pickled one after the other, followed by a header
+# with the column names and the position of each column, so a run can load only the columns it uses.
+# The header also keeps the number of cells of each row when rows differ in length (see CSVShowColumnarDB).
+# A cache file is only used if the CSV file's size, modification time and the reading options still match.
+# The least recently used cache files are removed once the cache grows past max_size bytes.
+class CsvCache:
+    magic = b"CSVSHOW-CACHE-2\n"
+    suffix = ".csv_show_cache"
+    default_max_size = 1024 * 1024 * 1024
+
+    def __init__(self, cache_dir=None, max_size=None):
+        self.cache_dir = cache_dir or CsvCache.get_default_dir()
+        self.max_size = max_size if max_size is not None else CsvCache.default_max_size
+
+    @staticmethod
+    def get_default_dir():
+        if "CSV_SHOW_CACHE_DIR" in os.environ:
+            return os.environ["CSV_SHOW_CACHE_DIR"]
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(cache_home, "csv_show")
+
+    # Everything that changes the parsed table.  Only regular files can be cached.
+    @staticmethod
+    def make_key(file_name, dialect, has_header, encoding=None):
+        if file_name == "-" or not os.path.isfile(file_name):
+            return None
+        stat = os.stat(file_name)
+        return {"path": os.path.abspath(file_name), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                "dialect": get_dialect_params(dialect), "has_header": has_header,
+                "encoding": encoding or locale.getpreferredencoding(False)}
+
+    # The cache file name depends on the file and options but not on its size and time, so a changed file
+    # replaces its old cache entry
+    def get_cache_file_name(self, key):
+        name_key = repr([key["path"], sorted(key["dialect"].items()), key["has_header"], key["encoding"]])
+        return os.path.join(self.cache_dir, hashlib.sha1(name_key.encode()).hexdigest() + self.suffix)
+
+    # Returns the cached column names, or None if there is no valid cache entry for "key"
+    def read_column_names(self, key):
+        header = self.read_header(key)
+        return None if header is None else header["column_names"]
+
+    # Returns a CSVShowColumnarDB with the columns named in column_names (Default: all), or None
+    def load(self, key, column_names=None):
+        header = self.read_header(key)
+        if header is None:
+            return None
+        if column_names is None:
+            column_names = header["column_names"]
+        db = CSVShowColumnarDB(column_names=column_names)
+        with open(self.get_cache_file_name(key), "rb") as cache_file:
+            for col_num, name in enumerate(column_names):
+                offset, size = header["columns"][header["column_names"].index(name)]
+                cache_file.seek(offset)
+                db.columns[col_num] = pickle.loads(cache_file.read(size))
+        db.length = header["length"]
+        if column_names == header["column_names"]:
+            db.row_widths = header["row_widths"]  # Rows of only some columns have all of them
+        os.utime(self.get_cache_file_name(key))  # Mark as recently used for eviction
+        return db
+
+    def read_header(self, key):
+        if key is None:
+            return None
+        try:
+            with open(self.get_cache_file_name(key), "rb") as cache_file:
+                if cache_file.read(len(self.magic)) != self.magic:
+                    return None
+                cache_file.seek(-8, os.SEEK_END)
+                header_offset, = struct.unpack("<Q", cache_file.read(8))
+                cache_file.seek(header_offset)
+                header = pickle.load(cache_file)
+        except Exception:  # Missing, partly written or from another version: parse the file again
+            return None
+        return header if header.get("key") == key else None
+
+    def save(self, key, db):
+        if key is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        file_name = self.get_cache_file_name(key)
+        # Written under a temporary name first so other runs never see a partial cache file
+        fd, temp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as cache_file:
+                cache_file.write(self.magic)
+                db = self.get_columnar_db(db)
+                columns = []
+                for column in db.columns:
+                    offset = cache_file.tell()
+                    pickle.dump(column, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+                    columns.append((offset, cache_file.tell() - offset))
+                header_offset = cache_file.tell()
+                header = {"key": key, "column_names": list(db.column_names), "length": len(db), "columns": columns,
+                          "row_widths": db.row_widths}
+                pickle.dump(header, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+                cache_file.write(struct.pack("<Q", header_offset))
+            os.replace(temp_name, file_name)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+        self.evict()
+
+    @staticmethod
+    def get_columnar_db(db):
+        if isinstance(db, CSVShowColumnarDB):
+            return db
+        return CSVShowColumnarDB(db.rows, db.column_names)
+
+    def get_cache_files(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                if name.endswith(self.suffix)]
+
+    # Remove the least recently used cache files until the cache fits in max_size
+    def evict(self):
+        files = []
+        for file_name in self.get_cache_files():
+            try:
+                stat = os.stat(file_name)
+            except OSError:
+                continue  # Removed by another run
+            files.append((stat.st_mtime_ns, stat.st_size, file_name))
+        total_size = sum(size for mtime, size, file_name in files)
+        for mtime, size, file_name in sorted(files):
+            if total_size <= self.max_size:
+                break
+            self.remove(file_name)
+            total_size -= size
+
+    def clear(self):
+        for file_name in self.get_cache_files():
+            self.remove(file_name)
+
+    @staticmethod
+    def remove(file_name):
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,62 @@
+#!/bin/env python
+# Client for "csv_show.py -serve".  Sends its command line (the same arguments as csv_show.py) to the server
+# and prints what comes back.  Only light modules are imported here so it starts fast.
+import json
+import os
+import socket
+import sys
+
+
+# Without XDG_RUNTIME_DIR the socket goes in a directory of its own under /tmp, which the server makes
+# private.  Since anyone can make files in /tmp, run() also checks that the socket belongs to the user.
+def get_default_socket_path():
+    if "CSV_SHOW_SOCKET" in os.environ:
+        return os.environ["CSV_SHOW_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, f"csv_show-{os.getuid()}.sock")
+    return os.path.join("/tmp", f"csv_show-{os.getuid()}", "csv_show.sock")
+
+
+# Returns the exit code of the request.  The server answers with one JSON message per line:
+# {"stdout": text}, {"stderr": text} and finally {"exit": code}.
+def run(args, socket_path=None, stdout=None, stderr=None):
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    if "-serve" in args:
+        stderr.write("csv_show_client.py: -serve cannot be sent to a server\n")
+        return 2
+    socket_path = socket_path or get_default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            if os.stat(socket_path).st_uid != os.getuid():
+                raise OSError(f"{socket_path} belongs to another user")  # The arguments and output are private
+            client.connect(socket_path)
+        except OSError as e:
+            stderr.write(f"csv_show_client.py: no server (start one with csv_show.py -serve): {e}\n")
+            return 2
+        with client.makefile("rw", encoding="utf-8") as connection:
+            connection.write(json.dumps({"args": args, "cwd": os.getcwd()}) + "\n")
+            connection.flush()
+            for line in connection:
+                message = json.loads(line)
+                if "exit" in message:
+                    return message["exit"]
+                try:
+                    if "stdout" in message:
+                        stdout.write(message["stdout"])
+                    else:
+                        stderr.write(message["stderr"])
+                except BrokenPipeError:
+                    return 0  # Okay: The user piped to another program which didn't consume all the output
+    stderr.write("csv_show_client.py: the server closed the connection\n")
+    return 1
+
+
+if __name__ == "__main__":
+    exit_code = run(sys.argv[1:])
+    try:
+        sys.stdout.flush()
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    sys.exit(exit_code)
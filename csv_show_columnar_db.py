@@ -0,0 +1,366 @@
+import array
+import collections.abc
+
+from csv_show_db import CSVShowDB
+from csv_show_shared import *
+
+
+# The cells of one column.  While a column has few distinct values it is dictionary encoded: every distinct
+# value is stored once and each cell is a 2 byte code.  Past dictionary_limit distinct values the column
+# switches to a plain list of strings.
+class ColumnStore:
+    default_dictionary_limit = 65536
+
+    def __init__(self, cells=(), dictionary_limit=None):
+        self.dictionary_limit = dictionary_limit or ColumnStore.default_dictionary_limit
+        self.values = []
+        self.code_by_value = {}
+        self.codes = self.new_codes()
+        self.cells = None  # Plain list of strings once the column is no longer dictionary encoded
+        self.extend(cells)
+
+    def new_codes(self, codes=()):
+        typecode = "H" if self.dictionary_limit <= 0x10000 else "I"
+        return array.array(typecode, codes)
+
+    def is_encoded(self):
+        return self.cells is None
+
+    def get_code(self, value):
+        code = self.code_by_value.get(value)
+        if code is None and len(self.values) < self.dictionary_limit:
+            code = len(self.values)
+            self.values.append(value)
+            self.code_by_value[value] = code
+        return code
+
+    def decode_all(self):
+        self.cells = [self.values[code] for code in self.codes]
+        self.values = []
+        self.code_by_value = {}
+        self.codes = self.new_codes()
+
+    def append(self, value):
+        if self.cells is None:
+            code = self.get_code(value)
+            if code is not None:
+                self.codes.append(code)
+                return
+            self.decode_all()
+        self.cells.append(value)
+
+    def extend(self, cells):
+        for value in cells:
+            self.append(value)
+
+    def insert(self, position, value):
+        if self.cells is None:
+            code = self.get_code(value)
+            if code is not None:
+                self.codes.insert(position, code)
+                return
+            self.decode_all()
+        self.cells.insert(position, value)
+
+    def __getitem__(self, row_num):
+        if self.cells is None:
+            return self.values[self.codes[row_num]]
+        return self.cells[row_num]
+
+    def __setitem__(self, row_num, value):
+        if self.cells is None:
+            code = self.get_code(value)
+            if code is not None:
+                self.codes[row_num] = code
+                return
+            self.decode_all()
+        self.cells[row_num] = value
+
+    def __len__(self):
+        if self.cells is None:
+            return len(self.codes)
+        return len(self.cells)
+
+    def __iter__(self):
+        if self.cells is None:
+            return map(self.values.__getitem__, self.codes)
+        return iter(self.cells)
+
+    # Each value that appears in the column, once.  Per-value work (number parsing, widths) can be done here.
+    def distinct_values(self):
+        if self.cells is None:
+            return [self.values[code] for code in set(self.codes)]
+        return list(set(self.cells))
+
+    # Apply "function" once per distinct value and return the results in row order
+    def map_values(self, function):
+        if self.cells is None:
+            results = [function(value) for value in self.values]
+            return [results[code] for code in self.codes]
+        return [function(value) for value in self.cells]
+
+    # New column holding the cells at row_numbers (in that order)
+    def take(self, row_numbers):
+        new_column = ColumnStore(dictionary_limit=self.dictionary_limit)
+        if self.cells is None:
+            new_column.values = self.values.copy()
+            new_column.code_by_value = self.code_by_value.copy()
+            new_column.codes = self.new_codes(map(self.codes.__getitem__, row_numbers))
+        else:
+            new_column.cells = [self.cells[row_num] for row_num in row_numbers]
+        return new_column
+
+    def copy(self):
+        return self.take(range(len(self)))
+
+    # code_by_value is left out of pickles and rebuilt from values when loaded
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["code_by_value"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.code_by_value = {value: code for code, value in enumerate(self.values)}
+
+
+# A row of a columnar database.  Reads and writes go straight to the column stores.  "width" is the number of
+# cells the row has (None: one per column).
+class ColumnarRow(collections.abc.MutableSequence):
+    def __init__(self, columns, row_num, width=None):
+        self.columns = columns
+        self.row_num = row_num
+        self.width = width
+
+    def __getitem__(self, col_num):
+        if isinstance(col_num, slice):
+            return [column[self.row_num] for column in self.columns[:len(self)][col_num]]
+        return self.columns[col_num][self.row_num]
+
+    def __setitem__(self, col_num, value):
+        self.columns[col_num][self.row_num] = value
+
+    def __delitem__(self, col_num):
+        raise CSVShowError("Columns of a columnar database can only be changed through the database")
+
+    def insert(self, col_num, value):
+        raise CSVShowError("Columns of a columnar database can only be changed through the database")
+
+    def __len__(self):
+        return len(self.columns) if self.width is None else self.width
+
+    def __iter__(self):
+        row_num = self.row_num
+        columns = self.columns if self.width is None else self.columns[:self.width]
+        return (column[row_num] for column in columns)
+
+    def __eq__(self, other):
+        return isinstance(other, collections.abc.Sequence) and list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def copy(self):
+        return list(self)
+
+
+# Stands in for CSVShowDB.rows: a sequence of ColumnarRow
+class ColumnarRows(collections.abc.Sequence):
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, row_num):
+        if isinstance(row_num, slice):
+            return [self[i] for i in range(*row_num.indices(len(self)))]
+        if row_num < 0:
+            row_num += len(self)
+        if not 0 <= row_num < len(self):
+            raise IndexError("row number out of range")
+        return self.db.get_row(row_num)
+
+    def __len__(self):
+        return len(self.db)
+
+    def __iter__(self):
+        columns = self.db.columns
+        if self.db.row_widths is None:
+            return (ColumnarRow(columns, row_num) for row_num in range(len(self)))
+        return (ColumnarRow(columns, row_num, width) for row_num, width in enumerate(self.db.row_widths))
+
+    def __eq__(self, other):
+        return isinstance(other, collections.abc.Sequence) and len(self) == len(other) and \
+            all(row == other_row for row, other_row in zip(self, other))
+
+    def __repr__(self):
+        return repr([list(row) for row in self])
+
+
+# CSVShowDB that stores one ColumnStore per column instead of one list per row.
+# The column stores have a cell for every row, "" where a row is short.  Like the row lists of CSVShowDB, a
+# row still has only its own cells (padded up to the named columns), kept in row_widths when they differ.
+class CSVShowColumnarDB(CSVShowDB):
+    def __init__(self, new_db=None, column_names=[], dictionary_limit=None):
+        self.dictionary_limit = dictionary_limit
+        self.columns = []
+        self.length = 0
+        self.row_widths = None  # array of the number of cells in each row, None while every row has all columns
+        super().__init__(new_db, column_names)
+
+    @property
+    def rows(self):
+        return ColumnarRows(self)
+
+    @rows.setter
+    def rows(self, new_rows):
+        self.columns = [self.new_column() for _ in self.column_names]
+        self.length = 0
+        self.row_widths = None
+        self.invalidate_indexes()
+        self.add_rows(new_rows)
+
+    def new_column(self, cells=()):
+        return ColumnStore(cells, self.dictionary_limit)
+
+    def __len__(self):
+        return self.length
+
+    def clear(self):
+        self.column_names.clear()
+        self.columns.clear()
+        self.length = 0
+        self.row_widths = None
+        self.invalidate_indexes()
+
+    def get_row(self, row_num):
+        row = ColumnarRow(self.columns, row_num, None if self.row_widths is None else self.row_widths[row_num])
+        if self.rows_as_records:
+            return self.row_to_record(row)
+        else:
+            return row
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add_row(row)
+
+    def add_row(self, row):
+        if len(row) > len(self.column_names):
+            self.add_unnamed_column_names(len(row))
+        for col_num, column in enumerate(self.columns):
+            column.append(row[col_num] if col_num < len(row) else "")
+        self.insert_row_width(self.length, max(len(row), self.num_named_columns))
+        self.length += 1
+        self.add_row_to_indexes(self.length - 1, row)
+
+    def insert_row_width(self, position, width):
+        if self.row_widths is None:
+            if width == len(self.columns):
+                return
+            self.row_widths = array.array("I", [len(self.columns)] * self.length)
+        self.row_widths.insert(position, width)
+
+    def add_unnamed_column_names(self, new_width):
+        super().add_unnamed_column_names(new_width)
+        if len(self.columns) < len(self.column_names) and self.row_widths is None and self.length > 0:
+            self.row_widths = array.array("I", [len(self.columns)] * self.length)  # The rows so far are shorter
+        while len(self.columns) < len(self.column_names):
+            self.columns.append(self.new_column([""] * self.length))
+
+    def insert_column(self, new_column_name, position):
+        self.column_names.insert(position, None)  # Just open a gap, then set below
+        self.columns.insert(position, self.new_column([""] * self.length))
+        for i in range(position, len(self.column_names)):  # Cause column_number_by_name to be updated too
+            self.set_column_name(i, self.column_names[i] if i != position else new_column_name)
+        if self.row_widths is not None:
+            self.row_widths = array.array("I", (width + 1 for width in self.row_widths))
+        self.invalidate_indexes()
+
+    def insert_row(self, position, row):
+        if len(row) > len(self.column_names):
+            self.add_unnamed_column_names(len(row))
+        for col_num, column in enumerate(self.columns):
+            column.insert(position, row[col_num] if col_num < len(row) else "")
+        self.insert_row_width(position, len(row))
+        self.length += 1
+        self.invalidate_indexes()
+
+    def update_data_at_col_row(self, col, row, value):
+        self.columns[col][row] = value
+        self.invalidate_column_indexes(col)
+
+    def column_values(self, col_num):
+        return iter(self.columns[col_num])
+
+    # Dictionary encoded columns call "function" once per distinct value
+    def map_column_values(self, col_num, function):
+        return self.columns[col_num].map_values(function)
+
+    def select_rows_and_row_numbers(self, criteria):
+        row_numbers = self.select_row_numbers(criteria)
+        return [self.get_row(row_num) for row_num in row_numbers], row_numbers
+
+    def first_matching_row_number(self, criteria):
+        if self.get_indexed_relation(criteria) is not None:
+            return super().first_matching_row_number(criteria)
+        row_numbers = self.select_row_numbers(criteria)
+        return row_numbers[0] if row_numbers else None
+
+    def select(self, criteria):
+        return self.view(self.select_row_numbers(criteria), pad=True)
+
+    def grep(self, regex_list, regex_flags=None):
+        return self.view(self.grep_row_numbers(regex_list, regex_flags), pad=True)
+
+    def grep_row_numbers(self, regex_list, regex_flags=None):
+        if regex_flags is None:
+            regex_flags = self.regex_flags
+        line_matches = make_line_matcher(regex_list, regex_flags)
+        rows = zip(*self.columns)
+        if self.row_widths is not None:
+            rows = (row[:width] for row, width in zip(rows, self.row_widths))
+        return [row_num for row_num, row in enumerate(rows) if line_matches(" ".join(row))]
+
+    def sort(self, sort_col_names, reverse=False):
+        order = self.sort_order(sort_col_names, reverse)
+        self.columns = [column.take(order) for column in self.columns]
+        self.row_widths = self.take_row_widths(order)
+        self.set_reordered_typed_columns(self.typed_columns, order)
+
+    def select_columns(self, selected_columns):
+        selected_column_numbers = [self.column_number_by_name[column] for column in selected_columns]
+        new_db = CSVShowColumnarDB(column_names=selected_columns, dictionary_limit=self.dictionary_limit)
+        new_db.columns = [self.columns[col_num].copy() for col_num in selected_column_numbers]
+        new_db.length = self.length
+        return new_db
+
+    def head(self, k):
+        return self.take_rows(range(min(k, self.length)))
+
+    def tail(self, k):
+        return self.take_rows(range(max(self.length - k, 0), self.length))
+
+    def new_db(self, rows, column_names):
+        return CSVShowColumnarDB(rows, column_names, self.dictionary_limit)
+
+    # Column stores copy cheaply (dictionary encoded columns copy only their codes), so this is a copy
+    def view(self, row_numbers, column_numbers=None, column_names=None, pad=False):
+        new_db = self.take_rows(row_numbers)
+        if pad:
+            new_db.row_widths = None  # Every row has every column
+        if column_numbers is not None:
+            new_db = new_db.select_columns([self.column_names[col_num] for col_num in column_numbers])
+            if column_names is not None:
+                new_db.set_column_names(column_names)
+        return new_db
+
+    # New database with the rows at row_numbers (in that order)
+    def take_rows(self, row_numbers):
+        new_db = CSVShowColumnarDB(column_names=self.column_names, dictionary_limit=self.dictionary_limit)
+        new_db.columns = [column.take(row_numbers) for column in self.columns]
+        new_db.length = len(row_numbers)
+        new_db.row_widths = self.take_row_widths(row_numbers)
+        return new_db
+
+    def take_row_widths(self, row_numbers):
+        if self.row_widths is None:
+            return None
+        return array.array("I", map(self.row_widths.__getitem__, row_numbers))
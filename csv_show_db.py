@@ -1,20 +1,197 @@
 from csv_show_shared import *
-import re
+import bisect
+import collections
+import collections.abc
+import heapq
+import itertools
+import operator
+import weakref
+
+
+relational_operators = {"=": operator.eq,  # Be flexible and let user use = instead of ==
+                        "==": operator.eq, "!=": operator.ne,
+                        ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+
+# Test for one cell (by its truth value).  Numbers compare as numbers when both sides are numbers, otherwise
+# as strings.  Regexes are checked like a -grep of just that cell.
+def compile_relation_test(op, value, regex_flags=0):
+    if op in ["=~", "!~"]:
+        return make_line_matcher((value, op == "=~"), regex_flags)
+    if op not in relational_operators:
+        raise CSVShowError(f"Unsupported operator: {op}")
+    compare = relational_operators[op]
+    number = parse_number(value)
+    if number is None:
+        return lambda data: compare(data, value)
+
+    def test(data):
+        data_number = parse_number(data)
+        if data_number is None:
+            return compare(data, value)
+        return compare(data_number, number)
+    return test
+
+
+# Index over one column, built from the column values when first needed.
+# Equality uses a hash of the cell values (numbers are hashed by value so 0x10 finds 16).
+# Range relations bisect sorted lists, which are kept apart for numbers and strings because
+# two numbers compare as numbers while anything else compares as strings.
+class ColumnIndex:
+    range_ops = {">", ">=", "<", "<="}
+    equality_ops = {"=", "=="}
+
+    def __init__(self, column_name):
+        self.column_name = column_name
+        self.row_numbers_by_key = None
+        self.sorted_numbers = None  # ([number, ...], [row number, ...]) for the numeric cells
+        self.sorted_strings = None  # ([string, ...], [row number, ...]) for the other cells
+        self.sorted_all_strings = None  # ([string, ...], [row number, ...]) for every cell
+
+    def invalidate(self):
+        self.row_numbers_by_key = None
+        self.sorted_numbers = None
+        self.sorted_strings = None
+        self.sorted_all_strings = None
+
+    @staticmethod
+    def key_of(data):
+        number = parse_number(data)
+        return data if number is None else number
+
+    def add(self, row_num, data):
+        if self.row_numbers_by_key is not None:
+            self.row_numbers_by_key.setdefault(self.key_of(data), []).append(row_num)
+        self.sorted_numbers = None
+        self.sorted_strings = None
+        self.sorted_all_strings = None
+
+    def can_search(self, op):
+        return op in self.equality_ops or op in self.range_ops
+
+    # Row numbers (ascending) of the cells where "cell <op> value" holds.  "values" gives the column values.
+    def search(self, op, value, values):
+        if op in self.equality_ops:
+            if self.row_numbers_by_key is None:
+                self.build_hash(values())
+            return self.row_numbers_by_key.get(self.key_of(value), [])
+
+        if self.sorted_numbers is None:
+            self.build_sorted(values())
+        number = parse_number(value)
+        if number is None:
+            return sorted(self.search_sorted(self.sorted_all_strings, op, value))
+        return sorted(self.search_sorted(self.sorted_numbers, op, number) +
+                      self.search_sorted(self.sorted_strings, op, value))
+
+    @staticmethod
+    def search_sorted(sorted_keys_and_rows, op, key):
+        keys, row_numbers = sorted_keys_and_rows
+        if op == ">":
+            return row_numbers[bisect.bisect_right(keys, key):]
+        elif op == ">=":
+            return row_numbers[bisect.bisect_left(keys, key):]
+        elif op == "<":
+            return row_numbers[:bisect.bisect_left(keys, key)]
+        else:
+            return row_numbers[:bisect.bisect_right(keys, key)]
+
+    def build_hash(self, values):
+        self.row_numbers_by_key = {}
+        for row_num, data in enumerate(values):
+            self.row_numbers_by_key.setdefault(self.key_of(data), []).append(row_num)
+
+    def build_sorted(self, values):
+        numbers = []
+        strings = []
+        all_strings = []
+        for row_num, data in enumerate(values):
+            number = parse_number(data)
+            if number is None:
+                strings.append((data, row_num))
+            else:
+                numbers.append((number, row_num))
+            all_strings.append((data, row_num))
+        self.sorted_numbers = self.split_pairs(sorted(numbers))
+        self.sorted_strings = self.split_pairs(sorted(strings))
+        self.sorted_all_strings = self.split_pairs(sorted(all_strings))
+
+    @staticmethod
+    def split_pairs(pairs):
+        return [key for key, row_num in pairs], [row_num for key, row_num in pairs]
+
+
+# The number in each cell of one column (None where the cell is not a number), parsed once so sort and
+# select do not parse the same cells again.  all_numbers and no_numbers let them skip the mixed case.
+# values are the cells the numbers were parsed from, to tell whether the cells have changed since.
+class TypedColumn:
+    def __init__(self, values, numbers=None):
+        self.values = values
+        if numbers is None:
+            numbers = [parse_number(data) for data in values]
+        self.numbers = numbers
+        self.all_numbers = None not in numbers
+        self.no_numbers = numbers.count(None) == len(numbers)
+        self.type = None  # Worked out by CSVShowDB.column_type when asked for
+
+    # "int", "hex" or "float" when every non-empty cell is that kind of number, otherwise "string"
+    def infer_type(self):
+        number_types = set()
+        for number, data in zip(self.numbers, self.values):
+            if number is None:
+                if data.strip() != "":
+                    return "string"
+            elif isinstance(number, float):
+                number_types.add("float")
+            elif hex_regex.fullmatch(data.strip()):
+                number_types.add("hex")
+            else:
+                number_types.add("int")
+        if len(number_types) == 0:
+            return "string"
+        if "float" in number_types:
+            return "float"
+        return "hex" if number_types == {"hex"} else "int"
+
+    # The same column after the rows are reordered (or picked out) by row_numbers
+    def take(self, row_numbers):
+        typed_column = TypedColumn([self.values[row_num] for row_num in row_numbers],
+                                   [self.numbers[row_num] for row_num in row_numbers])
+        typed_column.type = self.type if len(row_numbers) == len(self.numbers) else None
+        return typed_column
 
 
 class CSVShowDB:
     def __init__(self, new_db=None, column_names=[]):
+        self.indexes = {}  # ColumnIndex by column name
+        self.typed_columns = {}  # TypedColumn by column number, made on first use
+        self.lookup_counts = {}  # Equality lookups per column name, used for auto_index_lookups
+        # Index a column after this many lookup_row calls on it.  Off (None) unless asked for: changing the rows
+        # lookup_row gives out is not seen by an index, so only turn it on where they are only read.
+        self.auto_index_lookups = None
         self.num_named_columns = 0
         self.__curr_row = 0
         self.rows_as_records = False
         self.column_names = []
         self.column_number_by_name = {}
-        self.rows = []
+        self.row_list = []
+        self.views = weakref.WeakValueDictionary()  # CSVShowDBView of "rows" by id, see detach_views
         self.set_column_names(column_names)
         if new_db is not None:
             self.add_rows(new_db)
         self.regex_flags = 0
 
+    # Assigning new rows drops the indexes and parsed numbers of the old ones.  Views keep the old list, and stay
+    # registered because the new rows may be the same row lists (as after sort): a later change copies them out.
+    @property
+    def rows(self):
+        return self.row_list
+
+    @rows.setter
+    def rows(self, new_rows):
+        self.row_list = new_rows
+        self.invalidate_indexes()
+
     def __iter__(self):
         self.__curr_row = 0
         return self
@@ -27,17 +204,22 @@ class CSVShowDB:
         return row
 
     def __eq__(self, other):
-        return isinstance(other, CSVShowDB) and other.rows == self.rows and other.column_names == self.column_names
+        return isinstance(other, CSVShowDB) and list(other.read_only_rows()) == list(self.read_only_rows()) \
+            and other.column_names == self.column_names
 
     def __repr__(self):
-        return f"Header: {self.column_names}\nData: {self.rows}"
+        return f"Header: {self.column_names}\nData: {list(self.read_only_rows())}"
 
     def __len__(self):
         return len(self.rows)
 
     def clear(self):
         self.column_names.clear()
-        self.rows.clear()
+        self.rows = []  # A new list: views made from this database still use the old one
+
+    # The rows for reading only.  Unlike "rows" this does not make a view copy its rows.
+    def read_only_rows(self):
+        return self.rows
 
     def get_row(self, row_num):
         if self.rows_as_records:
@@ -51,9 +233,11 @@ class CSVShowDB:
 
     def set_row_field(self, row, field_name: str, value: str):
         col = self.get_col_number(field_name)
+        self.detach_views()
         while len(row) < col + 1:
             row.append("")
         row[col] = value
+        self.invalidate_column_indexes(col)
 
     def row_to_record(self, row):
         return {key: val for key, val in zip(self.column_names, row)}
@@ -74,11 +258,17 @@ class CSVShowDB:
             self.add_row(row.copy())
 
     def add_row(self, row):
-        while len(row) < self.num_named_columns:
-            row.append("")
+        self.pad_row(row)
         self.rows.append(row)
         if len(row) > len(self.column_names):
             self.add_unnamed_column_names(len(row))
+        self.add_row_to_indexes(len(self.rows) - 1, row)
+
+    # Make sure a row has a field for every named column
+    def pad_row(self, row):
+        while len(row) < self.num_named_columns:
+            row.append("")
+        return row
 
     def add_unnamed_column_names(self, new_width):
         while len(self.column_names) < new_width:
@@ -87,15 +277,19 @@ class CSVShowDB:
             self.set_column_name(position, f"Col{position}")
 
     def insert_column(self, new_column_name, position):
+        self.detach_views()
         self.column_names.insert(position, None)  # Just open a gap, then set below
         self.set_column_name(position, new_column_name)
         for i in range(position, len(self.column_names)):  # Cause column_number_by_name to be updated too
             self.set_column_name(i, self.column_names[i])
         for row in self.rows:
             row.insert(position, "")
+        self.invalidate_indexes()
 
     def insert_row(self, position, row):
+        self.detach_views()
         self.rows.insert(position, row)
+        self.invalidate_indexes()
 
     def update_data(self, name, value, criteria):
         col_num = self.get_col_number(name)
@@ -104,75 +298,152 @@ class CSVShowDB:
             self.update_data_at_col_row(col_num, row_number, value)
 
     def update_data_at_col_row(self, col, row, value):
+        self.detach_views()
         self.rows[row][col] = value
+        self.invalidate_column_indexes(col)
+
+    # Views pick rows and columns of "rows" by number, so before insert_row, insert_column or a change of a cell
+    # moves or changes what they show, they copy their rows out (see CSVShowDBView)
+    def detach_views(self):
+        for view in list(self.views.values()):
+            view.materialize()
 
     def update_data_at_row(self, name, row, value):
         col_num = self.get_col_number(name)
         self.update_data_at_col_row(col_num, row, value)
 
+    # All the values in one column, in row order
+    def column_values(self, col_num):
+        return (row[col_num] if col_num < len(row) else "" for row in self.rows)
+
+    # [function(value) for each value of the column]
+    def map_column_values(self, col_num, function):
+        return [function(data) for data in self.column_values(col_num)]
+
+    # Parsed again when any cell of the column has changed since, even through db.rows or a shared row.
+    # Unchanged cells are the same string objects, so the check is cheap next to parsing them.
+    def get_typed_column(self, col_num):
+        values = list(self.column_values(col_num))
+        typed_column = self.typed_columns.get(col_num)
+        if typed_column is None or typed_column.values != values:
+            typed_column = TypedColumn(values)
+            self.typed_columns[col_num] = typed_column
+        return typed_column
+
+    # "int", "hex" or "float" when every non-empty cell of the column is that kind of number, otherwise "string"
+    def column_type(self, column_name):
+        col_num = self.get_col_number(column_name)
+        typed_column = self.get_typed_column(col_num)
+        if typed_column.type is None:
+            typed_column.type = typed_column.infer_type()
+        return typed_column.type
+
     def get_length(self):
-        return len(self.rows)
+        return len(self)
 
     def get_width(self):
         return len(self.column_names)
 
     def lookup_item(self, item_name, criteria, fail_if_not_found=False):
-        row = self.lookup_row(criteria)
+        row_num = self.lookup_row_number(criteria)
         col_num = self.get_col_number(item_name)
-        if row is None:
+        if row_num is None:
             if fail_if_not_found:
                 raise CSVShowError("Look up criteria did not yield a match.")
             return ""
         else:
-            return row[col_num]
+            return self.read_only_rows()[row_num][col_num]
 
     def lookup_row(self, criteria):
-        rows, row_numbers = self.select_rows_and_row_numbers(criteria)
-        if len(row_numbers) == 0:
+        row_num = self.lookup_row_number(criteria)
+        if row_num is None:
             return None
         else:
-            return self.get_row(row_numbers[0])
+            return self.get_row(row_num)
+
+    def lookup_row_number(self, criteria):
+        self.count_lookups(criteria)
+        return self.first_matching_row_number(criteria)
+
+    def first_matching_row_number(self, criteria):
+        row_matches = self.compile_criteria(criteria)
+        row_numbers = self.indexed_row_numbers(criteria)
+        if row_numbers is None:
+            row_numbers = range(len(self))
+        rows = self.read_only_rows()
+        for row_num in row_numbers:
+            if row_matches(rows[row_num]):
+                return row_num
+        return None
 
     def select(self, criteria):
-        rows, row_numbers = self.select_rows_and_row_numbers(criteria)
-        new_db = CSVShowDB(rows, self.column_names)
-        return new_db
+        return self.view(self.select_row_numbers(criteria), pad=True)
 
     def select_rows_and_row_numbers(self, criteria):
-        results_rows = []
-        results_row_numbers = []
-
-        # Find the rows where all match values are found
-        row_num = 0
-        for row_data in self.rows:
-            matches_found = 0
-            for relation in criteria:
-                # Relations are of the form [name, operator, value]
-                col_name = relation[0]
-                col_num = self.get_col_number(col_name)
-                op = relation[1]
-                if op == "=":  # Be flexible and let user use = instead of ==
-                    op = "=="
-                value = relation[2]
-                data = row_data[col_num]
-
-                if op == "=~":
-                    if re.search(value, data, flags=self.regex_flags):
-                        matches_found += 1
-                elif op == "!~":
-                    if not re.search(value, data, flags=self.regex_flags):
-                        matches_found += 1
-                else:
-                    if string_is_number(value) and string_is_number(data):
-                        value = string_to_number(value)
-                        data = string_to_number(data)
-                    if eval(f"data {op} value"):
-                        matches_found += 1
-            if matches_found == len(criteria):
-                results_rows.append(row_data)
-                results_row_numbers.append(row_num)
-            row_num += 1
-        return results_rows, results_row_numbers
+        row_numbers = self.select_row_numbers(criteria)
+        rows = self.read_only_rows()
+        return [rows[row_num] for row_num in row_numbers], row_numbers
+
+    # Row numbers of the rows where every relation matches.  Without an index the criteria are checked one
+    # column at a time, using the parsed numbers of the column for numeric comparisons.
+    def select_row_numbers(self, criteria):
+        row_numbers = self.indexed_row_numbers(criteria)
+        if row_numbers is not None:
+            row_matches = self.compile_criteria(criteria)
+            rows = self.read_only_rows()
+            return [row_num for row_num in row_numbers if row_matches(rows[row_num])]
+
+        row_numbers = range(len(self))
+        for relation in criteria:
+            matches = self.match_column(relation)
+            if isinstance(row_numbers, range):
+                row_numbers = list(itertools.compress(row_numbers, matches))
+            else:
+                row_numbers = [row_num for row_num in row_numbers if matches[row_num]]
+        return list(row_numbers)
+
+    # Whether each row's cell passes "relation", in row order
+    def match_column(self, relation):
+        col_name, op, value = relation
+        col_num = self.get_col_number(col_name)
+        number = parse_number(value) if op in relational_operators else None
+        if number is None:
+            return self.map_column_values(col_num, compile_relation_test(op, value, self.regex_flags))
+        compare = relational_operators[op]
+        typed_column = self.get_typed_column(col_num)
+        if typed_column.all_numbers:
+            return [compare(data_number, number) for data_number in typed_column.numbers]
+        if typed_column.no_numbers:
+            return self.map_column_values(col_num, lambda data: compare(data, value))
+        return [compare(data, value) if data_number is None else compare(data_number, number)
+                for data_number, data in zip(typed_column.numbers, typed_column.values)]
+
+    # Generator version of select for rows that are not stored in this database (e.g. rows being read)
+    def filter_rows(self, rows, criteria):
+        return filter(self.compile_criteria(criteria), rows)
+
+    def row_matches(self, row_data, criteria):
+        return self.compile_criteria(criteria)(row_data)
+
+    # Turn criteria into one function of a row that is True when every relation matches.
+    # Column numbers, operators, regexes and numeric values are worked out here, once, instead of per row.
+    def compile_criteria(self, criteria):
+        relations = [self.compile_relation(relation) for relation in criteria]
+        if len(relations) == 1:
+            col_num, test = relations[0]
+            return lambda row_data: test(row_data[col_num])
+
+        def row_matches(row_data):
+            for col_num, test in relations:
+                if not test(row_data[col_num]):
+                    return False
+            return True
+        return row_matches
+
+    # Relations are of the form [name, operator, value].  Returns the column number and a test of the cell data
+    def compile_relation(self, relation):
+        col_name, op, value = relation
+        return self.get_col_number(col_name), compile_relation_test(op, value, self.regex_flags)
 
     def get_col_number(self, name: str):
         if name not in self.column_names:
@@ -182,26 +453,95 @@ class CSVShowDB:
     #  regex input can be a string,  a tuple of the form (regex, positive_match_boolean), or a list of those tuples
     #  use False in the positive_match_boolean part of the tuple to invert the match similar to grep -v
     def grep(self, regex_list, regex_flags=None):
+        return self.view(self.grep_row_numbers(regex_list, regex_flags), pad=True)
+
+    def grep_row_numbers(self, regex_list, regex_flags=None):
         if regex_flags is None:
             regex_flags = self.regex_flags
-
-        new_rows = grep_rows(self.rows, regex_list, regex_flags)
-        new_db = CSVShowDB(new_rows, self.column_names)
-        return new_db
+        line_matches = make_line_matcher(regex_list, regex_flags)
+        return [row_num for row_num, row in enumerate(self.read_only_rows()) if line_matches(" ".join(row))]
 
     def sort(self, sort_col_names, reverse=False):
+        order = self.sort_order(sort_col_names, reverse)
+        typed_columns = self.typed_columns
+        rows = self.rows
+        self.rows = [rows[row_num] for row_num in order]
+        self.set_reordered_typed_columns(typed_columns, order)
+
+    # Row numbers in sorted order.  Keys come from the parsed numbers of each sort column and are in the
+    # same order as make_row_sort_key gives.  Columns of only numbers or only strings need no key tuples.
+    def sort_order(self, sort_col_names, reverse=False):
         if len(sort_col_names) == 0:
             sort_col_names = self.column_names
-        sort_col_nums = [self.get_col_number(name) for name in sort_col_names]
+        key_columns = [self.get_sort_keys(self.get_col_number(name)) for name in sort_col_names]
+        keys = key_columns[0] if len(key_columns) == 1 else list(zip(*key_columns))
+        return sorted(range(len(self)), reverse=reverse, key=keys.__getitem__)
+
+    def get_sort_keys(self, col_num):
+        typed_column = self.get_typed_column(col_num)
+        if typed_column.all_numbers:
+            return typed_column.numbers
+        if typed_column.no_numbers:
+            return typed_column.values
+        return [string_sort_key(data) if number is None else (1, number)
+                for number, data in zip(typed_column.numbers, typed_column.values)]
+
+    # Keep the parsed numbers from before the rows were put in "order".  Indexes are rebuilt on next use.
+    def set_reordered_typed_columns(self, typed_columns, order):
+        self.invalidate_indexes()
+        self.typed_columns = {col_num: typed_column.take(order) for col_num, typed_column in typed_columns.items()}
+
+    # The first k rows that sort() would give, found with a bounded heap in O(n log k) time and O(k) memory.
+    # "rows" can be any iterable of rows with this database's columns, e.g. rows as they are being read.
+    # Use from_end=True for the last k rows instead.
+    def top_k(self, sort_col_names, k, reverse=False, rows=None, from_end=False):
+        if len(sort_col_names) == 0:
+            sort_col_names = self.column_names
+        if rows is None:
+            rows = self.read_only_rows()
+        key = make_row_sort_key([self.get_col_number(name) for name in sort_col_names])
+        if not from_end:
+            top_rows = (heapq.nlargest if reverse else heapq.nsmallest)(k, rows, key=key)
+        else:
+            # Equal rows keep their original order, so the last k also means the last of the equal rows.
+            # The row number is part of the heap key to get that right.
+            row_numbers = (-row_num if reverse else row_num for row_num in itertools.count())
+            decorated = ((key(row), row_num, row) for row, row_num in zip(rows, row_numbers))
+            top_rows = [row for row_key, row_num, row in (heapq.nsmallest if reverse else heapq.nlargest)(k, decorated)]
+            top_rows.reverse()
+        return self.new_db(top_rows, self.column_names)
+
+    # Sorted rows as an iterator, using at most about memory_budget bytes: sorted runs of rows are
+    # spilled to temporary files and merged.  Like top_k, "rows" can be rows that are still being read.
+    def iter_sorted(self, sort_col_names, reverse=False, rows=None, memory_budget=256 * 1024 * 1024):
+        from csv_show_external_sort import ExternalSorter
+        if len(sort_col_names) == 0:
+            sort_col_names = self.column_names
+        if rows is None:
+            rows = self.read_only_rows()
+        key = make_row_sort_key([self.get_col_number(name) for name in sort_col_names])
+        return ExternalSorter(key, reverse, memory_budget).sort(rows)
+
+    def head(self, k):
+        return self.view(range(min(k, len(self))))
+
+    def tail(self, k):
+        return self.view(range(max(len(self) - k, 0), len(self)))
+
+    # Databases returned by top_k etc. are made here
+    def new_db(self, rows, column_names):
+        return CSVShowDB(rows, column_names)
 
-        def key_func(row):
-            return RowComparable(row, sort_col_nums)
-        self.rows = sorted(self.rows, reverse=reverse, key=key_func)
+    # Databases returned by select, grep, select_columns, head and tail are made here: the rows at row_numbers
+    # and the columns at column_numbers (None for all of them), sharing this database's rows.  With "pad" (select
+    # and grep) rows shorter than the column names are given out padded with "", as a new database's are.
+    def view(self, row_numbers, column_numbers=None, column_names=None, pad=False):
+        return CSVShowDBView(self, self.rows, row_numbers, column_numbers,
+                             column_names if column_names is not None else self.column_names, pad)
 
     def select_columns(self, selected_columns):
         selected_column_numbers = [self.column_number_by_name[column] for column in selected_columns]
-        new_rows = [self.get_row_with_columns_by_number(row, selected_column_numbers) for row in self.rows]
-        return CSVShowDB(new_rows, selected_columns)
+        return self.view(range(len(self)), selected_column_numbers, selected_columns)
 
     @staticmethod
     def get_row_with_columns_by_number(row, selected_column_numbers):
@@ -210,3 +550,207 @@ class CSVShowDB:
             new_row.append(row[column_number])
         return new_row
 
+    # Function that does get_row_with_columns_by_number, for use on many rows
+    @staticmethod
+    def get_column_projection(selected_column_numbers):
+        if len(selected_column_numbers) == 0:
+            return lambda row: []
+        if len(selected_column_numbers) == 1:
+            column_number = selected_column_numbers[0]
+            return lambda row: [row[column_number]]
+        get_columns = operator.itemgetter(*selected_column_numbers)
+        return lambda row: list(get_columns(row))
+
+    # Indexes make select, lookup_row and lookup_item on this column avoid a full scan.
+    # They are built on first use and kept up to date by add_row, insert_row, update_data and sort.
+    # Call invalidate_indexes() after changing cells through db.rows directly.  The parsed numbers kept for
+    # sort and select (typed_columns) check themselves against the cells.
+    def create_index(self, column_name):
+        self.get_col_number(column_name)  # Fail early on a bad name
+        if column_name not in self.indexes:
+            self.indexes[column_name] = ColumnIndex(column_name)
+
+    def drop_index(self, column_name):
+        self.indexes.pop(column_name, None)
+
+    def invalidate_indexes(self):
+        for index in self.indexes.values():
+            index.invalidate()
+        self.typed_columns = {}
+
+    def invalidate_column_indexes(self, col_num):
+        for column_name, index in self.indexes.items():
+            if self.column_number_by_name.get(column_name) == col_num:
+                index.invalidate()
+        self.typed_columns.pop(col_num, None)
+
+    def add_row_to_indexes(self, row_num, row):
+        if len(self.typed_columns) > 0:
+            self.typed_columns = {}
+        for column_name, index in self.indexes.items():
+            col_num = self.column_number_by_name[column_name]
+            index.add(row_num, row[col_num] if col_num < len(row) else "")
+
+    # Row numbers worth checking against criteria, or None when no index applies and all rows must be checked.
+    # Equality relations are preferred since they narrow the search the most.
+    def indexed_row_numbers(self, criteria):
+        relation = self.get_indexed_relation(criteria)
+        if relation is None:
+            return None
+        column_name, op, value = relation
+        col_num = self.get_col_number(column_name)
+        return self.indexes[column_name].search(op, value, lambda: self.column_values(col_num))
+
+    def get_indexed_relation(self, criteria):
+        usable = [relation for relation in criteria
+                  if relation[0] in self.indexes and self.indexes[relation[0]].can_search(relation[1])]
+        if len(usable) == 0:
+            return None
+        usable.sort(key=lambda relation: relation[1] not in ColumnIndex.equality_ops)
+        return usable[0]
+
+    def count_lookups(self, criteria):
+        if self.auto_index_lookups is None:
+            return
+        for column_name, op, value in criteria:
+            if op in ColumnIndex.equality_ops and column_name not in self.indexes:
+                self.lookup_counts[column_name] = self.lookup_counts.get(column_name, 0) + 1
+                if self.lookup_counts[column_name] >= self.auto_index_lookups and column_name in self.column_names:
+                    self.create_index(column_name)
+
+
+# The base rows of a view, with the rows the view has given out through get_row replaced by its own copies.
+# Views made from the view after that pick from these too.
+class CopiedRows(collections.abc.Sequence):
+    def __init__(self, base_rows):
+        self.base_rows = base_rows
+        self.copies = {}  # Copied row by base row number
+
+    def __getitem__(self, row_num):
+        row = self.copies.get(row_num)
+        return self.base_rows[row_num] if row is None else row
+
+    def __len__(self):
+        return len(self.base_rows)
+
+    def copy_row(self, row_num):
+        row = self.copies.get(row_num)
+        if row is None:
+            row = self.copies[row_num] = self.base_rows[row_num].copy()
+        return row
+
+
+# Stands in for CSVShowDB.rows of a view, for reading: the base rows at row_numbers with the columns at
+# column_numbers.  Without column_numbers the base's own row lists are given out, or padded copies of those
+# shorter than "width".
+class ViewRows(collections.abc.Sequence):
+    def __init__(self, base_rows, row_numbers, column_numbers, width=None):
+        self.base_rows = base_rows
+        self.row_numbers = row_numbers
+        if column_numbers is not None:
+            self.projection = CSVShowDB.get_column_projection(column_numbers)
+        elif width is not None:
+            self.projection = lambda row: row if len(row) >= width else row + [""] * (width - len(row))
+        else:
+            self.projection = None
+
+    def __getitem__(self, row_num):
+        if isinstance(row_num, slice):
+            return list(self.iter_rows(self.row_numbers[row_num]))
+        row = self.base_rows[self.row_numbers[row_num]]
+        return row if self.projection is None else self.projection(row)
+
+    def __len__(self):
+        return len(self.row_numbers)
+
+    def __iter__(self):
+        return self.iter_rows(self.row_numbers)
+
+    def iter_rows(self, row_numbers):
+        rows = map(self.base_rows.__getitem__, row_numbers)
+        return rows if self.projection is None else map(self.projection, rows)
+
+
+# What select, grep, select_columns, head and tail return: picked rows and columns of a base database,
+# without copying them.  Views of a view pick from the same base rows, so a chain of them costs
+# O(selected rows) and no row is copied.  Sorting a view only reorders its row numbers.
+# Asking for "rows" copies the picked cells into new rows and turns the view into an ordinary CSVShowDB, so
+# changes never reach the base.  get_row (and lookup_row) copy just that row into the view (see CopiedRows) and
+# give the copy, so set_row_field on it sticks; a view of some columns is copied whole first.  The base does the same
+# copying for its views before insert_row, insert_column, update_data or set_row_field; changing its rows in
+# place through "rows" does show through its views.
+class CSVShowDBView(CSVShowDB):
+    def __init__(self, base, base_rows, row_numbers, column_numbers, column_names, pad=False):
+        super().__init__(column_names=column_names)
+        self.base = base
+        self.base_rows = base_rows
+        self.row_numbers = row_numbers
+        self.column_numbers = column_numbers
+        self.pad = pad
+        self.copied_rows = None  # The CopiedRows standing in for base_rows once get_row has copied a row
+        base.views[id(self)] = self
+
+    @property
+    def rows(self):
+        self.materialize()
+        return self.row_list
+
+    @rows.setter
+    def rows(self, new_rows):
+        self.materialize(new_rows)
+        self.invalidate_indexes()
+
+    def materialize(self, rows=None):
+        if rows is None and self.copied_rows is not None:
+            rows = list(map(self.copied_rows.copy_row, self.row_numbers))  # Keeps the rows get_row gave out
+        elif rows is None:
+            rows = self.read_only_rows()
+            rows = [row.copy() for row in rows] if self.column_numbers is None else list(rows)
+        if self.pad and self.column_numbers is None:
+            for row in rows:
+                self.pad_row(row)
+        self.base.views.pop(id(self), None)
+        del self.base, self.base_rows, self.row_numbers, self.column_numbers, self.copied_rows, self.pad
+        self.__class__ = CSVShowDB  # Indexes and typed columns stay valid: the rows are in the same order
+        self.row_list = rows
+
+    def read_only_rows(self):
+        return ViewRows(self.base_rows, self.row_numbers, self.column_numbers,
+                        len(self.column_names) if self.pad else None)
+
+    def __len__(self):
+        return len(self.row_numbers)
+
+    def get_row(self, row_num):
+        if self.column_numbers is not None:
+            return super().get_row(row_num)  # Materializes
+        if self.copied_rows is None:
+            self.base_rows = self.copied_rows = CopiedRows(self.base_rows)
+        row = self.copied_rows.copy_row(self.row_numbers[row_num])
+        if self.pad:
+            self.pad_row(row)
+        return self.row_to_record(row) if self.rows_as_records else row
+
+    def column_values(self, col_num):
+        if self.column_numbers is not None:
+            col_num = self.column_numbers[col_num]
+        rows = map(self.base_rows.__getitem__, self.row_numbers)
+        return (row[col_num] if col_num < len(row) else "" for row in rows)
+
+    def sort(self, sort_col_names, reverse=False):
+        order = self.sort_order(sort_col_names, reverse)
+        row_numbers = self.row_numbers
+        self.row_numbers = [row_numbers[row_num] for row_num in order]
+        self.set_reordered_typed_columns(self.typed_columns, order)
+
+    def view(self, row_numbers, column_numbers=None, column_names=None, pad=False):
+        if isinstance(row_numbers, range):  # head, tail and select_columns
+            row_numbers = self.row_numbers[row_numbers.start:row_numbers.stop:row_numbers.step]
+        else:
+            row_numbers = [self.row_numbers[row_num] for row_num in row_numbers]
+        if column_numbers is None:
+            column_numbers = self.column_numbers
+        elif self.column_numbers is not None:
+            column_numbers = [self.column_numbers[col_num] for col_num in column_numbers]
+        return CSVShowDBView(self.base, self.base_rows, row_numbers, column_numbers,
+                             column_names if column_names is not None else self.column_names, pad or self.pad)
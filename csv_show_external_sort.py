@@ -0,0 +1,82 @@
+import heapq
+import itertools
+import pickle
+import tempfile
+
+
+# Sorts rows that may not fit in memory.  Rows are collected until they use about memory_budget bytes,
+# each chunk is sorted and written to a temporary file as a sorted run, and the runs are merged.
+# Both steps are stable, so the result is the same as sorted(rows, key=key, reverse=reverse).
+class ExternalSorter:
+    row_overhead = 56  # Approximate size of a list object
+    cell_overhead = 57  # Approximate size of an empty str plus its pointer in the list
+    rows_per_batch = 1000  # Rows are pickled in batches to cut per-row overhead
+    max_open_runs = 64  # Runs are merged in groups of this size so the number of open files stays bounded
+
+    def __init__(self, key, reverse=False, memory_budget=256 * 1024 * 1024, temp_dir=None):
+        self.key = key
+        self.reverse = reverse
+        self.memory_budget = memory_budget
+        self.temp_dir = temp_dir
+        self.runs_written = 0
+
+    @classmethod
+    def row_size(cls, row):
+        return cls.row_overhead + cls.cell_overhead * len(row) + sum(map(len, row))
+
+    def sort(self, rows):
+        runs = []
+        try:
+            chunk = []
+            chunk_size = 0
+            for row in rows:
+                chunk.append(row)
+                chunk_size += self.row_size(row)
+                if chunk_size >= self.memory_budget:
+                    runs.append(self.write_run(self.sort_chunk(chunk)))
+                    chunk = []
+                    chunk_size = 0
+            if len(runs) == 0:  # Everything fit in memory
+                yield from self.sort_chunk(chunk)
+                return
+            if len(chunk) > 0:
+                runs.append(self.write_run(self.sort_chunk(chunk)))
+            del chunk
+
+            while len(runs) > self.max_open_runs:
+                group = runs[:self.max_open_runs]
+                runs = runs[self.max_open_runs:]
+                runs.insert(0, self.write_run(self.merge_runs(group)))
+                for run in group:
+                    run.close()
+            yield from self.merge_runs(runs)
+        finally:
+            for run in runs:
+                run.close()
+
+    def sort_chunk(self, chunk):
+        return sorted(chunk, key=self.key, reverse=self.reverse)
+
+    def merge_runs(self, runs):
+        return heapq.merge(*[self.read_run(run) for run in runs], key=self.key, reverse=self.reverse)
+
+    def write_run(self, rows):
+        run = tempfile.TemporaryFile(dir=self.temp_dir)
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.rows_per_batch))
+            if len(batch) == 0:
+                break
+            pickle.dump(batch, run, protocol=pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self.runs_written += 1
+        return run
+
+    @staticmethod
+    def read_run(run):
+        while True:
+            try:
+                batch = pickle.load(run)
+            except EOFError:
+                return
+            yield from batch
@@ -1,17 +1,73 @@
 import collections
+import itertools
+import math
+import operator
 import re
 
 from csv_show_db import CSVShowDB
+from csv_show_columnar_db import CSVShowColumnarDB
+
+
+# Longest cell of each column, and optionally a histogram of cell widths.  Rows can be added a block at a time
+# as they are read, each block is measured a column at a time with bulk len()/max().
+class ColumnWidths:
+    def __init__(self, collect_histograms=False):
+        self.collect_histograms = collect_histograms
+        self.longest_by_col = []
+        self.histograms = []  # One collections.Counter of widths per column
+
+    def add_columns(self, num_columns):
+        while len(self.longest_by_col) < num_columns:
+            self.longest_by_col.append(0)
+            self.histograms.append(collections.Counter())
+
+    def add_rows(self, rows):
+        if len(rows) == 0:
+            return
+        num_columns = max(map(len, rows))
+        if min(map(len, rows)) == num_columns:
+            columns = zip(*rows)
+        else:  # Short rows have no cell to measure in their missing columns
+            columns = ([cell for cell in column if cell is not None]
+                       for column in itertools.zip_longest(*rows, fillvalue=None))
+        for col_num, column in enumerate(columns):
+            self.add_column(col_num, column)
+
+    def add_column(self, col_num, cells):
+        self.add_columns(col_num + 1)
+        if self.collect_histograms:
+            widths = collections.Counter(map(len, cells))
+            self.histograms[col_num].update(widths)
+            longest = max(widths, default=0)
+        else:
+            longest = max(map(len, cells), default=0)
+        if longest > self.longest_by_col[col_num]:
+            self.longest_by_col[col_num] = longest
+
+    # Smallest width that "percentile" percent of the column's cells fit in (needs collect_histograms)
+    def get_percentile_width(self, col_num, percentile):
+        histogram = self.histograms[col_num]
+        rank = math.ceil(sum(histogram.values()) * percentile / 100)
+        count = 0
+        for width in sorted(histogram):
+            count += histogram[width]
+            if count >= rank:
+                return width
+        return 0
 
 
 class CsvPrintFormatter:
     def __init__(self):
         self.width_histograms = {}  # Dict of Dict  h[col_name][width]=count
+        self.collect_width_histograms = True
+        self.block_size = 512  # Rows measured per bulk pass.  Small blocks transpose faster than large ones
         self.max_width_by_name = collections.OrderedDict()
         self.db = CSVShowDB()
         self.has_header = True
         self.column_numbers_by_name = collections.OrderedDict()
         self.longest_by_col = []
+        self.width_sample_size = None  # Measure only the header and this many rows, so output starts right away
+        self.width_percentile = None  # Fit this percent of each column's cells instead of the longest one
 
     def set_db(self, db: CSVShowDB):
         self.db = db
@@ -20,66 +76,112 @@ class CsvPrintFormatter:
         return "\n".join(self.format_output_as_lines())
 
     def format_output_as_lines(self):
-        output = []
-        self.find_longest_column_widths()
+        return list(self.iter_output_as_lines(self.db.read_only_rows()))
+
+    # Generator version of format_output_as_lines.  Without width_sample_size "rows" must be the database's rows,
+    # since every row is measured first.  With it only the first rows are measured and lines are made while
+    # the rest of the rows are still being read.  Cells wider than their column are truncated with "*".
+    def iter_output_as_lines(self, rows):
+        rows = iter(rows)
+        column_names = self.db.column_names
+        if self.width_sample_size is None:
+            self.find_longest_column_widths()
+            sample_rows = []
+        else:
+            sample_rows = list(itertools.islice(rows, self.width_sample_size))
+            column_names = self.get_sample_column_names(sample_rows)
+            self.find_sample_column_widths(sample_rows, column_names)
 
+        render = self.make_row_renderer(self.longest_by_col)
         if self.has_header:
-            output.append(self.format_row(self.db.column_names, self.longest_by_col))
-            output.append(self.format_row(["-" * x for x in self.longest_by_col], self.longest_by_col))
+            yield render(column_names)
+            yield render(["-" * x for x in self.longest_by_col])
 
-        for row in self.db.rows:
-            output.append(self.format_row(row, self.longest_by_col))
-        return output
+        yield from map(render, itertools.chain(sample_rows, rows))
 
     def format_output_as_csv(self):
-        output = []
+        return list(self.iter_output_as_csv(self.db.read_only_rows()))
+
+    # Generator version of format_output_as_csv so rows can be printed while they are still being read
+    def iter_output_as_csv(self, rows):
         if self.has_header:
-            output.append(",".join(self.db.column_names))
-        for row in self.db.rows:
-            output.append(",".join(row))
-        return output
+            yield ",".join(self.db.column_names)
+        for row in rows:
+            yield ",".join(row)
 
     @classmethod
     def format_row(cls, row, col_widths):
-        row_str = ""
-        for col_num in range(len(row)):
-            if col_num == 0:
-                row_str += "|"
-            width = col_widths[col_num]
-            data = row[col_num]
-            if len(data) > width:  # Remove a character to make room for truncation indicator
-                width -= 1
-            fmt = "{item:" + f"{width}" + "." + f"{width}" "}"
-            if width > 0:
-                row_str += fmt.format(item=data)
+        return cls.make_row_renderer(col_widths)(row)
+
+    # Function that renders a row for these column widths.  A row with a cell per column and no cell too wide
+    # takes one str.format call on a template made here, other rows are rendered cell by cell.
+    # Empty columns get no field: "{:0.0}" is an error before Python 3.10.
+    @classmethod
+    def make_row_renderer(cls, col_widths):
+        col_widths = list(col_widths)
+        template = "|" + "".join(f"{{{col_num}:{width}.{width}}}|" if width > 0 else "|"
+                                 for col_num, width in enumerate(col_widths))
+        num_columns = len(col_widths)
+
+        def render(row):
+            if len(row) == num_columns and all(map(operator.le, map(len, row), col_widths)):
+                return template.format(*row) if num_columns > 0 else ""
+            return cls.render_cell_by_cell(row, col_widths)
+        return render
+
+    @staticmethod
+    def render_cell_by_cell(row, col_widths):
+        cells = []
+        for col_num, data in enumerate(row):
+            width = col_widths[col_num] if col_num < len(col_widths) else len(data)  # Column not in the sample
             if len(data) > width:  # Indicate truncation to the user with a "*"
-                row_str += "*"
-            row_str += "|"
-        return row_str
+                cells.append(data[:max(width - 1, 0)] + "*")
+            else:
+                cells.append(data.ljust(width))
+        return "|" + "|".join(cells) + "|" if cells else ""
 
     def find_longest_column_widths(self):
-        self.longest_by_col = []
-        rows_including_header = [self.db.column_names] + self.db.rows
-        for row in rows_including_header:
-            for col_num in range(len(row)):
-                col_width = len(row[col_num])
-                self.update_width_histograms(col_num, col_width)
-                self.update_longest_by_col_num(col_num, col_width)
-        self.apply_width_caps()
+        widths = self.new_column_widths()
+        if isinstance(self.db, CSVShowColumnarDB):
+            for col_num, column in enumerate(self.db.columns):
+                if column.is_encoded() and not widths.collect_histograms:
+                    column = column.distinct_values()  # Each distinct value is measured once
+                widths.add_column(col_num, column)
+        else:
+            self.add_rows_to_column_widths(widths, self.db.read_only_rows())
+        self.set_column_widths(widths)
 
-    def update_width_histograms(self, col_num, col_width):
-        col_name = self.db.column_names[col_num]
-        if col_name not in self.width_histograms:
-            self.width_histograms[col_name] = {}
-        if col_width not in self.width_histograms[col_name]:
-            self.width_histograms[col_name][col_width] = 0
-        self.width_histograms[col_name][col_width] += 1
+    # The rows are not in the database, so sample rows longer than its column names (or rows without a header)
+    # have columns it does not name yet.  They get the names CSVShowDB.add_row would give them.
+    def get_sample_column_names(self, sample_rows):
+        column_names = self.db.column_names
+        num_columns = max(map(len, sample_rows), default=0)
+        return column_names + [f"Col{col_num}" for col_num in range(len(column_names), num_columns)]
 
-    def update_longest_by_col_num(self, col_num, col_width):
-        if len(self.longest_by_col) <= col_num:
-            self.longest_by_col.append(0)
-        if col_width > self.longest_by_col[col_num]:
-            self.longest_by_col[col_num] = col_width
+    def find_sample_column_widths(self, sample_rows, column_names=None):
+        widths = self.new_column_widths(column_names)
+        self.add_rows_to_column_widths(widths, sample_rows)
+        self.set_column_widths(widths)
+
+    def new_column_widths(self, column_names=None):
+        widths = ColumnWidths(self.collect_width_histograms or self.width_percentile is not None)
+        widths.add_rows([self.db.column_names if column_names is None else column_names])
+        return widths
+
+    def add_rows_to_column_widths(self, widths, rows):
+        for start in range(0, len(rows), self.block_size):
+            widths.add_rows(rows[start:start + self.block_size])
+
+    def set_column_widths(self, widths):
+        self.longest_by_col = widths.longest_by_col
+        if self.width_percentile is not None:
+            # At least 2 wide, the smallest -max_width, so a cut cell still shows a character and its "*"
+            self.longest_by_col = [max(widths.get_percentile_width(col_num, self.width_percentile), min(longest, 2))
+                                   for col_num, longest in enumerate(widths.longest_by_col)]
+        if self.collect_width_histograms:
+            self.width_histograms = {col_name: dict(histogram)
+                                     for col_name, histogram in zip(self.db.column_names, widths.histograms)}
+        self.apply_width_caps()
 
     def apply_width_caps(self):
         for col_name in self.max_width_by_name.keys():
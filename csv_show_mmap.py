@@ -0,0 +1,208 @@
+import codecs
+import csv
+import io
+import locale
+import mmap
+import os
+import re
+
+from csv_show_parallel import ascii_compatible_encodings
+from csv_show_shared import *
+
+
+# Non-ASCII characters that re.IGNORECASE treats as the same letter as an ASCII letter
+unicode_case_variants = {"i": "İı", "k": "K", "s": "ſ"}
+
+
+# Reads a regular file through mmap and skips records that cannot pass the -pregrep/-grep terms without
+# decoding or parsing them.  Terms that are plain text are searched for in the raw bytes: a required term
+# is searched across the whole file, so the records between hits are never looked at one by one.
+# Records are found as in ParallelCsvReader: a newline ends a record after an even number of quote characters.
+# The checks here only skip records that are sure to fail; the surviving records go through the usual grep.
+class MmapCsvReader:
+    sample_size = 1 << 16  # Bytes of the file that set_filters looks at, in sample_chunks pieces
+    sample_chunks = 16
+    selective_share = 0.05  # Above this share of lines holding the searched term, text reading is faster
+
+    def __init__(self, file_name, dialect, encoding=None):
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.delimiter = dialect.delimiter
+        self.quote = dialect.quotechar.encode("ascii") if dialect.quotechar else None
+        self.required = []  # Compiled bytes patterns that a record must contain
+        self.excluded = []  # Compiled bytes patterns that a record must not contain
+        self.exempt_records = 0  # Leading records (the header) that are passed on without checks
+        self.count_skipped = False  # Whether to keep the number of fields of the widest skipped record
+        self.skipped = WidestRow()
+        delimiter = self.delimiter.encode("ascii")
+        self.delimiter_runs = re.compile(re.escape(delimiter) + b"+")
+        self.delimiter_only = bytes.maketrans(b"\r", b"\n"), bytes(set(range(256)) - set(delimiter + b"\r\n"))
+        self.quoted_text = None
+        if self.quote is not None:
+            quote = re.escape(self.quote)
+            self.quoted_text = re.compile(quote + b"[^" + quote + b"]*" + quote)
+        self.file = open(file_name, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def can_read(file_name, dialect, encoding=None):
+        if file_name == "-" or file_name.endswith(".gz") or not os.path.isfile(file_name):
+            return False
+        if os.path.getsize(file_name) == 0:  # Cannot be mapped
+            return False
+        encoding = encoding or locale.getpreferredencoding(False)
+        if codecs.lookup(encoding).name not in ascii_compatible_encodings:
+            return False
+        quotechar = dialect.quotechar
+        return dialect.escapechar is None and dialect.doublequote and quotechar is not None and \
+            dialect.quoting != csv.QUOTE_NONE and len(quotechar) == 1 and ord(quotechar) < 0x80 and \
+            ord(dialect.delimiter) < 0x80
+
+    # Takes the regexes that a row must and must not match.  Returns False unless a required term can be searched
+    # for in the raw bytes and holds back most records: otherwise reading the file as text is faster, as the
+    # records between hits are not skipped in bulk and each record is still checked here.
+    def set_filters(self, required_terms, excluded_terms, regex_flags):
+        self.required = [pattern for pattern in (self.make_pattern(regex, regex_flags) for regex in required_terms)
+                         if pattern is not None]
+        self.excluded = [pattern for pattern in (self.make_pattern(regex, regex_flags, required=False)
+                                                 for regex in excluded_terms)
+                         if pattern is not None]
+        # The longest term is likely the rarest, so it is the one searched for across the file
+        self.required.sort(key=lambda pattern: len(pattern.pattern), reverse=True)
+        return len(self.required) > 0 and self.is_selective(self.required[0])
+
+    # Whether "pattern" is found on at most selective_share of the lines in a few samples spread over the file
+    def is_selective(self, pattern):
+        size = len(self.map)
+        chunk_size = self.sample_size // self.sample_chunks
+        hits = lines = 0
+        for start in sorted({size * part // self.sample_chunks for part in range(self.sample_chunks)}):
+            sample = self.map[start:start + chunk_size]
+            hits += len(pattern.findall(sample))
+            lines += sample.count(b"\n") + 1
+        return hits <= lines * self.selective_share
+
+    # Bytes pattern for a regex that is plain text, or None.  Grep runs on the fields joined by spaces, so the
+    # text must not hold spaces, delimiters, quotes or newlines, which differ between the raw line and that.
+    # Anchors only make a required term harder to match, so the text must be there anyway, but an excluded
+    # term must match as it is to rule a record out: anchored ones are not used.
+    def make_pattern(self, regex, regex_flags, required=True):
+        if regex_flags & re.VERBOSE:
+            return None
+        literal = get_regex_literal(regex) if required else get_unanchored_literal(regex, regex_flags)
+        if literal is None or any(char in literal for char in [" ", self.delimiter, "\r", "\n"]):
+            return None
+        if self.quote is not None and self.quote.decode("ascii") in literal:
+            return None
+        if not regex_flags & re.IGNORECASE:
+            try:
+                return re.compile(re.escape(literal.encode(self.encoding)))
+            except UnicodeEncodeError:
+                return None
+        if not is_ascii(literal):
+            return None
+        pattern = []
+        for char in literal:
+            variants = {char, char.lower(), char.upper()} | set(unicode_case_variants.get(char.lower(), ""))
+            encoded = set()
+            for variant in variants:
+                try:
+                    encoded.add(re.escape(variant.encode(self.encoding)))
+                except UnicodeEncodeError:
+                    pass
+            pattern.append(b"(?:" + b"|".join(sorted(encoded)) + b")" if len(encoded) > 1 else encoded.pop())
+        return re.compile(b"".join(pattern))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    # Lines of text for csv.reader, like iterating over a file opened in text mode
+    def __iter__(self):
+        for record in self.iter_records():
+            yield from io.StringIO(record.decode(self.encoding), newline=None)
+
+    def iter_records(self):
+        size = len(self.map)
+        position = 0
+        for _ in range(self.exempt_records):
+            if position >= size:
+                return
+            end = self.find_record_end(position, position)
+            yield self.map[position:end]
+            position = end
+
+        search = self.required[0].search if len(self.required) > 0 else None
+        skipped_from = position
+        while position < size:
+            if search is not None:
+                match = search(self.map, position)
+                if match is None:
+                    break
+                start = self.find_record_start(position, match.start())
+                end = self.find_record_end(start, match.end())
+            else:
+                start = position
+                end = self.find_record_end(start, start)
+            record = self.map[start:end]
+            position = end
+            if self.record_matches(record):
+                self.count_fields(skipped_from, start)
+                skipped_from = end
+                yield record
+        self.count_fields(skipped_from, size)
+
+    # With count_skipped, takes the records in bytes [start, end) into "skipped".  Only the delimiters outside
+    # quotes and the newlines matter, so the rest is removed and the longest run of delimiters is looked for
+    # only when there is one longer than the widest record so far.
+    def count_fields(self, start, end):
+        if not self.count_skipped or start >= end:
+            return
+        data = self.map[start:end]
+        if self.quoted_text is not None and self.quote in data:
+            data = self.quoted_text.sub(b"", data)
+        data = data.translate(*self.delimiter_only)
+        delimiter = self.delimiter.encode("ascii")
+        if delimiter * self.skipped.width in data:
+            self.skipped.add_width(max(map(len, self.delimiter_runs.findall(data)), default=0) + 1)
+
+    def record_matches(self, record):
+        for pattern in self.required:
+            if pattern.search(record) is None:
+                return False
+        if b"\r" in record:  # Lone carriage returns can make this several rows, which may not all hold the term
+            return True
+        for pattern in self.excluded:
+            if pattern.search(record) is not None:
+                return False
+        return True
+
+    def count_quotes(self, start, end):
+        if self.quote is None or start >= end:
+            return 0
+        return self.map[start:end].count(self.quote)
+
+    # Offset just past the newline that ends the record starting at "start", looking from "position" on
+    def find_record_end(self, start, position):
+        quotes = self.count_quotes(start, position)
+        while True:
+            newline = self.map.find(b"\n", position)
+            if newline < 0:
+                return len(self.map)
+            quotes += self.count_quotes(position, newline)
+            if quotes % 2 == 0:
+                return newline + 1
+            position = newline + 1
+
+    # Start of the record holding the byte at "position", given that a record starts at "start"
+    def find_record_start(self, start, position):
+        newline = self.map.rfind(b"\n", start, position)
+        if newline < 0:
+            return start
+        if self.count_quotes(start, newline) % 2 == 0:
+            return newline + 1
+        # That newline is inside a quoted field, so step through the records
+        while True:
+            end = self.find_record_end(start, start)
+            if end > position:
+                return start
+            start = end
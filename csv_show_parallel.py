@@ -0,0 +1,169 @@
+import codecs
+import csv
+import io
+import locale
+import os
+
+from csv_show_db import CSVShowDB
+from csv_show_shared import *
+
+
+# Encodings where every byte below 0x80 is that ASCII character, so newlines and quotes can be found in the raw bytes
+ascii_compatible_encodings = {"utf-8", "ascii", "latin-1", "iso8859-1", "iso8859-15", "cp1252"}
+
+
+# Dialects made by csv.Sniffer are local classes that cannot be sent to a worker, so send their settings instead
+def get_dialect_params(dialect):
+    params = {name: getattr(dialect, name) for name in
+              ["delimiter", "quotechar", "escapechar", "doublequote", "skipinitialspace", "lineterminator",
+               "quoting"]}
+    params["strict"] = getattr(dialect, "strict", False)
+    return params
+
+
+# The filters that run in the worker processes, so only surviving rows are sent back to the parent.
+# It holds only picklable settings; the criteria are compiled again in each worker.
+class RowFilter:
+    def __init__(self, column_names=(), pregrep_all=None, pregrep=None, criteria=(), regex_flags=0):
+        self.column_names = list(column_names)
+        self.pregrep_all = pregrep_all  # -pregrep! (the header has already been taken out)
+        self.pregrep = pregrep
+        self.criteria = list(criteria)
+        self.regex_flags = regex_flags
+        self.keep_columns = None  # Column numbers to send back, or None for all of them
+        self.widest = WidestRow()  # Counts the rows that pass -pregrep, before the criteria drop any
+
+    def filter(self, rows):
+        if self.pregrep_all:
+            rows = iter_grep_rows(rows, self.pregrep_all, self.regex_flags)
+        if self.pregrep:
+            rows = iter_grep_rows(rows, self.pregrep, self.regex_flags)
+        db = CSVShowDB(column_names=self.column_names)
+        db.regex_flags = self.regex_flags
+        rows = map(self.widest, map(db.pad_row, rows))
+        if len(self.criteria) > 0:
+            rows = db.filter_rows(rows, self.criteria)
+        if self.keep_columns is not None:
+            rows = map(CSVShowDB.get_column_projection(self.keep_columns), rows)
+        return rows
+
+
+# Parse the records in bytes [start, end) of a file.  Runs in a worker process.
+# Returns the surviving rows and the length of the longest row before the criteria.
+def read_chunk(task):
+    file_name, start, end, encoding, dialect_params, row_filter = task
+    with open(file_name, "rb") as file_handle:
+        file_handle.seek(start)
+        text = file_handle.read(end - start).decode(encoding)
+    rows = csv.reader(io.StringIO(text, newline=None), **dialect_params)  # Same newline handling as open()
+    rows = list(row_filter.filter(rows))
+    return rows, row_filter.widest.width
+
+
+# Reads a plain CSV file with several processes.  The file is split into byte ranges that end on record
+# boundaries: a newline ends a record only when an even number of quote characters comes before it, which keeps
+# newlines inside quoted fields safe.  Each range is parsed and filtered in a process pool and the surviving
+# rows come back in file order.
+# A quote character inside an unquoted field (like 5'11" with " as the quote character) breaks the counting,
+# so files with those should be read serially.
+class ParallelCsvReader:
+    min_chunk_size = 4 * 1024 * 1024
+    chunks_per_job = 4  # More chunks than jobs evens out the work
+
+    def __init__(self, file_name, dialect, jobs, encoding=None):
+        self.file_name = file_name
+        self.dialect_params = get_dialect_params(dialect)
+        self.jobs = jobs
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.quote = self.dialect_params["quotechar"].encode("ascii") if self.dialect_params["quotechar"] else None
+        self.file_size = os.path.getsize(file_name)
+        self.data_start = 0
+
+    # Parallel reading needs a regular file in an ASCII compatible encoding, quotes that follow the usual
+    # doubling rules, and enough data to be worth the processes
+    @classmethod
+    def can_read(cls, file_name, dialect, jobs, encoding=None):
+        if jobs <= 1 or file_name == "-" or file_name.endswith(".gz") or not os.path.isfile(file_name):
+            return False
+        encoding = encoding or locale.getpreferredencoding(False)
+        if codecs.lookup(encoding).name not in ascii_compatible_encodings:
+            return False
+        quotechar = dialect.quotechar
+        if dialect.escapechar is not None or not dialect.doublequote or quotechar is None or \
+                dialect.quoting == csv.QUOTE_NONE or len(quotechar) != 1 or ord(quotechar) >= 0x80:
+            return False
+        return os.path.getsize(file_name) >= 2 * cls.min_chunk_size
+
+    # Read the records before the data (header, or records removed by -pregrep!) in this process.
+    # Returns the first record for which keep_record returns True, or None.
+    def read_first_record(self, keep_record=lambda row: True):
+        with open(self.file_name, "rb") as file_handle:
+            while self.data_start < self.file_size:
+                end = self.find_record_end(file_handle, self.data_start)
+                file_handle.seek(self.data_start)
+                text = file_handle.read(end - self.data_start).decode(self.encoding)
+                self.data_start = end
+                rows = list(csv.reader(io.StringIO(text, newline=None), **self.dialect_params))
+                if len(rows) > 0 and keep_record(rows[0]):
+                    return rows[0]
+        return None
+
+    # Byte offset just past the first newline after "position" that ends a record (or the end of the file).
+    # "quotes" is the number of quote characters between the start of the record and "position".
+    def find_record_end(self, file_handle, position, quotes=0):
+        file_handle.seek(position)
+        while True:
+            line = file_handle.readline()
+            if len(line) == 0:
+                return self.file_size
+            position += len(line)
+            if self.quote:
+                quotes += line.count(self.quote)
+            if line.endswith(b"\n") and quotes % 2 == 0:
+                return position
+
+    def count_quotes(self, file_handle, start, end, block_size=1024 * 1024):
+        if not self.quote:
+            return 0
+        quotes = 0
+        file_handle.seek(start)
+        while start < end:
+            block = file_handle.read(min(block_size, end - start))
+            if len(block) == 0:
+                break
+            quotes += block.count(self.quote)
+            start += len(block)
+        return quotes
+
+    # Byte ranges of about chunk_size that each hold whole records
+    def get_chunk_ranges(self, chunk_size):
+        ranges = []
+        start = self.data_start
+        with open(self.file_name, "rb") as file_handle:
+            while start < self.file_size:
+                target = start + chunk_size
+                if target >= self.file_size:
+                    ranges.append((start, self.file_size))
+                    break
+                quotes = self.count_quotes(file_handle, start, target)
+                end = self.find_record_end(file_handle, target, quotes)
+                ranges.append((start, end))
+                start = end
+        return ranges
+
+    # chunk_read, if given, is called after the rows of each chunk.  "widest", a WidestRow, is told the length of
+    # the longest row of each chunk before its rows come out.
+    def read_rows(self, row_filter, chunk_read=None, widest=None):
+        import multiprocessing
+        chunk_size = max(self.min_chunk_size,
+                         (self.file_size - self.data_start) // (self.jobs * self.chunks_per_job) + 1)
+        tasks = [(self.file_name, start, end, self.encoding, self.dialect_params, row_filter)
+                 for start, end in self.get_chunk_ranges(chunk_size)]
+        with multiprocessing.Pool(self.jobs) as pool:
+            # Chunks come back in order; the pool is shut down if the caller stops early (e.g. -head)
+            for rows, width in pool.imap(read_chunk, tasks):
+                if widest is not None:
+                    widest.add_width(width)
+                yield from rows
+                if chunk_read is not None:
+                    chunk_read()
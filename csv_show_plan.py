@@ -0,0 +1,167 @@
+import contextlib
+import time
+
+
+# One step of a QueryPlan.  "settings" hold what running the step needs beyond the command line arguments
+# (e.g. the criteria of a select).  Steps the optimizer merged into this one are in "folded", such as a select
+# done while the file is read.  rows (the rows out of the step) and seconds are filled in when explaining.
+class PlanStage:
+    def __init__(self, name, detail="", **settings):
+        self.name = name
+        self.detail = detail
+        self.settings = settings
+        self.folded = []
+        self.rows = None
+        self.seconds = 0.0
+
+    def get_folded(self, name):
+        for stage in self.folded:
+            if stage.name == name:
+                return stage
+        return None
+
+    def describe(self):
+        details = [self.detail] + [f"{stage.name} {stage.detail}".strip() for stage in self.folded]
+        return "; ".join(detail for detail in details if detail)
+
+
+# The steps a csv_show.py run takes, in order.  CsvShow.make_plan lists them in the order the options are
+# documented to apply (scan, pregrep, sort, select, project, grep, limit, format) and optimize() reorders them
+# where that cannot change the output.  CsvShow runs the stages in the order they end up in.
+# With "explain" set, each stage's rows are counted and the time spent in it is measured.
+class QueryPlan:
+    # Steps that keep or drop each row on its own.  They keep the order of the rows, so with a stable sort it
+    # makes no difference whether they come before it or after it.
+    filters = ["pregrep", "select", "grep"]
+
+    def __init__(self, stages, mode, explain=False):
+        self.stages = list(stages)
+        self.mode = mode  # "in memory" or "streaming"
+        self.explain = explain
+        self.notes = []  # What optimize() changed, for -explain
+        self.active_stage = None
+        self.switch_time = None
+
+    def optimize(self):
+        self.move_filters_ahead_of_sort()
+        self.fold_into_scan()
+        self.fold_limit_into_sort()
+        return self
+
+    def find(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    # Filtering first means the sort only gets the rows that are kept.  -grep checks the row as it will be
+    # shown, so when it goes ahead of the column changes it is marked to check the shown columns.  Nothing
+    # passes a user hook, which may change any row.
+    def move_filters_ahead_of_sort(self):
+        for stage in list(self.stages):
+            if stage.name not in self.filters:
+                continue
+            position = self.stages.index(stage)
+            new_position = None
+            passed_project = False
+            for earlier_position in range(position - 1, -1, -1):
+                earlier_stage = self.stages[earlier_position]
+                if earlier_stage.name == "sort":
+                    new_position = earlier_position
+                elif earlier_stage.name == "project" and stage.name == "grep":
+                    passed_project = True
+                else:
+                    break
+            if new_position is None:
+                continue
+            if passed_project:
+                stage.settings["on_shown_columns"] = True
+            self.stages.remove(stage)
+            self.stages.insert(new_position, stage)
+            self.notes.append(f"{stage.name} moved ahead of sort" +
+                              (", checking the columns that will be shown" if passed_project else ""))
+
+    # -pregrep and selects right after the scan are checked as the file is read, so rows that do not match
+    # are never stored.  A limit of one row right after them stops reading at the first match.
+    def fold_into_scan(self):
+        scan = self.stages[0]
+        while len(self.stages) > 1:
+            stage = self.stages[1]
+            if stage.name == "limit" and (stage.settings["k"] != 1 or stage.settings["from_end"]):
+                break
+            if stage.name not in ["pregrep", "select", "limit"]:
+                break
+            scan.folded.append(self.stages.pop(1))
+            if stage.name == "limit":
+                break
+
+    # A sort followed by -head/-tail (or the first match of -lookup) keeps only the best rows instead of sorting
+    # all of them.  Column changes between them do not change which rows those are.
+    def fold_limit_into_sort(self):
+        sort = self.find("sort")
+        if sort is None:
+            return
+        for stage in self.stages[self.stages.index(sort) + 1:]:
+            if stage.name == "limit":
+                self.stages.remove(stage)
+                sort.folded.append(stage)
+                self.notes.append(f"sort and {stage.detail} done as a top-{stage.settings['k']} sort")
+            if stage.name != "project":
+                return
+
+    # Time spent while "stage" is active is counted for it.  Stages that pull rows through earlier stages
+    # (see count_rows) hand the time back to them while they do.
+    @contextlib.contextmanager
+    def timing(self, stage):
+        if not self.explain:
+            yield
+            return
+        previous_stage = self.switch_to(stage)
+        try:
+            yield
+        finally:
+            self.switch_to(previous_stage)
+
+    def switch_to(self, stage):
+        now = time.perf_counter()
+        if self.active_stage is not None:
+            self.active_stage.seconds += now - self.switch_time
+        self.switch_time = now
+        previous_stage, self.active_stage = self.active_stage, stage
+        return previous_stage
+
+    # For rows made lazily by "stage": counts them, and counts the time taken to make each one for the stage
+    def count_rows(self, stage, rows):
+        if not self.explain or rows is None:
+            return rows
+        return self.iter_counted_rows(stage, iter(rows))
+
+    def iter_counted_rows(self, stage, rows):
+        stage.rows = 0
+        while True:
+            previous_stage = self.switch_to(stage)
+            row = next(rows, None)
+            self.switch_to(previous_stage)
+            if row is None:
+                return
+            stage.rows += 1
+            yield row
+
+    def format_lines(self):
+        names = [" + ".join([stage.name] + [folded.name for folded in stage.folded]) for stage in self.stages]
+        name_width = max(len(name) for name in names + ["Stage"])
+        lines = [f"Query plan ({self.mode}):",
+                 f"  {'Stage':<{name_width}} {'Rows':>9} {'Seconds':>9}  Detail"]
+        for name, stage in zip(names, self.stages):
+            rows = "" if stage.rows is None else stage.rows
+            lines.append(f"  {name:<{name_width}} {rows:>9} {stage.seconds:>9.4f}  {stage.describe()}".rstrip())
+        lines += [f"  Note: {note}" for note in self.notes]
+        return lines
+
+
+def describe_criteria(criteria):
+    return " ".join("".join(relation) for relation in criteria)
+
+
+def describe_regex_list(regex_list):
+    return " ".join(regex if positive_match else f"(not) {regex}" for regex, positive_match in regex_list)
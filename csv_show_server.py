@@ -0,0 +1,251 @@
+import collections
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+
+from csv_show import CsvShow
+from csv_show_cache import CsvCache
+from csv_show_client import get_default_socket_path
+from csv_show_columnar_db import CSVShowColumnarDB
+from csv_show_db import CSVShowDB
+from csv_show_shared import *
+
+
+# Rough number of bytes a database takes, measured on a sample of its rows
+def estimate_db_size(db, sample_size=1000):
+    if isinstance(db, CSVShowColumnarDB):
+        size = 0
+        for column in db.columns:
+            if column.is_encoded():
+                size += column.codes.itemsize * len(column.codes) + sum(map(sys.getsizeof, column.values))
+            else:
+                size += sys.getsizeof(column.cells) + sum(map(sys.getsizeof, column.cells))
+        return size
+    rows = db.rows
+    if len(rows) == 0:
+        return 0
+    sample = rows[::max(len(rows) // sample_size, 1)]
+    sample_bytes = sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in sample)
+    return sys.getsizeof(rows) + sample_bytes * len(rows) // len(sample)
+
+
+# Parsed files kept in memory by the server, least recently used first.  A table is parsed again when its file
+# changes (size or modification time).  Past memory_budget bytes the least recently used tables are dropped.
+class LoadedTables:
+    def __init__(self, memory_budget):
+        self.memory_budget = memory_budget
+        self.tables = collections.OrderedDict()  # identity -> (file version, db, size)
+        self.memory_used = 0
+        self.loads = 0
+
+    # "key" is a CsvCache key: what identifies the table plus the size and time of the file
+    def get(self, key, db_class, load):
+        version = (key["size"], key["mtime_ns"])
+        identity = repr([key["path"], sorted(key["dialect"].items()), key["has_header"], key["encoding"],
+                         db_class.__name__])
+        if identity in self.tables:
+            loaded_version, db, size = self.tables[identity]
+            if loaded_version == version:
+                self.tables.move_to_end(identity)
+                return db
+            self.remove(identity)
+        db = load()
+        self.loads += 1
+        size = estimate_db_size(db)
+        self.tables[identity] = (version, db, size)
+        self.memory_used += size
+        self.evict(keep=identity)
+        return db
+
+    def remove(self, identity):
+        version, db, size = self.tables.pop(identity)
+        self.memory_used -= size
+
+    def evict(self, keep):
+        for identity in list(self.tables):
+            if self.memory_used <= self.memory_budget:
+                break
+            if identity != keep:
+                self.remove(identity)
+
+
+# CsvShow for one request to the server.  The CSV file comes from the loaded tables and the run gets a view of
+# it (or the selected rows), so the loaded table stays as it was read.  Indexes built on it are kept for later
+# requests.  There is no pager: the client prints the output.
+class ServedCsvShow(CsvShow):
+    def __init__(self, tables):
+        super().__init__()
+        self.tables = tables
+
+    def can_stream(self):
+        return False
+
+    # STDIN is the server's own, which no request can write to: reading it would hang the server
+    @staticmethod
+    def open_input_file(file):
+        if file == "-":
+            raise CSVShowError("The server cannot read STDIN: give the CSV file and -lookup_batch file by name")
+        return CsvShow.open_input_file(file)
+
+    def read_db(self, file, criteria=(), first_match_only=False):
+        key = CsvCache.make_key(file, self.dialect, self.has_header)
+        if key is None or hasattr(self.parsed_args, "pregrep!") or type(self.db) not in [CSVShowDB, CSVShowColumnarDB]:
+            super().read_db(file, criteria, first_match_only)  # Not a regular file, or -pregrep! picks the header
+            return
+        db = self.tables.get(key, type(self.db), lambda: self.load_table(file))
+        db.regex_flags = self.regex_flags
+        if self.parsed_args.pregrep:
+            db = db.grep(self.parsed_args.pregrep, self.regex_flags)
+            db.regex_flags = self.regex_flags
+        if len(criteria) == 0:
+            self.db = db.view(range(len(db)))
+        elif first_match_only:
+            row = db.lookup_row(criteria)  # Repeated lookups on a column index it
+            self.db = db.new_db([] if row is None else [list(row)], db.column_names)
+        else:
+            db.count_lookups(criteria)
+            self.db = db.select(criteria)
+        self.db.regex_flags = self.regex_flags
+
+    def load_table(self, file):
+        self.db = type(self.db)()
+        file_handle = self.open_input_file(file)
+        try:
+            for row in self.read_rows(file_handle, apply_pregrep=False):
+                self.db.add_row(row)
+        finally:
+            file_handle.close()
+        self.db.auto_index_lookups = 10  # Requests get copies of the rows, so the table never changes
+        return self.db
+
+    def print_to_pager(self, output):
+        self.print_all_lines(output)
+
+    @staticmethod
+    def print_all_lines(output):
+        CsvShow.write_lines(sys.stdout, output)
+
+
+# Output of a request, sent to the client as {"<stream>": text} messages of up to about buffer_size characters
+class MessageWriter(io.TextIOBase):
+    buffer_size = 64 * 1024
+
+    def __init__(self, connection, stream):
+        self.connection = connection
+        self.stream = stream
+        self.buffer = []
+        self.buffered = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.buffered > 0:
+            send_message(self.connection, {self.stream: "".join(self.buffer)})
+            self.buffer = []
+            self.buffered = 0
+
+
+def send_message(connection, message):
+    connection.write((json.dumps(message) + "\n").encode())
+    connection.flush()
+
+
+class CsvShowRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        stdout = MessageWriter(self.wfile, "stdout")
+        stderr = MessageWriter(self.wfile, "stderr")
+        try:
+            exit_code = self.server.run_request(request["args"], request["cwd"], stdout, stderr)
+            stdout.flush()
+            stderr.flush()
+            send_message(self.wfile, {"exit": exit_code})
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Okay: The client stopped reading (e.g. piped to head)
+
+
+# Answers csv_show_client.py requests on a Unix socket, one at a time, keeping the files it reads in memory.
+# The socket can only be used by the user running the server.
+class CsvShowServer(socketserver.UnixStreamServer):
+    default_memory_budget = 1024 * 1024 * 1024
+
+    def __init__(self, socket_path=None, memory_budget=None):
+        self.socket_path = socket_path or get_default_socket_path()
+        os.makedirs(os.path.dirname(self.socket_path) or ".", mode=0o700, exist_ok=True)
+        self.tables = LoadedTables(memory_budget if memory_budget is not None else self.default_memory_budget)
+        self.remove_stale_socket()
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(self.socket_path, CsvShowRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.remove(self.socket_path)  # Left behind by a server that is gone
+                return
+        raise CSVShowError(f"A server is already listening on {self.socket_path}")
+
+    # Returns the exit code.  Errors are reported to the client, the server keeps running.
+    def run_request(self, args, cwd, stdout, stderr):
+        save_cwd = os.getcwd()
+        try:
+            os.chdir(cwd)
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    if "-serve" in args:
+                        raise CSVShowError("-serve cannot be sent to a server")
+                    ServedCsvShow(self.tables).show(args)
+                    return 0
+                except SystemExit as e:  # -help, -version and argument errors
+                    if e.code is None or isinstance(e.code, int):
+                        return e.code or 0
+                    print(e.code, file=sys.stderr)
+                    return 1
+                except CSVShowError as e:
+                    print(f"csv_show.py: error: {e}", file=sys.stderr)
+                    return 1
+                except (BrokenPipeError, ConnectionResetError):
+                    raise
+                except Exception:
+                    traceback.print_exc()
+                    return 1
+        finally:
+            os.chdir(save_cwd)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def serve(socket_path=None, memory_budget=None):
+    server = CsvShowServer(socket_path, memory_budget)
+    print(f"Serving on {server.socket_path}.  Use csv_show_client.py with the usual csv_show.py arguments.",
+          file=sys.stderr)
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))  # Still removes the socket
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,5 +1,7 @@
+import csv
+import functools
+import itertools
 import re
-import typing
 
 class CSVShowError(Exception):
     pass
@@ -7,30 +9,70 @@ class CSVShowError(Exception):
 
 hex_regex = re.compile(r"^(\d*'[sS]?[Hh]|0X|0x)[A-Fa-f0-9_]+")
 hex_regex_prefix = re.compile(r"^(\d*'[sS]?[Hh]|0X|0x)")
-decimal_regex = re.compile(r"[0-9,_]+")
+decimal_regex = re.compile(r"[-+]?[0-9,_]+")
+float_regex = re.compile(r"[-+]?([0-9][0-9,_]*(\.[0-9]*)?|\.[0-9]+)([eE][-+]?[0-9]+)?")
 
 
-# Return "default" if the number cannot be converted
-def string_to_number(str_in: str, default: typing.Any = 0):
-    value = default
-    radix = -1
+place_separator_regex = re.compile(r"[,_]")
+float_characters = frozenset("0123456789.eE+-")
+number_cache_size = 65536
+
+
+# str.isascii is new in Python 3.7
+if hasattr(str, "isascii"):
+    is_ascii = str.isascii
+else:
+    def is_ascii(text):
+        try:
+            text.encode("ascii")
+        except UnicodeEncodeError:
+            return False
+        return True
+
+
+# The number in str_in, or None if it is not a number.  Integers (decimal or hex) become int, other decimal
+# numbers like -1.5 or 2e10 become float.  This runs every regex; parse_number tries cheap checks first.
+def parse_number_with_regexes(str_in: str):
+    str_in = str_in.strip()
+    try:
+        if hex_regex.fullmatch(str_in):
+            return int(hex_regex_prefix.sub("", str_in), 16)
+        if decimal_regex.fullmatch(str_in):
+            return int(place_separator_regex.sub("", str_in))  # Strip various well-known place separators
+    except ValueError:
+        return None
+    if float_regex.fullmatch(str_in):
+        return float(place_separator_regex.sub("", str_in))
+    return None
+
+
+# Same result as parse_number_with_regexes.  Columns repeat the same few values a lot, so results are memoized.
+@functools.lru_cache(maxsize=number_cache_size)
+def parse_number(str_in: str):
     str_in = str_in.strip()
-    if re.fullmatch(hex_regex, str_in):
-        str_in = re.sub(hex_regex_prefix, "", str_in)
-        radix = 16
-    elif re.fullmatch(decimal_regex, str_in):
-        str_in = re.sub(r"[,_]", "", str_in)  # Strip various well-known place separators
-        radix = 10
-    if radix > 0:
+    if str_in.isdigit() and is_ascii(str_in):
+        return int(str_in)
+    first_char = str_in[:1]
+    if first_char in ("+", "-") and str_in[1:].isdigit() and is_ascii(str_in):
+        return int(str_in)
+    if float_characters.issuperset(str_in):
         try:
-            value = int(str_in, radix)
+            return float(str_in)
         except ValueError:
-            pass
-    return value
+            return None
+    if not (first_char.isdigit() or first_char in "'+-.,_"):
+        return None  # Words and other text: no number form starts this way
+    return parse_number_with_regexes(str_in)
+
+
+# Return "default" if the number cannot be converted
+def string_to_number(str_in: str, default=0):
+    value = parse_number(str_in)
+    return default if value is None else value
 
 
 def string_is_number(str_in):
-    return string_to_number(str_in, None) is not None
+    return parse_number(str_in) is not None
 
 
 def get_regex(string_input):
@@ -40,6 +82,30 @@ def get_regex(string_input):
     return None
 
 
+# Sort key for one cell: numbers sort by value, everything else as a string.  Strings that sort ahead of "0"
+# ("", "-", "(none)") go ahead of the numbers and the rest ("N/A", "abc") after them, as when a string and a
+# number were compared as strings.
+def cell_sort_key(data, detect_numbers=True):
+    if detect_numbers:
+        number = parse_number(data)
+        if number is not None:
+            return 1, number
+    return string_sort_key(data)
+
+
+def string_sort_key(data):
+    return 0 if data < "0" else 2, data
+
+
+# Key function for sorted(): each cell is parsed once, then Python's tuple comparison does the work
+def make_row_sort_key(sort_keys, detect_numbers=True):
+    if len(sort_keys) == 1:
+        key = sort_keys[0]
+        return lambda row: cell_sort_key(row[key], detect_numbers)
+    return lambda row: tuple([cell_sort_key(row[key], detect_numbers) for key in sort_keys])
+
+
+# Compares rows in the same order as make_row_sort_key, but parses the cells on every comparison
 class RowComparable:
     def __init__(self, row, sort_keys, detect_numbers=True):
         self.row = row
@@ -48,28 +114,16 @@ class RowComparable:
 
     def __lt__(self, other):
         for key in self.sort_keys:
-            lhs = self.row[key]
-            rhs = other.row[key]
-            if self.detect_numbers:
-                left_num = string_to_number(lhs, None)
-                right_num = string_to_number(rhs, None)
-                if left_num is not None and right_num is not None:
-                    lhs = left_num
-                    rhs = right_num
+            lhs = cell_sort_key(self.row[key], self.detect_numbers)
+            rhs = cell_sort_key(other.row[key], self.detect_numbers)
             if not lhs == rhs:
                 return lhs < rhs
         return False
 
     def __eq__(self, other):
         for key in self.sort_keys:
-            lhs = self.row[key]
-            rhs = other.row[key]
-            if self.detect_numbers:
-                left_num = string_to_number(lhs, None)
-                right_num = string_to_number(rhs, None)
-                if left_num is not None and right_num is not None:
-                    lhs = left_num
-                    rhs = right_num
+            lhs = cell_sort_key(self.row[key], self.detect_numbers)
+            rhs = cell_sort_key(other.row[key], self.detect_numbers)
             if not lhs == rhs:
                 return False
         return True
@@ -78,22 +132,131 @@ class RowComparable:
 #  regex input can be a string,  a tuple of the form (regex, positive_match_boolean), or a list of those tuples
 #  use False in the positive_match_boolean part of the tuple to invert the match similar to grep -v
 def grep_rows(rows, regex_list, regex_flags):
-    regex_list = ensure_regex_list(regex_list)
-    new_rows = []
+    return list(iter_grep_rows(rows, regex_list, regex_flags))
+
+
+# Generator version of grep_rows so rows can be filtered as they are read
+def iter_grep_rows(rows, regex_list, regex_flags):
+    line_matches = make_line_matcher(regex_list, regex_flags)
     for row in rows:
-        concatenated_row = " ".join(row)
-        if grep_single_line(concatenated_row, regex_list, regex_flags):
-            new_rows.append(row)
-    return new_rows
+        if line_matches(" ".join(row)):
+            yield row
+
+
+# Passes rows on as they are and keeps the length of the longest one in "width", for map()
+class WidestRow:
+    def __init__(self):
+        self.width = 0
+
+    def __call__(self, row):
+        if len(row) > self.width:
+            self.width = len(row)
+        return row
+
+    def add_width(self, width):
+        self.width = max(self.width, width)
+
+
+# Reads CSV rows from "lines" (a text file) and yields those that match regex_list, like
+# iter_grep_rows(csv.reader(lines, dialect), ...).  A line without quote characters is one row whose fields are
+# split by the delimiter, so it is checked as the line with the delimiters turned into spaces and only the
+# matching lines are split.  Lines are taken in blocks: a block without quotes is checked with a few calls on
+# the whole block, the lines of other blocks one by one.  Reads ahead, so nothing else can read "lines" after it.
+def iter_raw_grep_rows(lines, dialect, regex_list, regex_flags, block_size=1024):
+    if not can_split_unquoted_lines(dialect):
+        yield from iter_grep_rows(csv.reader(lines, dialect), regex_list, regex_flags)
+        return
+    line_matches = make_line_matcher(regex_list, regex_flags)
+    delimiter = dialect.delimiter
+    quote = dialect.quotechar if dialect.quoting != csv.QUOTE_NONE else None
+    lines = iter(lines)
+    while True:
+        block = list(itertools.islice(lines, block_size))
+        if len(block) == 0:
+            return
+        block_text = "".join(block)
+        if (quote is not None and quote in block_text) or "\r" in block_text:
+            yield from iter_raw_grep_block(block, lines, dialect, line_matches)
+            continue
+        if block_text.endswith("\n"):
+            block_text = block_text[:-1]
+        matches = map(line_matches, block_text.replace(delimiter, " ").split("\n"))
+        for line in itertools.compress(block_text.split("\n"), matches):
+            yield line.split(delimiter) if line else []
+
+
+# The lines of "block" one by one: those with quotes go through csv.reader, which takes the lines that a quoted
+# field goes on to from the rest of the block and then from "more_lines"
+def iter_raw_grep_block(block, more_lines, dialect, line_matches):
+    delimiter = dialect.delimiter
+    quote = dialect.quotechar if dialect.quoting != csv.QUOTE_NONE else None
+    block_lines = iter(block)
+    next_lines = itertools.chain(block_lines, more_lines)
+    pending = []
+
+    def csv_lines():
+        while True:
+            if pending:
+                yield pending.pop()
+            else:
+                next_line = next(next_lines, None)
+                if next_line is None:
+                    return
+                yield next_line
+    reader = csv.reader(csv_lines(), dialect)
+    for line in block_lines:
+        text = line.rstrip("\r\n")
+        if (quote is not None and quote in line) or "\r" in text:
+            pending.append(line)
+            row = next(reader)
+            if line_matches(" ".join(row)):
+                yield row
+        elif line_matches(text.replace(delimiter, " ")):
+            yield text.split(delimiter) if text else []
+
+
+# True when csv.reader gives line.split(delimiter) for any line without quote characters
+def can_split_unquoted_lines(dialect):
+    return dialect.escapechar is None and not dialect.skipinitialspace and \
+        dialect.quoting in [csv.QUOTE_MINIMAL, csv.QUOTE_ALL, csv.QUOTE_NONE]
 
 
 def grep_single_line(single_line, regex_positive_match_tuples, regex_flags):
-    matches_all_regex = True
-    for single_regex, positive_match in regex_positive_match_tuples:
-        match = re.search(single_regex, single_line, regex_flags)
-        if not ((positive_match and match is not None) or (not positive_match and match is None)):
-            matches_all_regex = False
-    return matches_all_regex
+    return bool(make_line_matcher(regex_positive_match_tuples, regex_flags)(single_line))
+
+
+# Function telling whether a line matches all the regexes (by its truth value).  Made once per grep: the regexes
+# are compiled here, terms that are plain text are checked first with substring searches and the first term that
+# fails ends the check.  Ignoring case, the substring search is only used on ASCII lines (the regex handles the others).
+def make_line_matcher(regex_list, regex_flags):
+    ignore_case = bool(regex_flags & re.IGNORECASE)
+    literal_terms = []
+    regex_terms = []
+    for single_regex, positive_match in ensure_regex_list(regex_list):
+        search = re.compile(single_regex, regex_flags).search
+        literal = get_unanchored_literal(single_regex, regex_flags)
+        if literal is not None:
+            literal_terms.append((literal.lower() if ignore_case else literal, search, positive_match))
+        else:
+            regex_terms.append((search, positive_match))
+    if len(regex_terms) == 0 and not ignore_case and len(literal_terms) == 1 and literal_terms[0][2]:
+        literal = literal_terms[0][0]
+        return lambda line: literal in line  # The common "-grep Ford -match_case"
+    if len(regex_terms) == 1 and len(literal_terms) == 0 and regex_terms[0][1]:
+        return regex_terms[0][0]  # The match object, or None
+
+    def line_matches(line):
+        if literal_terms:
+            text = line if not ignore_case else line.lower() if is_ascii(line) else None
+            for literal, search, positive_match in literal_terms:
+                found = literal in text if text is not None else search(line) is not None
+                if found != positive_match:
+                    return False
+        for search, positive_match in regex_terms:
+            if (search(line) is not None) != positive_match:
+                return False
+        return True
+    return line_matches
 
 
 def ensure_regex_list(regex_list):  # If regex is not a list, make it one (so we handle both)
@@ -103,3 +266,44 @@ def ensure_regex_list(regex_list):  # If regex is not a list, make it one (so we
         else:
             regex_list = [(regex_list, True)]
     return regex_list
+
+
+regex_special_characters = set(".^$*+?{}[]|()\\")
+
+
+# The text a regex matches if it is just plain text (anchors aside), otherwise None.  Plain text terms can be
+# looked for with fast substring searches before the regex is run.
+def get_regex_literal(regex):
+    if regex.startswith("^"):
+        regex = regex[1:]
+    if regex.endswith("$") and not regex.endswith("\\$"):
+        regex = regex[:-1]
+    literal = []
+    escaped = False
+    for char in regex:
+        if escaped:
+            if char.isalnum():
+                return None  # \d, \b, \1 and so on
+            literal.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char in regex_special_characters:
+            return None
+        else:
+            literal.append(char)
+    if escaped or len(literal) == 0:
+        return None
+    return "".join(literal)
+
+
+# The text to look for with "in" instead of running the regex, or None.  Anchors and the flags that change
+# how plain text matches rule it out.  Ignoring case, only ASCII text qualifies (e.g. "k" also matches the
+# Kelvin sign).
+def get_unanchored_literal(regex, regex_flags):
+    if regex.startswith("^") or regex.endswith("$") or regex_flags & re.VERBOSE:
+        return None
+    literal = get_regex_literal(regex)
+    if literal is not None and regex_flags & re.IGNORECASE and not is_ascii(literal):
+        return None
+    return literal
@@ -1,7 +1,14 @@
 import unittest
 from unit_test_csv_show_shared import ShowCSVSharedFunctionsTests
 from unit_test_csv_show_db import *
+from unit_test_csv_show_columnar_db import ShowCSVColumnarDBTests, ColumnStoreTests
 from unit_test_csv_show_format import *
+from unit_test_csv_show_external_sort import *
+from unit_test_csv_show_parallel import *
+from unit_test_csv_show_mmap import *
+from unit_test_csv_show_cache import *
+from unit_test_csv_show_server import *
+from unit_test_csv_show_plan import *
 from unit_test_csv_show import *
 
 
@@ -9,7 +16,15 @@ def suite():
     my_suite = unittest.TestSuite()
     my_suite.addTest(unittest.makeSuite(ShowCSVSharedFunctionsTests))
     my_suite.addTest(unittest.makeSuite(ShowCSVDBTests))
+    my_suite.addTest(unittest.makeSuite(ShowCSVColumnarDBTests))
+    my_suite.addTest(unittest.makeSuite(ColumnStoreTests))
     my_suite.addTest(unittest.makeSuite(ShowCSVPrintFormatterTests))
+    my_suite.addTest(unittest.makeSuite(ShowCSVExternalSortTests))
+    my_suite.addTest(unittest.makeSuite(ShowCSVParallelTests))
+    my_suite.addTest(unittest.makeSuite(ShowCSVMmapTests))
+    my_suite.addTest(unittest.makeSuite(ShowCSVCacheTests))
+    my_suite.addTest(unittest.makeSuite(ShowCSVServerTests))
+    my_suite.addTest(unittest.makeSuite(ShowCSVPlanTests))
     my_suite.addTest(unittest.makeSuite(ShowCSVTests))
     return my_suite
 
@@ -3,11 +3,29 @@ import io
 import unittest
 import sys
 import os
+import tempfile
 from csv_show import *
 from textwrap import dedent
 import argparse
 
 
+# Stands in for sys.stdin: input that never ends, with make_line(line_number) as each line
+class EndlessStdIn:
+    def __init__(self, make_line):
+        self.make_line = make_line
+        self.lines_read = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.lines_read += 1
+        return self.make_line(self.lines_read)
+
+    def close(self):
+        pass
+
+
 class ShowCSVTests(unittest.TestCase):
     def setUp(self):
         self.dir = os.path.dirname(__file__)
@@ -142,6 +160,25 @@ class ShowCSVTests(unittest.TestCase):
         self.assertEqual(len(output), 1)
         self.assertEqual(output[0], "Ford, 1996")
 
+    def test_select_on_columns_the_header_does_not_name(self):
+        def run(args):
+            return self.capture_block_output(lambda: CsvShow().show((self.dir + "/data/" + args).split()))
+        self.assertEqual(["Accord"], run("cars.csv -noheader -lookup Col1 Col0=Honda"))
+        self.assertEqual(["|Col0 |Col1  |Col2|", "|-----|------|----|", "|Honda|Accord|2007|"],
+                         run("cars.csv -noheader -select Col1=Accord"))
+        self.assertEqual(["Make,Model,Year,Col3,Col4,Col5,Col6", "Honda,Accord,2007,Red,,,"],
+                         run("cars_corrupted.csv -select Col3=Red -csv"))
+
+    def test_rows_the_filters_drop_count_toward_the_columns(self):
+        def run(args):
+            return self.capture_block_output(lambda: CsvShow().show((self.dir + "/data/" + args).split()))
+        for args in ["-select Make=Honda", "-select Make=Honda -sort Year", "-grep Honda",
+                     "-select Model=~Acc -columnar", "-pregrep Honda|Ford -select Make=Honda"]:
+            self.assertEqual(["Make,Model,Year,Col3,Col4,Col5,Col6", "Honda,Accord,2007,Red,,,"],
+                             run("cars_corrupted.csv -csv " + args))
+        self.assertEqual(["Make,Model,Year,Col3", "Honda,Accord,2007,Red"],  # -pregrep drops rows before that
+                         run("cars_corrupted.csv -csv -pregrep Honda"))
+
     def test_lookup_not_found(self):
         def block():
             self.ui.show((self.dir + "/data/cars.csv -lookup Make Make=Ford Year=1966").split())
@@ -185,6 +222,10 @@ class ShowCSVTests(unittest.TestCase):
             ], lines
         )
 
+        def block():
+            self.ui.show((self.dir + "/data/cars.csv -pregrep! Ford -grep 2003 -csv").split())
+        self.assertEqual(["Ford,Expedition,2016", "Ford,Explorer,2003"], self.capture_block_output(block))
+
     def test_post_grep(self):
         def block():
             self.ui.show((self.dir + "/data/cars.csv -columns Year,Make -grep 2.*ford").split())
@@ -199,6 +240,270 @@ class ShowCSVTests(unittest.TestCase):
             ], lines
         )
 
+    def test_streaming_is_chosen_without_sort(self):
+        self.ui.parse_args("some.csv -select Make=Ford -grep 200".split())
+        self.assertTrue(self.ui.can_stream())
+        self.ui.parse_args("some.csv -sort Year".split())
+        self.assertFalse(self.ui.can_stream())
+        self.ui.make_arg_parser()
+        self.ui.parse_args("some.csv -lookup Model Make=Ford".split())
+        self.assertFalse(self.ui.can_stream())
+        self.ui.make_arg_parser()
+        self.ui.parse_args("some.csv -noheader".split())
+        self.assertFalse(self.ui.can_stream())
+
+        class UserShow(CsvShow):
+            def user_modify_db(self):
+                pass
+        user_shower = UserShow()
+        user_shower.make_arg_parser()
+        user_shower.parse_args(["some.csv"])
+        self.assertFalse(user_shower.can_stream())
+
+    def test_streaming_csv_output(self):
+        def block():
+            self.ui.show((self.dir + "/data/cars.csv -select Year>2000 -columns Year,Model -grep ^20 -csv").split())
+        lines = self.capture_block_output(block)
+        self.assertEqual(
+            [
+                "Year,Model",
+                "2016,Expedition",
+                "2007,Accord",
+                "2003,Explorer",
+                "2002,Safari",
+                "2015,Model S"
+            ], lines
+        )
+
+    def test_streaming_prints_before_input_is_consumed(self):
+        input_lines = ["Make,Model,Year\n", "Ford,Expedition,2016\n"] + ["Honda,Accord,2007\n"] * 6 + \
+                      ["Ford,Explorer,2003\n", "Honda,Accord,2007\n", "Ford,Windstar,1996\n"]
+        for args, expected_lines in [("- -csv", input_lines),
+                                     ("- -csv -grep Ford", [input_lines[i] for i in [0, 1, 8, 10]])]:
+            sav_stdin = sys.stdin
+            remaining_lines = list(input_lines)
+            lines_read_at_print = []
+            lines_recorded = [0]
+            ui = CsvShow()
+
+            class RecordingStdOut(io.StringIO):
+                def write(self, text):
+                    lines_read_at_print.append(len(input_lines) - len(remaining_lines))
+                    return super().write(text)
+
+            class FakeStdIn:
+                def __iter__(self):
+                    return self
+
+                def __next__(self):
+                    if ui.stdin_lines.lines is not None:
+                        lines_recorded[0] = max(lines_recorded[0], len(ui.stdin_lines.lines))
+                    if not remaining_lines:
+                        raise StopIteration
+                    return remaining_lines.pop(0)
+
+                def close(self):
+                    pass
+            sys.stdin = FakeStdIn()
+            save_stdout = sys.stdout
+            sys.stdout = captured_output = RecordingStdOut()
+            ui.stream_lookahead = 3  # Input rows, however few of them pass the -grep
+            try:
+                ui.show(args.split())
+            finally:
+                sys.stdout = save_stdout
+                sys.stdin = sav_stdin
+            self.assertEqual(expected_lines, [line + "\n" for line in captured_output.getvalue().splitlines()])
+            self.assertLess(lines_read_at_print[0], len(input_lines), args)
+            self.assertLessEqual(lines_recorded[0], 4, args)  # The header and the lookahead rows
+
+    def test_noheader_is_not_streamed(self):
+        def run(args):
+            return self.capture_block_output(lambda: CsvShow().show((self.dir + "/data/cars.csv -noheader " +
+                                                                     args).split()))
+        self.assertEqual(["Col0,Col1,Col2", "Make,Model,Year", "Ford,Expedition,2016"], run("-csv")[:3])
+        self.assertEqual(["|Col0 |", "|-----|", "|Make |", "|Ford |"], run("-columns Col0")[:4])
+
+    def test_rows_longer_than_the_header_name_more_columns(self):
+        expected_lines = ["Make,Model,Year,Col3,Col4,Col5,Col6", "Ford,Expedition,2016", "Honda,Accord,2007,Red",
+                          "Ford,Explorer,2003,Green,Aluminum Wheels,Sport XLT,40000"]
+
+        def block():
+            CsvShow().show([self.dir + "/data/cars_corrupted.csv", "-csv"])
+        self.assertEqual(expected_lines, self.capture_block_output(block)[:4])
+        sav_stdin = sys.stdin
+        with open(self.dir + "/data/cars_corrupted.csv") as sys.stdin:
+            try:
+                lines = self.capture_block_output(lambda: CsvShow().show(["-", "-csv"]))
+            finally:
+                sys.stdin = sav_stdin
+        self.assertEqual(expected_lines, lines[:4])
+        lines = self.capture_block_output(
+            lambda: CsvShow().show([self.dir + "/data/cars_corrupted.csv", "-width_sample", "2"]))
+        self.assertEqual(["|Make |Model     |Year|Col3|Col4|Col5|Col6|",
+                          "|-----|----------|----|----|----|----|----|"], lines[:2])
+
+    def test_head_and_tail(self):
+        def run(args):
+            def block():
+                CsvShow().show((self.dir + "/data/cars.csv " + args).split())
+            return self.capture_block_output(block)
+        for args in ["-sort Year", "-sort Make -reverse", "-sort Year -columns Model -grep o", "-grep o", ""]:
+            all_lines = run(args + " -csv")
+            self.assertEqual(all_lines[:3], run(args + " -csv -head 2"), args)
+            self.assertEqual(all_lines[:1] + all_lines[-2:], run(args + " -csv -tail 2"), args)
+            self.assertEqual(all_lines[:1], run(args + " -csv -head 0"), args)
+
+        self.assertEqual(
+            [
+                "|Model  |",
+                "|-------|",
+                "|Chariot|"
+            ], run("-sort Year -columns Model -head 1"))
+
+    def test_sort_memory(self):
+        def run(args):
+            def block():
+                CsvShow().show((self.dir + "/data/cars.csv " + args).split())
+            return self.capture_block_output(block)
+        for args in ["-sort Year -csv", "-sort Make -reverse -columns Model -grep o -csv", "-sort Make,Year"]:
+            self.assertEqual(run(args), run(args + " -sort_memory 0.0001"), args)
+
+    def test_sort_memory_not_used_in_memory(self):
+        save_stderr = sys.stderr
+        for args, reason in [("-noheader -sort Col2", "with -noheader"),
+                             ("-sort Year -lookup Model Year>2000", "with -lookup"), ("-sort Year -csv", None)]:
+            sys.stderr = captured_stderr = io.StringIO()
+            try:
+                self.capture_block_output(
+                    lambda: CsvShow().show((self.dir + "/data/cars.csv -sort_memory 1 " + args).split()))
+            finally:
+                sys.stderr = save_stderr
+            if reason is None:
+                self.assertEqual("", captured_stderr.getvalue())
+            else:
+                self.assertIn(f"-sort_memory is not used {reason}", captured_stderr.getvalue())
+        self.ui.parse_args([self.dir + "/data/cars.csv", "-sort", "Year", "-sort_memory", "1", "-cache"])
+        self.assertEqual("with -cache", self.ui.get_in_memory_reason())
+
+    def show_endless_stdin(self, make_line, args):
+        sav_stdin = sys.stdin
+        sys.stdin = stdin = EndlessStdIn(make_line)
+        try:
+            lines = self.capture_block_output(lambda: self.ui.show(args.split()))
+        finally:
+            sys.stdin = sav_stdin
+        return lines, stdin.lines_read
+
+    def test_head_stops_reading(self):
+        lines, lines_read = self.show_endless_stdin(lambda line_num: "Number\n" if line_num == 1 else f"{line_num}\n",
+                                                    "- -csv -head 3")
+        self.assertEqual(["Number", "2", "3", "4"], lines)
+        self.assertLess(lines_read, 10)
+
+    def test_columnar_storage(self):
+        for args in ["-sort Make,Year", "-sort Year -select Make=Ford -columns Model,Year", "-nocolumns Year -csv"]:
+            def block():
+                CsvShow().show((self.dir + "/data/cars.csv " + args).split())
+            expected = self.capture_block_output(block)
+
+            def block():
+                CsvShow().show((self.dir + "/data/cars.csv -columnar " + args).split())
+            self.assertEqual(expected, self.capture_block_output(block))
+
+    def test_projection_pushdown(self):
+        self.ui.parse_args([self.dir + "/data/cars.csv", "-columns", "/^Mo/", "-select", "Make=Ford"])
+        self.ui.read_db(self.ui.parsed_args.csv_file)
+        self.assertEqual(["Make", "Model"], self.ui.db.column_names)
+        self.assertEqual(["Ford", "Expedition"], self.ui.db.rows[0])
+
+        self.ui.parse_args([self.dir + "/data/cars.csv", "-nocolumns", "Model", "-sort", "Year"])
+        self.ui.read_db(self.ui.parsed_args.csv_file)
+        self.assertEqual(["Make", "Year"], self.ui.db.column_names)
+
+        def block():
+            CsvShow().show((self.dir + "/data/cars.csv -columns Model -sort Year -select Make=Ford").split())
+        self.assertEqual(["|Model     |", "|----------|", "|Windstar  |", "|Explorer  |", "|Expedition|"],
+                         self.capture_block_output(block))
+
+    def test_predicate_pushdown(self):
+        self.ui.parse_args([self.dir + "/data/cars.csv", "-select", "Make=~^f", "-columns", "Model"])
+        self.ui.read_db(self.ui.parsed_args.csv_file, self.ui.parsed_args.select)
+        self.assertEqual(3, len(self.ui.db))
+
+        def block():
+            CsvShow().show((self.dir + "/data/cars.csv -sort Year -select Make=~^f -columns Model -csv").split())
+        self.assertEqual(["Model", "Windstar", "Explorer", "Expedition"], self.capture_block_output(block))
+
+    def test_lookup_stops_reading(self):
+        lines, lines_read = self.show_endless_stdin(
+            lambda line_num: "Number,Square\n" if line_num == 1 else f"{line_num},{line_num ** 2}\n",
+            "- -lookup Square Number=5")
+        self.assertEqual(["25"], lines)
+        self.assertLess(lines_read, 10)
+
+    def test_width_sample_and_percentile(self):
+        def block():
+            CsvShow().show((self.dir + "/data/cars.csv -width_sample 1 -select Year<2010").split())
+        self.assertEqual(["|Make |Model |Year|", "|-----|------|----|", "|Honda|Accord|2007|",
+                          "|Ford |Explo*|2003|", "|Ford |Winds*|1996|", "|GMC  |Safari|2002|",
+                          "|Roman|Chari*|300 |"], self.capture_block_output(block))
+
+        def block():
+            CsvShow().show((self.dir + "/data/cars.csv -noheader -width_sample 2").split())
+        self.assertEqual(["|Col0|Col1      |Col2|", "|----|----------|----|", "|Make|Model     |Year|",
+                          "|Ford|Expedition|2016|", "|Hon*|Accord    |2007|"], self.capture_block_output(block)[:5])
+
+        def block():
+            CsvShow().show((self.dir + "/data/cars.csv -width_percentile 80 -columns Model").split())
+        self.assertEqual(["|Model   |", "|--------|", "|Expedit*|", "|Accord  |", "|Explorer|", "|Windstar|",
+                          "|Safari  |", "|Model S |", "|Chariot |"], self.capture_block_output(block))
+
+    def test_print_to_pager(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paged_file = os.path.join(temp_dir, "paged.txt")
+            self.ui.make_arg_parser()
+            self.ui.parse_args("- -less".split())
+            self.ui.pager_command = f"cat > {paged_file}"
+            self.ui.print_formatted_db(["|Make|", "|Ford|"])
+            with open(paged_file) as file_handle:
+                self.assertEqual("|Make|\n|Ford|\n", file_handle.read())
+            # Quitting the pager early ends the output
+            self.ui.pager_command = f"head -n 2 > {paged_file}"
+            self.ui.print_formatted_db(f"|{line_num}|" for line_num in range(1000000))
+            with open(paged_file) as file_handle:
+                self.assertEqual("|0|\n|1|\n", file_handle.read())
+
+    def test_startup_imports(self):
+        import subprocess
+        command = "import csv_show, sys; print(sorted({'gzip', 'subprocess', 'csv_show_cache'} & set(sys.modules)))"
+        result = subprocess.run([sys.executable, "-c", command], cwd=self.dir or None, capture_output=True, text=True)
+        self.assertEqual("[]", result.stdout.strip())
+
+    def test_lookup_batch(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as batch_file:
+            batch_file.write('Year Model=Accord\nMake,Year "Model=Model S"\nYear Model=Nope\n\n'
+                             'Make Year>2010 Make!=Tesla\n')
+        self.addCleanup(os.remove, batch_file.name)
+
+        def block():
+            CsvShow().show([self.dir + "/data/cars.csv", "-lookup_batch", batch_file.name, "-columns", "Model"])
+        save_stderr = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            self.assertEqual(["2007", "Tesla, 2015", "", "Ford"], self.capture_block_output(block))
+            # -grep does not apply to the lookups
+            self.assertEqual(["2007", "Tesla, 2015", "", "Ford"], self.capture_block_output(
+                lambda: CsvShow().show([self.dir + "/data/cars.csv", "-lookup_batch", batch_file.name,
+                                        "-grep", "GMC"])))
+        finally:
+            sys.stderr = save_stderr
+
+        with open(batch_file.name, "w") as file_handle:
+            file_handle.write("Year\n")
+        with self.assertRaises(CSVShowError):
+            CsvShow().show([self.dir + "/data/cars.csv", "-lookup_batch", batch_file.name])
+
     def test_can_get_max_width_from_user(self):
         self.ui.parse_args("cars.csv".split())
         self.assertIn("max_width", self.ui.parsed_args)
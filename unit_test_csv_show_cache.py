@@ -0,0 +1,102 @@
+import contextlib
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from csv_show import CsvShow
+from csv_show_cache import *
+from csv_show_db import CSVShowDB
+
+
+class ShowCSVCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = os.path.dirname(__file__)
+        self.cache_dir = tempfile.mkdtemp()
+        self.save_environ = os.environ.get("CSV_SHOW_CACHE_DIR")
+        os.environ["CSV_SHOW_CACHE_DIR"] = self.cache_dir
+        self.csv_file = os.path.join(self.cache_dir, "cars.csv")
+        shutil.copy(self.dir + "/data/cars.csv", self.csv_file)
+
+    def tearDown(self):
+        if self.save_environ is None:
+            del os.environ["CSV_SHOW_CACHE_DIR"]
+        else:
+            os.environ["CSV_SHOW_CACHE_DIR"] = self.save_environ
+        shutil.rmtree(self.cache_dir)
+
+    def make_db(self):
+        db = CSVShowDB(column_names=["Make", "Model", "Year"])
+        with open(self.csv_file) as file_handle:
+            rows = csv.reader(file_handle)
+            next(rows)
+            db.add_rows(rows)
+        return db
+
+    def test_save_and_load_columns(self):
+        cache = CsvCache()
+        key = cache.make_key(self.csv_file, csv.excel, True)
+        self.assertIsNone(cache.load(key))
+        db = self.make_db()
+        cache.save(key, db)
+        self.assertEqual(["Make", "Model", "Year"], cache.read_column_names(key))
+        self.assertEqual(db.rows, cache.load(key).rows)
+        partial_db = cache.load(key, ["Year", "Make"])
+        self.assertEqual(["Year", "Make"], partial_db.column_names)
+        self.assertEqual(db.select_columns(["Year", "Make"]).rows, partial_db.rows)
+        # Loaded columns can still be changed
+        partial_db.update_data("Make", "Ford Motor", [["Make", "=", "Ford"]])
+        self.assertEqual(3, len(partial_db.select([["Make", "=", "Ford Motor"]])))
+
+    def test_changed_file_is_not_loaded(self):
+        cache = CsvCache()
+        cache.save(cache.make_key(self.csv_file, csv.excel, True), self.make_db())
+        self.assertIsNone(cache.load(cache.make_key(self.csv_file, csv.excel, False)))
+        self.assertIsNone(cache.load(cache.make_key(self.csv_file, csv.excel_tab, True)))
+        with open(self.csv_file, "a") as file_handle:
+            file_handle.write("Volvo,XC90,2020\n")
+        self.assertIsNone(cache.load(cache.make_key(self.csv_file, csv.excel, True)))
+
+    def test_eviction_and_clear(self):
+        cache = CsvCache()
+        other_csv_file = os.path.join(self.cache_dir, "other.csv")
+        shutil.copy(self.csv_file, other_csv_file)
+        first_key = cache.make_key(self.csv_file, csv.excel, True)
+        cache.save(first_key, self.make_db())
+        os.utime(cache.get_cache_file_name(first_key), ns=(0, 0))  # Least recently used
+        cache.max_size = os.path.getsize(cache.get_cache_file_name(first_key)) + 10
+        second_key = cache.make_key(other_csv_file, csv.excel, True)
+        cache.save(second_key, self.make_db())
+        self.assertIsNone(cache.load(first_key))
+        self.assertIsNotNone(cache.load(second_key))
+        cache.clear()
+        self.assertEqual([], cache.get_cache_files())
+
+    def test_show_with_cache(self):
+        def run(args):
+            ui = CsvShow()
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                ui.show([self.csv_file] + args)
+            return ui, output.getvalue()
+        for args in [["-columns", "Model"], ["-select", "Make=Ford", "-columns", "Year"],
+                     ["-nocolumns", "Model", "-sort", "Year", "-pregrep", "GMC|Honda"],
+                     ["-lookup", "Model", "Year=2003"]]:
+            expected = run(args)[1]
+            self.assertEqual(expected, run(args + ["-cache"])[1])  # Parses and saves
+            ui, output = run(args + ["-cache"])  # Loads
+            self.assertEqual(expected, output)
+        shutil.copy(self.dir + "/data/cars_corrupted.csv", self.csv_file)  # Rows keep their own length
+        for args in [["-csv"], ["-csv", "-sort", "Make"]]:
+            expected = run(args)[1]
+            self.assertEqual(expected, run(args + ["-cache"])[1])
+            self.assertEqual(expected, run(args + ["-cache"])[1])
+        shutil.copy(self.dir + "/data/cars.csv", self.csv_file)
+        ui, output = run(["-columns", "Model", "-grep", "S", "-cache"])
+        self.assertEqual(["Model"], ui.db.column_names)
+        self.assertEqual(1, len(CsvCache().get_cache_files()))
+
+
+if __name__ == '__main__':
+    unittest.main()
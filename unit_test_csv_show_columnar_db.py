@@ -0,0 +1,95 @@
+import unittest
+import unit_test_csv_show_db
+from csv_show_columnar_db import *
+
+
+class ShowCSVColumnarDBTests(unit_test_csv_show_db.ShowCSVDBTests):
+    def setUp(self):
+        self.db = CSVShowColumnarDB()
+
+    # The column stores have every cell, but rows keep their own length through sort, select and changes
+    def test_rows_keep_their_length(self):
+        self.db.set_column_names(["ItemA", "ItemB"])
+        self.db.add_rows([["AA0", "BB0", "CC0"], ["AA1"], ["AA2", "BB2", "CC2", "DD2"]])
+        self.assertEqual(["", ""], [self.db.rows[1][2], list(self.db.column_values(3))[0]])
+        self.db.sort(["ItemA"], reverse=True)
+        self.assertEqual([["AA2", "BB2", "CC2", "DD2"], ["AA1", ""], ["AA0", "BB0", "CC0"]], self.db.rows)
+        self.assertEqual([["AA1", "", "", ""]], self.db.grep([("^AA1 $", True)]).rows)
+        self.db.insert_column("New", 0)
+        self.db.insert_row(0, ["x"])
+        self.assertEqual([["x"], ["", "AA2", "BB2", "CC2", "DD2"], ["", "AA1", ""], ["", "AA0", "BB0", "CC0"]],
+                         self.db.rows)
+        self.assertEqual([["AA2"], ["AA1"], ["AA0"]], self.db.tail(3).select_columns(["ItemA"]).rows)
+
+    def test_iterable(self):
+        self.setUPDefaultData()
+        rows = [row for row in self.db]
+        self.assertEqual(4, len(rows))
+        self.assertEqual(["Tom", "6", "5 feet"], rows[0])
+        self.db.rows_as_records = True
+        records = [row for row in self.db]
+        self.assertEqual(4, len(records))
+        self.assertEqual(type({}), type(records[0]))
+
+    # Columnar select, grep and select_columns copy the column stores instead of making views
+    def test_views_share_rows_until_changed(self):
+        self.setUPDefaultData()
+        selected = self.db.select([["Age", "=", "50"]]).select_columns(["Height", "Name"]).grep("feet")
+        self.assertEqual(CSVShowDB([["6 feet", "Richard"], ["5 feet", "Katy"]], ["Height", "Name"]), selected)
+        selected.rows[1][1] = "Kate"
+        self.assertEqual(["Katy", "50", "5 feet"], self.db.rows[3])
+        view = self.db.view([3, 0], [2, 0], ["Height", "Name"])
+        self.assertIsInstance(view, CSVShowColumnarDB)
+        self.assertEqual([["5 feet", "Katy"], ["5 feet", "Tom"]], view.rows)
+
+    def test_rows_write_through(self):
+        self.setUPDefaultData()
+        for row in self.db.rows:
+            row[1] = str(int(row[1]) + 1)
+        self.assertEqual(["7", "31", "51", "51"], list(self.db.column_values(1)))
+        self.db.rows[0][0] = "Thomas"
+        self.assertEqual("Thomas", self.db.lookup_item("Name", [["Age", "=", "7"]]))
+
+    def test_results_are_columnar_copies(self):
+        self.setUPDefaultData()
+        for result_db in [self.db.select([["Age", "=", "50"]]), self.db.grep("50"),
+                          self.db.select_columns(["Age", "Name"])]:
+            self.assertIsInstance(result_db, CSVShowColumnarDB)
+            result_db.rows[0][0] = "changed"
+        self.assertEqual(["Tom", "Ella", "Richard", "Katy"], list(self.db.column_values(0)))
+        self.assertEqual(["6", "30", "50", "50"], list(self.db.column_values(1)))
+
+
+class ColumnStoreTests(unittest.TestCase):
+    def test_low_cardinality_column_is_encoded(self):
+        column = ColumnStore(["Ford", "Honda", "Ford", "Ford"])
+        self.assertTrue(column.is_encoded())
+        self.assertEqual(["Ford", "Honda"], column.values)
+        self.assertEqual(["Ford", "Honda", "Ford", "Ford"], list(column))
+        column[1] = "GMC"
+        column.insert(0, "Tesla")
+        self.assertEqual(["Tesla", "Ford", "GMC", "Ford", "Ford"], list(column))
+        self.assertEqual(["Ford", "GMC", "Tesla"], sorted(column.distinct_values()))
+
+    def test_switches_to_plain_list_past_dictionary_limit(self):
+        column = ColumnStore(["a", "b", "a"], dictionary_limit=3)
+        self.assertTrue(column.is_encoded())
+        column.append("c")
+        column.append("d")
+        self.assertFalse(column.is_encoded())
+        self.assertEqual(["a", "b", "a", "c", "d"], list(column))
+        self.assertEqual(["d", "a"], list(column.take([4, 0])))
+
+    def test_map_values_once_per_distinct_value(self):
+        calls = []
+
+        def function(value):
+            calls.append(value)
+            return value.lower()
+        column = ColumnStore(["Ford", "Honda", "Ford", "Ford"])
+        self.assertEqual(["ford", "honda", "ford", "ford"], column.map_values(function))
+        self.assertEqual(["Ford", "Honda"], calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -167,6 +167,78 @@ class ShowCSVDBTests(unittest.TestCase):
         result_db = self.db.select([["Age", "!=", "50"]])
         self.assertEqual(2, len(result_db))
 
+    def test_compile_criteria(self):
+        self.setUPDefaultData()
+        row_matches = self.db.compile_criteria([["Age", ">", "0x10"], ["Name", "!~", "^R"]])
+        self.assertEqual([False, True, False, True], [row_matches(row) for row in self.db.rows])
+        # Non-numbers compare as strings
+        row_matches = self.db.compile_criteria([["Height", "<", "5 feet"]])
+        self.assertEqual([False, True, False, False], [row_matches(row) for row in self.db.rows])
+
+    def test_compile_criteria_short_circuits(self):
+        self.setUPDefaultData()
+        row_matches = self.db.compile_criteria([["Age", "=", "6"], ["Name", "=", "Tom"]])
+        self.assertFalse(row_matches(["Ella", "30"]))  # The missing third field is never looked at
+        self.assertTrue(row_matches(["Tom", "6"]))
+
+    def test_compile_criteria_errors(self):
+        self.setUPDefaultData()
+        with self.assertRaises(CSVShowError):
+            self.db.compile_criteria([["Age", "<>", "6"]])
+        with self.assertRaises(CSVShowError):
+            self.db.compile_criteria([["Weight", "=", "6"]])
+
+    def test_index_lookup(self):
+        self.setUPDefaultData()
+        self.db.create_index("Age")
+        self.assertEqual("Ella", self.db.lookup_item("Name", [["Age", "=", "0x1e"]]))
+        self.assertIsNotNone(self.db.indexes["Age"].row_numbers_by_key)
+        self.assertEqual("Katy", self.db.lookup_item("Name", [["Age", "==", "50"], ["Height", "=~", "5"]]))
+        self.assertEqual("", self.db.lookup_item("Name", [["Age", "=", "51"]]))
+        with self.assertRaises(CSVShowError):
+            self.db.create_index("Weight")
+
+    def test_index_ranges_match_full_scan(self):
+        self.setUPDefaultData()
+        self.db.add_rows([["Bob", "n/a", "6 feet"], ["Al", "", "7 feet"], ["Zed", "0x40", "5 feet"]])
+        relations = [[column, op, value]
+                     for column in ["Age", "Height"]
+                     for op in ["<", "<=", ">", ">=", "=", "!="]
+                     for value in ["30", "5 feet", "n/a", "", "0x32"]]
+        expected = [self.db.select([relation]) for relation in relations]
+        self.db.create_index("Age")
+        self.db.create_index("Height")
+        for relation, expected_db in zip(relations, expected):
+            self.assertEqual(expected_db, self.db.select([relation]), relation)
+
+    def test_index_maintenance(self):
+        self.setUPDefaultData()
+        self.db.create_index("Name")
+        self.assertEqual("6", self.db.lookup_item("Age", [["Name", "=", "Tom"]]))
+        self.db.add_row(["Zoe", "12", "4 feet"])
+        self.assertEqual("12", self.db.lookup_item("Age", [["Name", "=", "Zoe"]]))
+        self.db.update_data("Name", "Thomas", [["Name", "=", "Tom"]])
+        self.assertEqual("", self.db.lookup_item("Age", [["Name", "=", "Tom"]]))
+        self.assertEqual("6", self.db.lookup_item("Age", [["Name", "=", "Thomas"]]))
+        self.db.sort(["Name"])
+        self.assertEqual("6", self.db.lookup_item("Age", [["Name", "=", "Thomas"]]))
+        self.db.insert_row(0, ["Abe", "99", "6 feet"])
+        self.assertEqual("99", self.db.lookup_item("Age", [["Name", "=", "Abe"]]))
+        self.assertEqual("12", self.db.lookup_item("Age", [["Name", ">", "Thomas"]]))
+        self.db.insert_column("Id", 0)
+        self.assertEqual("50", self.db.lookup_item("Age", [["Name", "=", "Richard"]]))
+
+    def test_auto_index(self):
+        self.setUPDefaultData()
+        for i in range(20):
+            self.db.lookup_item("Age", [["Name", "=", "Tom"]])
+        self.assertNotIn("Name", self.db.indexes)  # Only when asked for
+        self.db.auto_index_lookups = 2
+        self.db.lookup_item("Age", [["Name", "=", "Tom"]])
+        self.assertNotIn("Name", self.db.indexes)
+        self.db.lookup_item("Age", [["Name", "=", "Tom"]])
+        self.assertIn("Name", self.db.indexes)
+
     def test_grep(self):
         self.setUPDefaultData()
         result_db = self.db.grep("(rich|katy).*50.*", re.IGNORECASE)
@@ -264,6 +336,75 @@ class ShowCSVDBTests(unittest.TestCase):
                     ]
         self.assertEqual(expected, self.db.rows)
 
+    def test_sort_negative_and_float_numbers(self):
+        self.db.set_column_names(["Name", "Delta"])
+        self.db.add_rows([["a", "1.5"], ["b", "-2"], ["c", "n/a"], ["d", "-0.25"], ["e", "10"], ["f", ""]])
+        self.db.sort(["Delta"])
+        self.assertEqual(["f", "b", "d", "a", "e", "c"], [row[0] for row in self.db.rows])
+        self.db.sort(["Name"], reverse=True)
+        self.db.sort(["Delta", "Name"])
+        self.assertEqual(["f", "b", "d", "a", "e", "c"], [row[0] for row in self.db.rows])
+
+    def test_column_types(self):
+        self.db.set_column_names(["Int", "Hex", "Float", "Text", "Empty"])
+        self.db.add_rows([["1", "0x10", "1.5", "a", ""], ["-2", "0xff", "3", "1", ""], ["", "0x1", "-1e3", "b", ""]])
+        self.assertEqual(["int", "hex", "float", "string", "string"],
+                         [self.db.column_type(name) for name in self.db.column_names])
+        self.db.update_data_at_row("Int", 0, "one")
+        self.assertEqual("string", self.db.column_type("Int"))
+
+    def test_typed_columns_are_kept_up_to_date(self):
+        self.setUPDefaultData()
+        self.assertEqual(2, len(self.db.select([["Age", ">", "30"]])))
+        self.assertIn(1, self.db.typed_columns)
+        self.db.sort(["Name"])  # Reorders the parsed numbers along with the rows
+        self.assertEqual([30, 50, 50, 6], self.db.get_typed_column(1).numbers)
+        self.assertEqual([["Ella", "30", "4.5 feet"], ["Tom", "6", "5 feet"]],
+                         self.db.select([["Age", "<", "0x20"]]).rows)
+        self.db.update_data("Age", "40", [["Name", "=", "Tom"]])
+        self.assertEqual(3, len(self.db.select([["Age", ">", "30"]])))
+        self.db.add_row(["Zed", "99", ""])
+        self.assertEqual(4, len(self.db.select([["Age", ">", "30"]])))
+        self.db.rows[0][1] = "100"  # Changed directly: the parsed numbers notice the new cell
+        self.assertEqual(["100", "50", "50", "40", "99"], [row[1] for row in self.db.select([["Age", ">", "30"]]).rows])
+        self.db.sort(["Age"])
+        self.db.rows[0][1] = "200"
+        self.db.sort(["Age"])
+        self.assertEqual(["50", "50", "99", "100", "200"], [row[1] for row in self.db.rows])
+        fifty = self.db.select([["Age", "=", "50"]])
+        self.assertEqual(2, len(fifty.select([["Age", "<", "99"]])))
+        if isinstance(fifty, CSVShowDBView):
+            self.db.rows[0][1] = "1"  # Changed in place, so it shows through the view
+            self.assertEqual(["1"], [row[1] for row in fifty.select([["Age", "<", "2"]]).rows])
+
+    def test_top_k(self):
+        self.db.set_column_names(["Name", "Age"])
+        self.db.add_rows([["Tom", "6"], ["Ella", "30"], ["Richard", "50"], ["Katy", "50"], ["Al", "6"], ["Bo", "x"]])
+        for sort_columns in [["Age"], ["Name"], []]:
+            for reverse in [False, True]:
+                expected_db = CSVShowDB(self.db.rows, self.db.column_names)
+                expected_db.sort(sort_columns, reverse)
+                for k in [0, 1, 2, 3, 6, 10]:
+                    top_db = self.db.top_k(sort_columns, k, reverse)
+                    self.assertEqual(expected_db.rows[:k], top_db.rows, (sort_columns, reverse, k))
+                    top_db = self.db.top_k(sort_columns, k, reverse, from_end=True)
+                    self.assertEqual(expected_db.rows[max(len(expected_db.rows) - k, 0):], top_db.rows,
+                                     (sort_columns, reverse, k))
+
+    def test_top_k_of_other_rows(self):
+        self.setUPDefaultData()
+        rows = iter([["Zed", "1", ""], ["Amy", "70", ""]])
+        top_db = self.db.top_k(["Age"], 1, reverse=True, rows=rows)
+        self.assertEqual([["Amy", "70", ""]], top_db.rows)
+        self.assertEqual(self.db.column_names, top_db.column_names)
+
+    def test_head_and_tail(self):
+        self.setUPDefaultData()
+        self.assertEqual(CSVShowDB(self.db.rows[:2], self.db.column_names), self.db.head(2))
+        self.assertEqual(CSVShowDB(self.db.rows[3:], self.db.column_names), self.db.tail(1))
+        self.assertEqual(0, len(self.db.tail(0)))
+        self.assertEqual(4, len(self.db.head(10)))
+
     def test_select_columns(self):
         self.setUPDefaultData()
         expected = CSVShowDB([
@@ -282,6 +423,84 @@ class ShowCSVDBTests(unittest.TestCase):
         ], ["Age", "Name"])
         self.assertEqual(expected, self.db.select_columns(["Age", "Name"]))
 
+    def test_views_share_rows_until_changed(self):
+        self.setUPDefaultData()
+        view = self.db.select([["Age", "=", "50"]]).select_columns(["Height", "Name"]).grep("feet")
+        self.assertIsInstance(view, CSVShowDBView)
+        self.assertIs(self.db.rows, view.base_rows)
+        self.assertEqual(CSVShowDB([["6 feet", "Richard"], ["5 feet", "Katy"]], ["Height", "Name"]), view)
+        self.assertEqual(["Katy"], [row[1] for row in view.select([["Height", "<", "6"]]).read_only_rows()])
+        view.sort(["Height"])
+        self.assertEqual([["5 feet", "Katy"], ["6 feet", "Richard"]], list(view.read_only_rows()))
+        self.assertEqual(["5 feet", "Katy"], view.head(1).tail(1).read_only_rows()[0])
+        self.assertEqual("Katy", view.lookup_item("Name", [["Height", "=", "5 feet"]]))
+        self.assertIsInstance(view, CSVShowDBView)  # Nothing so far copied rows out of the base
+        # Changes copy the rows out of the base first
+        view.update_data("Name", "Kate", [["Name", "=", "Katy"]])
+        self.assertNotIsInstance(view, CSVShowDBView)
+        self.assertEqual([["5 feet", "Kate"], ["6 feet", "Richard"]], view.rows)
+        self.assertEqual(["Katy", "50", "5 feet"], self.db.rows[3])
+        tail = self.db.tail(1)
+        tail.rows[0][0] = "Kate"
+        self.assertEqual(["Katy", "50", "5 feet"], self.db.rows[3])
+        head = self.db.head(1)
+        head.get_row(0)[0] = "Tommy"
+        self.assertEqual(["Tom", "6", "5 feet"], self.db.rows[0])
+        head = self.db.head(1)
+        head.add_row(["Zed", "1", "1 foot"])
+        self.assertEqual(4, len(self.db))
+        self.assertEqual([["Tom", "6", "5 feet"], ["Zed", "1", "1 foot"]], head.rows)
+
+    def test_views_keep_their_rows_when_the_base_changes(self):
+        changes = [lambda db: db.insert_row(0, ["Zed", "1", "1 foot"]), lambda db: db.insert_column("Id", 0),
+                   lambda db: db.update_data("Name", "Kate", [["Name", "=", "Katy"]]),
+                   lambda db: db.set_row_field(db.rows[3], "Age", "51")]
+        for change in changes:
+            self.db = CSVShowDB()
+            self.setUPDefaultData()
+            fifty = self.db.select([["Age", "=", "50"]])
+            names = fifty.select_columns(["Name"])
+            tail = self.db.tail(2)
+            self.assertEqual(["Katy", "50", "5 feet"], fifty.lookup_row([["Name", "=", "Katy"]]))
+            self.assertEqual(["Richard"], names.get_row(0))
+            self.assertIsInstance(fifty, CSVShowDBView)  # lookup_row and get_row copy only the row they give
+            change(self.db)
+            self.assertNotIsInstance(fifty, CSVShowDBView)
+            self.assertEqual([["Richard", "50", "6 feet"], ["Katy", "50", "5 feet"]], fifty.rows)
+            self.assertEqual([["Richard"], ["Katy"]], names.rows)
+            self.assertEqual([["Richard", "50", "6 feet"], ["Katy", "50", "5 feet"]], tail.rows)
+            self.assertEqual(["Name", "Age", "Height"], tail.column_names)
+
+    def test_views_keep_their_rows_after_the_base_is_sorted(self):
+        self.setUPDefaultData()
+        fifty = self.db.select([["Age", "=", "50"]])
+        self.db.sort(["Name"])
+        self.db.update_data("Name", "CHANGED", [["Name", "=", "Katy"]])
+        self.assertEqual([["Richard", "50", "6 feet"], ["Katy", "50", "5 feet"]], fifty.rows)
+
+    def test_set_row_field_on_rows_of_a_view(self):
+        self.setUPDefaultData()
+        fifty = self.db.select([["Age", "=", "50"]])
+        fifty.set_row_field(fifty.lookup_row([["Name", "=", "Katy"]]), "Age", "51")
+        fifty.set_row_field(fifty.get_row(0), "Height", "7 feet")
+        self.assertEqual([["Richard", "50", "7 feet"], ["Katy", "51", "5 feet"]], list(fifty.read_only_rows()))
+        self.assertEqual(["Katy", "51", "5 feet"], fifty.select([["Age", ">", "50"]]).get_row(0))
+        self.assertEqual([["Richard", "50", "7 feet"], ["Katy", "51", "5 feet"]], fifty.rows)
+        self.assertEqual(["Richard", "50", "6 feet"], self.db.rows[2])  # The base keeps its rows
+        names = self.db.select_columns(["Name"])
+        names.set_row_field(names.get_row(1), "Name", "Kate")
+        self.assertEqual(["Kate"], names.rows[1])
+
+
+    def test_select_and_grep_pad_short_rows(self):
+        self.db.set_column_names(["ItemA"])
+        self.db.add_rows([["AA1"], ["AA0", "BB0", "CC0"]])
+        for view in [self.db.select([["ItemA", "=", "AA1"]]), self.db.grep([("^AA1", True)])]:
+            self.assertEqual([["AA1", "", ""]], list(view.read_only_rows()))
+            self.assertEqual(["AA1", "", ""], view.get_row(0))
+            self.assertEqual([["AA1", "", ""]], view.rows)
+        self.assertEqual([["AA1"]], self.db.head(1).rows)
+
 
 if __name__ == '__main__':
     unittest.main()
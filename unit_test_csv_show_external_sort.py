@@ -0,0 +1,37 @@
+import random
+import unittest
+from csv_show_external_sort import *
+from csv_show_shared import *
+
+
+class ShowCSVExternalSortTests(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(5)
+        self.rows = [[str(rng.randint(0, 20)), f"row{row_num}", rng.choice(["a", "b", "c,\n\"d\""])]
+                     for row_num in range(500)]
+
+    def test_small_input_is_sorted_in_memory(self):
+        sorter = ExternalSorter(make_row_sort_key([0]))
+        self.assertEqual(sorted(self.rows, key=make_row_sort_key([0])), list(sorter.sort(self.rows)))
+        self.assertEqual(0, sorter.runs_written)
+
+    def test_spills_runs_and_merges(self):
+        for sort_keys in [[0], [2, 0]]:
+            for reverse in [False, True]:
+                key = make_row_sort_key(sort_keys)
+                sorter = ExternalSorter(key, reverse, memory_budget=2000)
+                sorter.rows_per_batch = 7
+                result = list(sorter.sort(iter(self.rows)))
+                self.assertGreater(sorter.runs_written, 10)
+                # Stable: equal rows keep their original order, as with sorted()
+                self.assertEqual(sorted(self.rows, key=key, reverse=reverse), result)
+
+    def test_merges_many_runs_in_groups(self):
+        key = make_row_sort_key([0])
+        sorter = ExternalSorter(key, memory_budget=500)
+        sorter.max_open_runs = 3
+        self.assertEqual(sorted(self.rows, key=key), list(sorter.sort(self.rows)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -127,6 +127,78 @@ class ShowCSVPrintFormatterTests(unittest.TestCase):
                                }
         self.show.find_longest_column_widths()
         self.assertEqual(expected_histograms, self.show.width_histograms)
+        self.show.collect_width_histograms = False
+        self.show.width_histograms = {}
+        self.show.find_longest_column_widths()
+        self.assertEqual([12, 19, 13], self.show.longest_by_col)
+        self.assertEqual({}, self.show.width_histograms)
+
+    def test_column_widths_added_in_blocks(self):
+        widths = ColumnWidths(collect_histograms=True)
+        widths.add_rows([["Name", "Quantity"]])
+        widths.add_rows([])
+        widths.add_rows([["Forks", "2000"], ["LongThing123"]])
+        widths.add_rows([["Spoon", "3000", "Surprise Data"]])
+        self.assertEqual([12, 8, 13], widths.longest_by_col)
+        self.assertEqual([{4: 1, 5: 2, 12: 1}, {8: 1, 4: 2}, {13: 1}], widths.histograms)
+
+    def test_width_sample(self):
+        def rows():
+            yield ["Fork", "2"]
+            yield ["Spoon", "3000"]
+            raise AssertionError("Read past the sample before the first line")
+        self.show.set_db(CSVShowDB(column_names=["Name", "Quantity"]))
+        self.show.width_sample_size = 1
+        lines = self.show.iter_output_as_lines(rows())
+        self.assertEqual(["|Name|Quantity|", "|----|--------|", "|Fork|2       |", "|Spo*|3000    |"],
+                         list(itertools.islice(lines, 4)))
+
+    def test_width_sample_names_columns_past_the_header(self):
+        rows = [["Fork", "2"], ["Spoon", "3000", "Silver"], ["Knife"]]
+        self.show.set_db(CSVShowDB(column_names=["Name", "Quantity"]))
+        self.show.width_sample_size = 2
+        self.assertEqual(["|Name |Quantity|Col2  |", "|-----|--------|------|", "|Fork |2       |",
+                          "|Spoon|3000    |Silver|", "|Knife|"], list(self.show.iter_output_as_lines(rows)))
+        self.show.set_db(CSVShowDB())  # No header
+        self.assertEqual(["|Col0 |Col1|Col2  |", "|-----|----|------|", "|Fork |2   |",
+                          "|Spoon|3000|Silver|", "|Knife|"], list(self.show.iter_output_as_lines(rows)))
+
+    def test_width_percentile(self):
+        rows = [["a"], ["bb"], ["ccc"], ["dddddddddd"]]
+        self.show.set_db(CSVShowDB(rows, ["X"]))
+        self.show.width_percentile = 80
+        self.show.find_longest_column_widths()
+        self.assertEqual([3], self.show.longest_by_col)
+        self.show.width_percentile = 100
+        self.show.find_longest_column_widths()
+        self.assertEqual([10], self.show.longest_by_col)
+
+    def test_width_percentile_keeps_columns_aligned(self):
+        rows = [["", "a", "1"], ["", "b", "22"], ["", "c", "333"], ["", "dddd", "4444"]]
+        self.show.set_db(CSVShowDB(rows, ["E", "Name", "N"]))
+        self.show.width_percentile = 50
+        lines = self.show.format_output_as_lines()
+        self.assertEqual(["|E|N*|N |", "|-|--|--|", "| |a |1 |", "| |b |22|", "| |c |3*|", "| |d*|4*|"], lines)
+
+    def test_row_renderer(self):
+        render = CsvPrintFormatter.make_row_renderer([4, 0, 2])
+        self.assertEqual("|Fork||2 |", render(["Fork", "", "2"]))
+        self.assertEqual("|For*|*|3*|", render(["Forks", "x", "300"]))
+        self.assertEqual("|Fork|", render(["Fork"]))
+        self.assertEqual("|Fork||2 |Extra|", render(["Fork", "", "2", "Extra"]))
+        self.assertEqual("", render([]))
+        self.assertEqual("", CsvPrintFormatter.make_row_renderer([])([]))
+        self.assertEqual("|||", CsvPrintFormatter.make_row_renderer([0, 0])(["", ""]))
+
+    def test_columnar_db_widths(self):
+        rows = [["Fork", "2"], ["Spoon", "3000"], ["LongThing123", "1234567890123456789"]]
+        for collect_width_histograms in [True, False]:
+            self.show.collect_width_histograms = collect_width_histograms
+            self.show.set_db(CSVShowDB(rows, ["Name", "Quantity"]))
+            expected = self.show.format_output_as_string()
+            self.show.set_db(CSVShowColumnarDB(rows, ["Name", "Quantity"]))
+            self.assertEqual(expected, self.show.format_output_as_string())
+            self.assertEqual([12, 19], self.show.longest_by_col)
 
 
 
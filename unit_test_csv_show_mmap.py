@@ -0,0 +1,120 @@
+import csv
+import io
+import os
+import random
+import re
+import sys
+import tempfile
+import unittest
+from csv_show import CsvShow
+from csv_show_mmap import *
+
+
+class ShowCSVMmapTests(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(9)
+        self.rows = [[rng.choice(["Ford", "Honda", "GMC", "Škoda"]), str(rng.randint(1990, 2020)),
+                      rng.choice(["plain", "with,comma", "two\nFord lines", "\"quoted\" ford", "end\n", "KIA"])]
+                     for _ in range(300)]
+        self.file_names = []
+
+    def tearDown(self):
+        for file_name in self.file_names:
+            os.remove(file_name)
+
+    def write_file(self, line_terminator="\n"):
+        text = io.StringIO()
+        writer = csv.writer(text, lineterminator=line_terminator)
+        writer.writerow(["Make", "Year", "Notes"])
+        writer.writerows(self.rows)
+        temp_file = tempfile.NamedTemporaryFile("wb", suffix=".csv", delete=False)
+        temp_file.write(text.getvalue().encode("utf-8"))
+        temp_file.close()
+        self.file_names.append(temp_file.name)
+        return temp_file.name
+
+    def read(self, file_name, required, excluded, regex_flags):
+        reader = MmapCsvReader(file_name, csv.excel, "utf-8")
+        reader.exempt_records = 1
+        reader.set_filters(required, excluded, regex_flags)
+        try:
+            return list(csv.reader(reader))
+        finally:
+            reader.close()
+
+    def test_skips_only_rows_that_cannot_match(self):
+        for line_terminator in ["\n", "\r\n"]:
+            file_name = self.write_file(line_terminator)
+            for required, excluded in [(["Ford"], []), (["ford", "20"], ["comma"]), ([], ["lines"]),
+                                       (["kia"], []), (["20"], ["^Ford", "lines$", "^G"])]:
+                for regex_flags in [0, re.IGNORECASE]:
+                    rows = self.read(file_name, required, excluded, regex_flags)
+                    terms = [(regex, True) for regex in required] + [(regex, False) for regex in excluded]
+                    self.assertEqual(["Make", "Year", "Notes"], rows[0])
+                    expected = list(iter_grep_rows(self.rows, terms, regex_flags))
+                    self.assertEqual(expected, list(iter_grep_rows(rows[1:], terms, regex_flags)))
+
+    def test_terms_that_differ_in_raw_bytes_are_not_used(self):
+        reader = MmapCsvReader(self.write_file(), csv.excel, "utf-8")
+        self.assertIsNone(reader.make_pattern("with,comma", 0))
+        self.assertIsNone(reader.make_pattern("Ford lines", 0))
+        self.assertIsNone(reader.make_pattern("\"quoted", 0))
+        self.assertIsNone(reader.make_pattern("Fo.d", 0))
+        self.assertIsNone(reader.make_pattern("Škoda", re.IGNORECASE))
+        self.assertIsNotNone(reader.make_pattern("Škoda", 0))
+        # re.IGNORECASE matches the Kelvin sign for k, so the bytes search does too
+        self.assertIsNotNone(reader.make_pattern("kia", re.IGNORECASE).search("KIA".encode("utf-8")))
+        self.assertIsNone(reader.make_pattern("^Ford", 0, required=False))  # Would drop "GMC,Ford Clone"
+        self.assertIsNotNone(reader.make_pattern("^Ford", 0))
+        self.assertFalse(reader.set_filters(["a|b"], [], 0))
+        reader.close()
+
+    def test_used_only_for_a_rare_required_term(self):
+        self.rows[150][0] = "Lada"
+        reader = MmapCsvReader(self.write_file(), csv.excel, "utf-8")
+        self.assertTrue(reader.set_filters(["Lada"], [], 0))
+        self.assertFalse(reader.set_filters(["Ford"], [], 0))  # In too many rows to be worth skipping to
+        self.assertFalse(reader.set_filters([], ["zzz"], 0))
+        reader.close()
+
+    def test_counts_the_fields_of_skipped_records(self):
+        self.rows[100] = ["GMC", "2001", "a,\"b\"\nc", "wide", "row"]
+        self.rows[200][0] = "Lada"
+        reader = MmapCsvReader(self.write_file(), csv.excel, "utf-8")
+        reader.exempt_records = 1
+        reader.count_skipped = True
+        reader.set_filters(["Lada"], [], 0)
+        self.assertEqual(2, len(list(reader.iter_records())))  # The header and the Lada row
+        self.assertEqual(5, reader.skipped.width)
+        reader.close()
+
+    def test_show_output_matches_text_reading(self):
+        self.rows[250] = ["Lada", "2005", "plain", "extra", "cells"]  # The rows that mmap skips count too
+        file_name = self.write_file("\r\n")
+
+        def run(args):
+            save_stdout = sys.stdout
+            sys.stdout = captured_output = io.StringIO()
+            try:
+                CsvShow().show([file_name, "-csv"] + args)
+            finally:
+                sys.stdout = save_stdout
+            return captured_output.getvalue()
+        save_can_read = MmapCsvReader.can_read
+        self.addCleanup(setattr, MmapCsvReader, "selective_share", MmapCsvReader.selective_share)
+        MmapCsvReader.selective_share = 1  # So mmap is used for any term
+        for args in [["-pregrep", "ford"], ["-pregrepv", "lines", "-grep", "19"], ["-pregrep!", "Make|GMC"],
+                     ["-grep", "Honda", "-columns", "Year", "-sort", "Year"], ["-lookup", "Notes", "Year=2001"],
+                     ["-select", "Make=Ford"], ["-select", "Notes=~ford", "Make=GMC"],
+                     ["-lookup", "Year", "Make=Honda"], ["-select", "Notes=with,comma"],
+                     ["-pregrep", "F.rd|Hond", "-pregrepv", "^G.C"]]:
+            with_mmap = run(args)
+            MmapCsvReader.can_read = staticmethod(lambda *args: False)
+            try:
+                self.assertEqual(run(args), with_mmap)
+            finally:
+                MmapCsvReader.can_read = save_can_read
+
+
+if __name__ == '__main__':
+    unittest.main()
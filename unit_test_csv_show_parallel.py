@@ -0,0 +1,87 @@
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+from csv_show import CsvShow
+from csv_show_parallel import *
+
+
+class ShowCSVParallelTests(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(8)
+        self.rows = [[rng.choice(["Ford", "Honda", "GMC"]), str(rng.randint(1990, 2020)),
+                      rng.choice(["plain", "with,comma", "two\nlines", "\"quoted\"", "end\n"])]
+                     for _ in range(2000)]
+        text = io.StringIO()
+        writer = csv.writer(text, lineterminator="\n")
+        writer.writerow(["Make", "Year", "Notes"])
+        writer.writerows(self.rows)
+        self.temp_file = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        self.temp_file.write(text.getvalue())
+        self.temp_file.close()
+        self.save_min_chunk_size = ParallelCsvReader.min_chunk_size
+        ParallelCsvReader.min_chunk_size = 1000
+
+    def tearDown(self):
+        ParallelCsvReader.min_chunk_size = self.save_min_chunk_size
+        os.remove(self.temp_file.name)
+
+    def test_chunks_end_on_record_boundaries(self):
+        reader = ParallelCsvReader(self.temp_file.name, csv.excel, 2)
+        self.assertEqual(["Make", "Year", "Notes"], reader.read_first_record())
+        ranges = reader.get_chunk_ranges(1000)
+        self.assertGreater(len(ranges), 10)
+        self.assertEqual(reader.data_start, ranges[0][0])
+        self.assertEqual(reader.file_size, ranges[-1][1])
+        chunk_rows = []
+        for start, end in ranges:
+            with open(self.temp_file.name, "rb") as file_handle:
+                file_handle.seek(start)
+                chunk_rows.extend(csv.reader(io.StringIO(file_handle.read(end - start).decode())))
+        self.assertEqual(self.rows, chunk_rows)
+
+    def test_filters_in_workers(self):
+        reader = ParallelCsvReader(self.temp_file.name, csv.excel, 2)
+        reader.read_first_record()
+        row_filter = RowFilter(["Make", "Year", "Notes"], pregrep=[("lines", False)],
+                               criteria=[["Year", ">=", "2010"]])
+        expected = [row for row in self.rows if "lines" not in " ".join(row) and int(row[1]) >= 2010]
+        self.assertEqual(expected, list(reader.read_rows(row_filter)))
+
+    def test_can_read(self):
+        self.assertTrue(ParallelCsvReader.can_read(self.temp_file.name, csv.excel, 2))
+        self.assertFalse(ParallelCsvReader.can_read(self.temp_file.name, csv.excel, 1))
+        self.assertFalse(ParallelCsvReader.can_read("-", csv.excel, 2))
+        self.assertFalse(ParallelCsvReader.can_read("cars.csv.gz", csv.excel, 2))
+
+    def test_jobs_output_matches_serial(self):
+        def run(args):
+            save_stdout = sys.stdout
+            sys.stdout = captured_output = io.StringIO()
+            try:
+                CsvShow().show([self.temp_file.name, "-csv"] + args)
+            finally:
+                sys.stdout = save_stdout
+            return captured_output.getvalue()
+        for args in [[], ["-select", "Make=Ford", "-pregrepv", "comma"], ["-pregrep!", "Make|GMC"],
+                     ["-sort", "Year", "-head", "5"], ["-select", "Make=GMC", "-columns", "Notes"],
+                     ["-lookup", "Notes", "Year=2001"]]:
+            self.assertEqual(run(args), run(args + ["-jobs", "3"]))
+
+    def test_rows_the_workers_drop_count_toward_the_columns(self):
+        with open(self.temp_file.name, "a") as file_handle:
+            file_handle.write("GMC,1999,plain,wide\n")
+        reader = ParallelCsvReader(self.temp_file.name, csv.excel, 2)
+        reader.read_first_record()
+        widest = WidestRow()
+        rows = list(reader.read_rows(RowFilter(["Make", "Year", "Notes"], criteria=[["Make", "=", "Ford"]]),
+                                     widest=widest))
+        self.assertEqual(4, widest.width)
+        self.assertEqual([row for row in self.rows if row[0] == "Ford"], rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
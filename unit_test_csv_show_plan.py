@@ -0,0 +1,106 @@
+import contextlib
+import io
+import os
+import unittest
+from csv_show import CsvShow
+from csv_show_plan import *
+
+
+# Runs the stages in memory, in the order make_plan lists them
+class UnoptimizedCsvShow(CsvShow):
+    def can_stream(self):
+        return False
+
+    def make_plan(self, streaming):
+        plan = super().make_plan(streaming)
+        plan.optimize = lambda: plan
+        return plan
+
+
+class ShowCSVPlanTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = os.path.dirname(__file__)
+        self.csv_file = self.dir + "/data/cars.csv"
+
+    def make_plan(self, args, show_class=CsvShow):
+        ui = show_class()
+        ui.make_arg_parser()
+        ui.parse_args([self.csv_file] + args.split())
+        return ui.make_plan(ui.can_stream()).optimize()
+
+    @staticmethod
+    def get_stage_names(plan):
+        return [" + ".join([stage.name] + [folded.name for folded in stage.folded]) for stage in plan.stages]
+
+    @staticmethod
+    def run_csv_show(args, show_class=CsvShow):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            show_class().show(args + ["-noless"])
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_filters_move_ahead_of_sort(self):
+        plan = self.make_plan("-sort Year -select Make=Ford -columns Model -grep o")
+        self.assertEqual(["scan + select", "grep", "sort", "project", "format"], self.get_stage_names(plan))
+        self.assertTrue(plan.find("grep").settings["on_shown_columns"])
+        plan = self.make_plan("-columns Model -grep o")
+        self.assertEqual(["scan", "project", "grep", "format"], self.get_stage_names(plan))
+        self.assertNotIn("on_shown_columns", plan.find("grep").settings)
+
+    def test_limits_fold_into_sort_and_scan(self):
+        self.assertEqual(["scan", "sort + limit", "project", "format"],
+                         self.get_stage_names(self.make_plan("-sort Year -columns Model -tail 2 -cache")))
+        self.assertEqual(["scan + pregrep + limit", "format"],
+                         self.get_stage_names(self.make_plan("-pregrep o -head 1")))
+        self.assertEqual(["scan", "limit", "format"], self.get_stage_names(self.make_plan("-head 2")))
+        # -lookup finds the first match in sorted order
+        self.assertEqual(["scan + select", "sort + limit", "lookup"],
+                         self.get_stage_names(self.make_plan("-sort Year -lookup Model Make=Ford")))
+        self.assertEqual(["scan + select + limit", "lookup"],
+                         self.get_stage_names(self.make_plan("-lookup Model Make=Ford")))
+        self.assertEqual(["scan", "sort", "lookup_batch"],
+                         self.get_stage_names(self.make_plan("-sort Year -lookup_batch -")))
+
+    def test_user_hook_keeps_the_order(self):
+        class UserShow(CsvShow):
+            def user_modify_db(self):
+                pass
+        plan = self.make_plan("-sort Year -select Make=Ford -grep o -head 2", UserShow)
+        self.assertEqual(["scan", "sort", "user_modify_db", "select", "grep", "limit", "format"],
+                         self.get_stage_names(plan))
+        self.assertEqual([], plan.notes)
+
+    def test_optimized_output_matches(self):
+        for args in ["-sort Year -select Make=Ford -columns Model -grep o", "-sort Make -reverse -grep 20 -tail 2",
+                     "-sort Year -lookup Model Year>2000", "-sort Make,Year -reverse -lookup Model Make=~^f",
+                     "-sort Year -columns Make -nocolumns Year -grepv ^f -head 3", "-pregrep o -head 1",
+                     "-sort Make -grep o -columnar", "-sort Year -select Year>=2000 -head 2"]:
+            for streaming_args in [[], ["-sort_memory", "1"]]:
+                args_list = [self.csv_file] + args.split() + streaming_args
+                unoptimized, optimized = self.run_csv_show(args_list, UnoptimizedCsvShow), self.run_csv_show(args_list)
+                if len(streaming_args) > 0:  # -sort_memory is not used in memory, which the warning says
+                    unoptimized, optimized = unoptimized[0], optimized[0]
+                self.assertEqual(unoptimized, optimized, args)
+
+    def test_explain(self):
+        stdout, stderr = self.run_csv_show([self.csv_file, "-sort", "Year", "-grep", "o", "-columns", "Model",
+                                            "-explain", "-csv"])
+        self.assertEqual(self.run_csv_show([self.csv_file, "-sort", "Year", "-grep", "o", "-columns", "Model",
+                                            "-csv"]), (stdout, ""))
+        lines = stderr.splitlines()
+        self.assertEqual("Query plan (in memory):", lines[0])
+        self.assertEqual(["scan", "grep", "sort", "project", "format"], [line.split()[0] for line in lines[2:7]])
+        self.assertEqual(["7", "5", "5", "5", "5"], [line.split()[1] for line in lines[2:7]])  # No "o" in Safari
+        self.assertIn("Note: grep moved ahead of sort", stderr)
+
+        stdout, stderr = self.run_csv_show([self.csv_file, "-select", "Make=Ford", "-grep", "o", "-head", "1",
+                                            "-explain"])
+        lines = stderr.splitlines()
+        self.assertEqual("Query plan (streaming):", lines[0])
+        self.assertEqual("scan + select 1", " ".join(lines[2].split()[:4]))  # -head 1 stopped the reading
+        self.assertEqual([["grep", "1"], ["limit", "1"], ["format", "1"]], [line.split()[:2] for line in lines[3:6]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import csv_show_client
+from csv_show import CsvShow
+from csv_show_server import *
+
+
+# The server runs in a thread of the test process, on a socket in a temporary directory
+class ShowCSVServerTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = os.path.dirname(os.path.abspath(__file__))
+        self.temp_dir = tempfile.mkdtemp()
+        self.csv_file = os.path.join(self.temp_dir, "cars.csv")
+        shutil.copy(self.dir + "/data/cars.csv", self.csv_file)
+        self.server = CsvShowServer(os.path.join(self.temp_dir, "csv_show.sock"))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir)
+
+    def run_client(self, args):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        exit_code = csv_show_client.run(args, self.server.socket_path, stdout, stderr)
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    @staticmethod
+    def run_csv_show(args):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            CsvShow().show(args + ["-noless"])
+        return output.getvalue()
+
+    def test_output_matches_csv_show(self):
+        for args in [[], ["-csv"], ["-sort", "Year", "-columns", "Make,Year"], ["-select", "Make=Ford", "-reverse"],
+                     ["-lookup", "Model", "Year=2015"], ["-pregrepv", "Ford", "-sort", "Make"],
+                     ["-grep", "GMC|Tesla", "-columnar"], ["-sep", "\t"]]:
+            expected = self.run_csv_show([self.csv_file] + args)
+            self.assertEqual((0, expected, ""), self.run_client([self.csv_file] + args))
+        # The sorts did not change the loaded table
+        self.assertEqual(self.run_csv_show([self.csv_file]), self.run_client([self.csv_file])[1])
+
+    def test_tables_are_loaded_once(self):
+        for year in ["2015", "2003", "1996"]:
+            self.run_client([self.csv_file, "-lookup", "Model", f"Year={year}"])
+        self.assertEqual(1, self.server.tables.loads)
+        self.run_client([self.csv_file, "-columnar"])
+        self.assertEqual(2, self.server.tables.loads)
+        # Relative names are found from the client's directory
+        save_cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        try:
+            self.assertEqual("Tesla\n", self.run_client(["cars.csv", "-lookup", "Make", "Year=2015"])[1])
+        finally:
+            os.chdir(save_cwd)
+        self.assertEqual(2, self.server.tables.loads)
+
+    def test_changed_file_is_loaded_again(self):
+        self.assertEqual("2015\n", self.run_client([self.csv_file, "-lookup", "Year", "Make=Tesla"])[1])
+        with open(self.csv_file, "a") as file_handle:
+            file_handle.write("\nVolvo,XC90,2020\n")
+        self.assertEqual("2020\n", self.run_client([self.csv_file, "-lookup", "Year", "Make=Volvo"])[1])
+        self.assertEqual(2, self.server.tables.loads)
+
+    def test_least_recently_used_tables_are_dropped(self):
+        other_csv_file = os.path.join(self.temp_dir, "other.csv")
+        shutil.copy(self.csv_file, other_csv_file)
+        self.run_client([self.csv_file])
+        self.server.tables.memory_budget = self.server.tables.memory_used
+        self.run_client([other_csv_file])
+        self.assertEqual(1, len(self.server.tables.tables))
+        self.run_client([self.csv_file])
+        self.assertEqual(3, self.server.tables.loads)
+
+    def test_errors(self):
+        exit_code, stdout, stderr = self.run_client([self.csv_file, "-columns", "Nope"])
+        self.assertEqual(1, exit_code)
+        self.assertIn("did not match a column name", stderr)
+        exit_code, stdout, stderr = self.run_client([self.csv_file, "-no_such_option"])
+        self.assertEqual(2, exit_code)
+        self.assertIn("unrecognized arguments", stderr)
+        self.assertEqual(2, self.run_client([self.csv_file, "-serve"])[0])
+        for args in [["-"], [self.csv_file, "-lookup_batch", "-"], ["-", "-pregrep!", "Make|Ford"]]:
+            exit_code, stdout, stderr = self.run_client(args)  # Would wait on the server's own STDIN
+            self.assertEqual(1, exit_code)
+            self.assertIn("The server cannot read STDIN", stderr)
+        # The server is still answering
+        self.assertEqual((0, "2015\n", ""), self.run_client([self.csv_file, "-lookup", "Year", "Make=Tesla"]))
+
+    def test_no_server(self):
+        exit_code = csv_show_client.run([self.csv_file], os.path.join(self.temp_dir, "none.sock"),
+                                        io.StringIO(), io.StringIO())
+        self.assertEqual(2, exit_code)
+
+    def test_socket_of_another_user(self):
+        save_getuid = csv_show_client.os.getuid
+        csv_show_client.os.getuid = lambda: save_getuid() + 1
+        try:
+            stderr = io.StringIO()
+            self.assertEqual(2, csv_show_client.run([self.csv_file], self.server.socket_path, io.StringIO(), stderr))
+            self.assertIn("belongs to another user", stderr.getvalue())
+        finally:
+            csv_show_client.os.getuid = save_getuid
+
+    def test_default_socket_path(self):
+        save_environ = dict(os.environ)
+        self.addCleanup(os.environ.update, save_environ)
+        os.environ.pop("CSV_SHOW_SOCKET", None)
+        os.environ.pop("XDG_RUNTIME_DIR", None)
+        socket_path = csv_show_client.get_default_socket_path()
+        self.assertEqual(f"/tmp/csv_show-{os.getuid()}", os.path.dirname(socket_path))  # Not shared with others
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,7 @@
+import csv
+import functools
+import io
+import re
 import unittest
 from csv_show_shared import *
 
@@ -29,6 +33,63 @@ class ShowCSVSharedFunctionsTests(unittest.TestCase):
         self.assertEqual(string_to_number("  10  "), 10)
         self.assertEqual(string_to_number("  44,60__0  "), 44600)
 
+    def test_string_is_number_negative_and_float(self):
+        self.assertEqual(string_to_number("-12"), -12)
+        self.assertEqual(string_to_number("+7"), 7)
+        self.assertEqual(string_to_number("1,000.25"), 1000.25)
+        self.assertEqual(string_to_number("-.5"), -0.5)
+        self.assertEqual(string_to_number("2e3"), 2000.0)
+        for not_a_number in ["-", ".", "1.2.3", "1e", "e5", "5 feet"]:
+            self.assertFalse(string_is_number(not_a_number), not_a_number)
+
+    def test_parse_number_matches_regexes(self):
+        for data in ["10", " -3 ", "+7", "1,000", "_5", ",", "1e3", "1.", ".5e-2", "5-3", "0x_e", "0xff", "'h1f",
+                     "15'SHbead", "Ford", "SN000001", "", " ", "١٢", "²", "-١", "1.2.3", "--1", "e5"]:
+            self.assertEqual(parse_number_with_regexes(data), parse_number(data), data)
+            self.assertIs(type(parse_number_with_regexes(data)), type(parse_number(data)), data)
+        parse_number.cache_clear()
+        for _ in range(3):
+            self.assertEqual(2001, parse_number("2001"))
+        self.assertEqual(2, parse_number.cache_info().hits)
+
+    def test_is_ascii(self):
+        self.assertEqual([True, True, False, False], [is_ascii(text) for text in ["Ford", "", "Škoda", "١٢"]])
+
+    def test_line_matcher_matches_re_search(self):
+        lines = ["Ford Explorer 2003", "ford f-150", "Tesla Model S 2015", "TESLA", "\u212a (Kelvin)", "Straße",
+                 "1.5$ each", "Ford", "", "Écrit"]
+        terms = ["Ford", "ford", "^Ford", "2003$", "Model S", r"1\.5\$", "k", "SS", "ß", "F.rd", "GMC|Tesla", "é"]
+        for regex_flags in [0, re.IGNORECASE]:
+            for regex in terms:
+                for positive_match in [True, False]:
+                    for regex_list in [regex, (regex, positive_match), [(regex, positive_match), ("o", True)]]:
+                        expected = [line for line in lines if all(
+                            (re.search(term, line, regex_flags) is not None) == positive
+                            for term, positive in ensure_regex_list(regex_list))]
+                        line_matches = make_line_matcher(regex_list, regex_flags)
+                        self.assertEqual(expected, [line for line in lines if line_matches(line)],
+                                         (regex_list, regex_flags))
+
+    def test_raw_grep_matches_csv_reader(self):
+        text = ('Make,Model,Year\nFord,Explorer,2003\n\nFord,"Model ""T""",1908\nTesla,"Model\nS, Ford",2015\n'
+                'Honda,5\'11",2007\nFord,"Accord\n"x,"1\n2"\nGMC,Safari,"2002')
+        space_dialect = type("SpaceDialect", (csv.excel,), {"delimiter": " ", "skipinitialspace": True})
+        quote_none_dialect = type("QuoteNoneDialect", (csv.excel,), {"quoting": csv.QUOTE_NONE})
+        for dialect in [csv.excel, csv.excel_tab, space_dialect, quote_none_dialect]:
+            for regex_list in ["Ford", "ford", "d,E", "d E", "^Ford Explorer", "2003$", "S Ford", "^$", "T",
+                               [("Model", True), ("Ford", False)], ("\n", True)]:
+                expected = list(iter_grep_rows(csv.reader(io.StringIO(text), dialect), regex_list, re.IGNORECASE))
+                for block_size in [1, 2, 3, 1024]:  # Quoted fields going on past the end of a block
+                    rows = iter_raw_grep_rows(io.StringIO(text), dialect, regex_list, re.IGNORECASE, block_size)
+                    self.assertEqual(expected, list(rows), (dialect, regex_list, block_size))
+
+    def test_unanchored_literal(self):
+        self.assertEqual("Ford", get_unanchored_literal("Ford", 0))
+        self.assertEqual("Ford", get_unanchored_literal("Ford", re.IGNORECASE))
+        self.assertEqual("é", get_unanchored_literal("é", 0))
+        for regex, regex_flags in [("^Ford", 0), ("Ford$", 0), ("é", re.IGNORECASE), ("Fo rd", re.VERBOSE)]:
+            self.assertIsNone(get_unanchored_literal(regex, regex_flags), regex)
+
     def test_row_comparable(self):
         row1 = RowComparable(["Car", "3", "Red"], [1], detect_numbers=False)
         row2 = RowComparable(["Truck", "20", "White"], [1], detect_numbers=False)
@@ -64,6 +125,36 @@ class ShowCSVSharedFunctionsTests(unittest.TestCase):
         row2.sort_keys = [0, 2, 1]
         self.assertTrue(row1 > row2)
 
+    def test_row_sort_key(self):
+        rows = [["Car", "3", "Red"], ["Truck", "20", "White"], ["Car", "0x2", "Blue"], ["Bike", "n/a", "Red"]]
+        self.assertEqual([rows[2], rows[0], rows[1], rows[3]], sorted(rows, key=make_row_sort_key([1])))
+        self.assertEqual([rows[2], rows[1], rows[0], rows[3]],
+                         sorted(rows, key=make_row_sort_key([1], detect_numbers=False)))
+        self.assertEqual([rows[3], rows[2], rows[0], rows[1]], sorted(rows, key=make_row_sort_key([0, 2])))
+        # Same order as RowComparable
+        for sort_keys in [[0], [1], [2, 1], [0, 2, 1]]:
+            self.assertEqual(sorted(rows, key=lambda row: RowComparable(row, sort_keys)),
+                             sorted(rows, key=make_row_sort_key(sort_keys)))
+
+    def test_cell_sort_key_mixes_numbers_and_text(self):
+        cells = ["10", "9", "1a", "", "0x0a", "N/A", "-", "-1"]
+        self.assertEqual(["", "-", "-1", "9", "10", "0x0a", "1a", "N/A"], sorted(cells, key=cell_sort_key))
+
+        def compare(lhs, rhs):  # How cells were compared before the sort keys: numbers by value, else as text
+            if string_is_number(lhs) and string_is_number(rhs):
+                lhs, rhs = string_to_number(lhs), string_to_number(rhs)
+            return (lhs > rhs) - (lhs < rhs)
+        cells = ["7", "", "N/A", "-", "12", "unknown", "3.5", "", "n/a"]
+        self.assertEqual(sorted(cells, key=functools.cmp_to_key(compare)), sorted(cells, key=cell_sort_key))
+
+    def test_regex_literal(self):
+        self.assertEqual("Ford", get_regex_literal("Ford"))
+        self.assertEqual("Ford", get_regex_literal("^Ford$"))
+        self.assertEqual("Model S", get_regex_literal("Model S"))
+        self.assertEqual("1.5$", get_regex_literal(r"1\.5\$"))
+        for regex in ["Fo.d", "Ford|GMC", r"\d+", "[A-Z]", "^$", "Ford\\", "(Ford)"]:
+            self.assertIsNone(get_regex_literal(regex), regex)
+
 
 if __name__ == '__main__':
     unittest.main()